@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+准入控制
+限制同时运行的执行数量，超出时进入有界等待队列，队列满或等待超时则拒绝请求
+"""
+
+import asyncio
+import collections
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """一次被准入的执行"""
+
+    def __init__(self, client_id: str, wait_time: float):
+        self.client_id = client_id
+        self.wait_time = wait_time
+        self.admitted_at = time.monotonic()
+        self.released = False
+
+
+class _Waiter:
+    """等待队列中的一个请求"""
+
+    def __init__(self, client_id: str, wake: Optional[Callable[[], None]] = None):
+        self.client_id = client_id
+        # 异步等待者的唤醒回调（线程安全）
+        self.wake = wake
+
+
+def default_max_in_flight(max_memory_mb: int) -> int:
+    """按CPU核数和物理内存估算可同时运行的执行数量"""
+    cpu_count = os.cpu_count() or 1
+    try:
+        total_memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 1024 // 1024
+    except (ValueError, OSError, AttributeError):
+        return cpu_count
+    return max(1, min(cpu_count, total_memory_mb // max(1, max_memory_mb)))
+
+
+class ConcurrencyGovernor:
+    """并发执行调度器
+
+    - 同时运行的执行数不超过max_in_flight
+    - 超出时按到达顺序排队，队列长度不超过max_queue，等待超过queue_timeout秒则拒绝
+    - per_client_limit大于0时，单个客户端同时运行和排队的执行数都不超过该值
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int = 50, queue_timeout: float = 10.0,
+                 per_client_limit: int = 0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_client_limit = per_client_limit
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._client_in_flight: Dict[str, int] = collections.Counter()
+        self._waiters = collections.deque()
+
+        # 统计信息
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self._wait_times = collections.deque(maxlen=1000)
+        self._service_times = collections.deque(maxlen=1000)
+
+    def _client_waiting(self, client_id: str) -> int:
+        return sum(1 for waiter in self._waiters if waiter.client_id == client_id)
+
+    def _can_run(self, client_id: str) -> bool:
+        if self._in_flight >= self.max_in_flight:
+            return False
+        if self.per_client_limit and self._client_in_flight[client_id] >= self.per_client_limit:
+            return False
+        return True
+
+    def _is_next(self, waiter) -> bool:
+        """waiter是否为队列中第一个可以运行的等待者（跳过已达到客户端上限的等待者）"""
+        for candidate in self._waiters:
+            if self._can_run(candidate.client_id):
+                return candidate is waiter
+        return False
+
+    def _retry_after(self) -> int:
+        """按平均执行耗时估算客户端应等待的秒数"""
+        if self._service_times:
+            average = sum(self._service_times) / len(self._service_times)
+        else:
+            average = 1.0
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(average * backlog / self.max_in_flight))
+
+    def _notify(self):
+        """唤醒所有等待者重新检查（调用方持有锁）"""
+        self._condition.notify_all()
+        for waiter in self._waiters:
+            if waiter.wake is not None:
+                waiter.wake()
+
+    def _check_queue(self, client_id: str):
+        """队列已满时拒绝（调用方持有锁）"""
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(429, "执行队列已满，请稍后重试", self._retry_after())
+        if self.per_client_limit and self._client_waiting(client_id) >= self.per_client_limit:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(429, "该客户端排队的执行过多，请稍后重试", self._retry_after())
+
+    def acquire(self, client_id: Optional[str] = None) -> AdmissionTicket:
+        """申请执行名额，被拒绝时抛出AdmissionRejected"""
+        client_id = client_id or "anonymous"
+        start = time.monotonic()
+
+        with self._condition:
+            if not self._waiters and self._can_run(client_id):
+                return self._admit(client_id, start)
+
+            self._check_queue(client_id)
+            waiter = _Waiter(client_id)
+            self._waiters.append(waiter)
+            deadline = start + self.queue_timeout
+            try:
+                while not (self._is_next(waiter) and self._can_run(client_id)):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_timeout += 1
+                        raise AdmissionRejected(503, "服务繁忙，等待执行超时", self._retry_after())
+                    self._condition.wait(remaining)
+            finally:
+                self._waiters.remove(waiter)
+                # 队列变化可能使其他等待者满足条件
+                self._notify()
+
+            return self._admit(client_id, start)
+
+    async def acquire_async(self, client_id: Optional[str] = None) -> AdmissionTicket:
+        """acquire的协程版本，排队时不阻塞事件循环，与同步调用方共用同一队列"""
+        client_id = client_id or "anonymous"
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+
+        with self._condition:
+            if not self._waiters and self._can_run(client_id):
+                return self._admit(client_id, start)
+            self._check_queue(client_id)
+            waiter = _Waiter(client_id, lambda: loop.call_soon_threadsafe(wakeup.set))
+            self._waiters.append(waiter)
+
+        deadline = start + self.queue_timeout
+        queued = True
+        try:
+            while True:
+                with self._condition:
+                    if self._is_next(waiter) and self._can_run(client_id):
+                        self._waiters.remove(waiter)
+                        queued = False
+                        self._notify()
+                        return self._admit(client_id, start)
+                    wakeup.clear()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_timeout += 1
+                        raise AdmissionRejected(503, "服务繁忙，等待执行超时", self._retry_after())
+                try:
+                    await asyncio.wait_for(wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if queued:
+                with self._condition:
+                    self._waiters.remove(waiter)
+                    self._notify()
+
+    def try_acquire(self, client_id: Optional[str] = None) -> Optional[AdmissionTicket]:
+        """有空闲名额且没有请求排队时立即准入，否则返回None（不排队）"""
+        client_id = client_id or "anonymous"
+        with self._condition:
+            if not self._waiters and self._can_run(client_id):
+                return self._admit(client_id, time.monotonic())
+            return None
+
+    def _admit(self, client_id: str, start: float) -> AdmissionTicket:
+        """记录准入（调用方持有锁）"""
+        self._in_flight += 1
+        self._client_in_flight[client_id] += 1
+        self.admitted += 1
+        wait_time = time.monotonic() - start
+        self._wait_times.append(wait_time)
+        return AdmissionTicket(client_id, wait_time)
+
+    def release(self, ticket: AdmissionTicket):
+        """释放执行名额（可重复调用）"""
+        with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._in_flight -= 1
+            self._client_in_flight[ticket.client_id] -= 1
+            if self._client_in_flight[ticket.client_id] <= 0:
+                del self._client_in_flight[ticket.client_id]
+            self._service_times.append(time.monotonic() - ticket.admitted_at)
+            self._notify()
+
+    @contextmanager
+    def slot(self, client_id: Optional[str] = None) -> Iterator[AdmissionTicket]:
+        """申请执行名额的上下文管理器"""
+        ticket = self.acquire(client_id)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict:
+        """准入控制状态"""
+        with self._condition:
+            wait_times = sorted(self._wait_times)
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queue_depth": len(self._waiters),
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "per_client_limit": self.per_client_limit,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_timeout": self.rejected_timeout,
+                "avg_wait_time": round(sum(wait_times) / len(wait_times), 4) if wait_times else 0.0,
+                "p95_wait_time": round(wait_times[int(len(wait_times) * 0.95)], 4) if wait_times else 0.0,
+                "max_wait_time": round(wait_times[-1], 4) if wait_times else 0.0
+            }
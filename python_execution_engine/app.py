@@ -10,16 +10,46 @@ import json
 import subprocess
 import tempfile
 import shutil
-import re
 import time
 import signal
 import threading
 import uuid
+import queue
+import atexit
+import mimetypes
+import concurrent.futures
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from flask import Flask, request, jsonify
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 import logging
+import sqlite3
+
+from worker_pool import WarmWorkerPool, RUNNER_SCRIPT
+from zygote import ZygoteServer, ZygoteProcess
+from packages import (
+    InstalledPackageIndex, InstallCoordinator, VenvCache, DistributionResolver,
+    normalize_distribution_name
+)
+from code_analysis import CodeSafetyAnalyzer, code_hash, extract_imports
+from coalescing import InFlightCoalescer
+from process_io import iter_output, make_decoder, close_pipes
+from jobs import JobManager
+from batch import SharedDependencies
+from metrics import ExecutionMetrics, Timeline
+from traffic import TrafficRecorder
+from registry import ExecutionRegistry
+from outputs import OutputCapture, OutputStore, STREAMS
+from artifacts import ArtifactStore
+from result_cache import ResultCache, CACHE_ALLOW, CACHE_BYPASS, CACHE_MODES, cache_key
+from sandbox_runner import ARTIFACTS_DIRNAME
+from sessions import Session, SessionManager, SessionLimitExceeded, SessionBusy
+from judge import JudgeWorker, case_verdict, preview, ACCEPTED, COMPILE_ERROR, SYSTEM_ERROR
+from admission import (
+    ConcurrencyGovernor, AdmissionRejected, AdmissionTicket, default_max_in_flight
+)
+from limits import ResourceLimits, CgroupV2Manager, MeteredPopen, usage_summary
+from sandbox_pool import SandboxPool, default_sandbox_root
 
 # 设置matplotlib配置目录为可写目录
 mpl_config_dir = "/tmp/mpl_config"
@@ -47,10 +77,135 @@ class PythonExecutionEngine:
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(exist_ok=True)
         self.max_execution_time = 30  # 最大执行时间（秒）
-        self.max_memory_mb = 512      # 最大内存使用（MB）
+        self.max_memory_mb = int(os.environ.get('MAX_MEMORY_MB', 512))  # 最大内存使用（MB）
+        
+        # 子进程资源限制：内存（地址空间）、CPU时间、进程数和单个文件大小
+        self.resource_limits = ResourceLimits(
+            memory_mb=self.max_memory_mb,
+            cpu_seconds=int(os.environ.get('MAX_CPU_TIME', self.max_execution_time)),
+            max_processes=int(os.environ.get('MAX_PROCESSES', 256)),
+            max_file_size_mb=int(os.environ.get('MAX_FILE_SIZE_MB', 64))
+        )
+        # 配置了委派的cgroup v2目录时，内存和进程数改由cgroup按进程树限制
+        self.cgroups = CgroupV2Manager(os.environ.get('CGROUP_PARENT', ''), self.resource_limits)
+        
+        # 运行指标（/metrics）
+        self.metrics = ExecutionMetrics()
+        # 耗时超过阈值（秒）的请求把Chrome trace写入TRACE_DIR，为空时不保存
+        self.trace_dir = os.environ.get('TRACE_DIR', '')
+        self.trace_slow_seconds = float(os.environ.get('TRACE_SLOW_SECONDS', 5))
+        
+        # 准入控制：限制同时运行的执行数，超出时排队，队列满或等待超时返回429/503
+        max_in_flight = int(os.environ.get('MAX_CONCURRENT_EXECUTIONS', 0))
+        self.admission = ConcurrencyGovernor(
+            max_in_flight or default_max_in_flight(self.max_memory_mb),
+            max_queue=int(os.environ.get('EXECUTION_QUEUE_SIZE', 50)),
+            queue_timeout=float(os.environ.get('EXECUTION_QUEUE_TIMEOUT', 10)),
+            per_client_limit=int(os.environ.get('PER_CLIENT_LIMIT', 0))
+        )
+        
+        # 沙箱工作目录池：在内存文件系统上预先创建，执行结束后异步清空复用
+        sandbox_root = os.environ.get('SANDBOX_ROOT')
+        self.sandbox_pool = SandboxPool(
+            Path(sandbox_root) if sandbox_root else default_sandbox_root(self.base_dir),
+            # 目录在后台清空期间不可用，默认保留并发上限两倍的目录
+            size=int(os.environ.get('SANDBOX_POOL_SIZE', 0)) or self.admission.max_in_flight * 2,
+            quota_mb=int(os.environ.get('SANDBOX_QUOTA_MB', 64))
+        )
+        self.sandbox_pool.start()
+        atexit.register(self.sandbox_pool.shutdown)
+        
+        # 执行后端: subprocess（每次启动新解释器）、pool（预热进程池）或 zygote（预加载fork服务）
+        self.execution_backend = os.environ.get('EXECUTION_BACKEND', 'subprocess')
+        self.worker_pool_size = int(os.environ.get('WORKER_POOL_SIZE', 4))
+        self.worker_pool = None
+        if self.execution_backend == 'pool':
+            self.worker_pool = WarmWorkerPool(
+                self.worker_pool_size,
+                cwd=str(self.base_dir),
+                popen_kwargs=lambda: {"preexec_fn": self.resource_limits.preexec_fn()}
+            )
+            self.worker_pool.start()
+            atexit.register(self.worker_pool.shutdown)
+        
+        # zygote预加载的重量级模块
+        self.zygote_preload = [
+            name.strip()
+            for name in os.environ.get('ZYGOTE_PRELOAD', 'numpy,pandas,matplotlib').split(',')
+            if name.strip()
+        ]
+        self.zygote = None
+        if self.execution_backend == 'zygote':
+            socket_path = self.base_dir / f"zygote-{os.getpid()}.sock"
+            self.zygote = ZygoteServer(str(socket_path), self.zygote_preload, self.resource_limits)
+            self.zygote.start()
+            atexit.register(self.zygote.shutdown)
         
         # 存储正在执行的进程
         self.running_processes = {}
+        # 被/stop停止、尚未由执行线程处理的执行ID
+        self._stopped_executions: Set[str] = set()
+        
+        # 执行输出：超过内存上限的部分溢出到OUTPUT_DIR，通过 /executions/<id>/output 按字节范围读取
+        self.output_store = OutputStore(
+            Path(os.environ.get('OUTPUT_DIR') or self.base_dir / "outputs"),
+            memory_limit=int(os.environ.get('OUTPUT_MEMORY_LIMIT_KB', 1024)) * 1024,
+            preview_bytes=int(os.environ.get('OUTPUT_PREVIEW_KB', 16)) * 1024,
+            retention=float(os.environ.get('OUTPUT_RETENTION', 3600)),
+            max_bytes=int(os.environ.get('OUTPUT_MAX_MB', 256)) * 1024 * 1024
+        )
+        
+        # 执行产物：沙箱artifacts目录中的文件和打开的matplotlib图像按内容哈希保存，响应中只返回下载地址
+        self.artifact_store = ArtifactStore(
+            Path(os.environ.get('ARTIFACT_DIR') or self.base_dir / "artifacts"),
+            budget_bytes=int(os.environ.get('ARTIFACT_STORE_MB', 512)) * 1024 * 1024,
+            max_files=int(os.environ.get('ARTIFACT_MAX_FILES', 20))
+        )
+        
+        # 进行中请求合并：同一客户端相同的无副作用代码正在执行时共享其结果，COALESCE_EXECUTIONS为true时开启
+        self.coalescer = None
+        if os.environ.get('COALESCE_EXECUTIONS', 'false').lower() == 'true':
+            self.coalescer = InFlightCoalescer()
+        
+        # 执行结果缓存：客户端传入cache="allow"时复用相同代码的成功结果，RESULT_CACHE_MB为0时关闭
+        self.result_cache = None
+        result_cache_mb = int(os.environ.get('RESULT_CACHE_MB', 64))
+        if result_cache_mb > 0:
+            self.result_cache = ResultCache(
+                Path(os.environ.get('RESULT_CACHE_DIR') or self.base_dir / "result-cache"),
+                memory_bytes=result_cache_mb * 1024 * 1024,
+                disk_bytes=int(os.environ.get('RESULT_CACHE_DISK_MB', 512)) * 1024 * 1024,
+                ttl=float(os.environ.get('RESULT_CACHE_TTL', 3600))
+            )
+        
+        # 有状态会话：常驻解释器在调用之间保留全局变量；内存按会话限制，CPU时间随会话累计，不设rlimit
+        self.session_limits = ResourceLimits(
+            memory_mb=int(os.environ.get('SESSION_MAX_MEMORY_MB', self.max_memory_mb)),
+            max_processes=self.resource_limits.max_processes,
+            max_file_size_mb=self.resource_limits.max_file_size_mb
+        )
+        self.sessions = SessionManager(
+            self.base_dir / f"sessions-{os.getpid()}",
+            self.session_limits,
+            cgroup_parent=os.environ.get('CGROUP_PARENT', ''),
+            max_sessions=int(os.environ.get('MAX_SESSIONS', 20)),
+            idle_ttl=float(os.environ.get('SESSION_IDLE_TTL', 1800)),
+            output_store=self.output_store
+        )
+        atexit.register(self.sessions.shutdown)
+        
+        # 跨worker的执行登记表（SQLite WAL），多worker部署时任一worker都能列出和停止执行；
+        # EXECUTION_REGISTRY设为空时只在本进程内记录
+        self.registry = None
+        registry_path = os.environ.get('EXECUTION_REGISTRY', str(self.base_dir / "executions.db"))
+        if registry_path:
+            try:
+                self.registry = ExecutionRegistry(
+                    registry_path,
+                    retention=float(os.environ.get('EXECUTION_REGISTRY_RETENTION', 300))
+                )
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"执行登记表不可用，只记录本worker的执行: {e}")
         
         # 允许的包列表（安全考虑）
         self.allowed_packages = {
@@ -67,74 +222,150 @@ class PythonExecutionEngine:
             're', 'string', 'time', 'datetime', 'calendar', 'locale'
         }
         
-        # 危险函数和模块黑名单
-        self.dangerous_patterns = [
-            r'__import__\s*\(',
-            r'exec\s*\(',
-            r'eval\s*\(',
-            r'compile\s*\(',
-            r'open\s*\([^)]*[\'"]w[\'"]',
-            r'file\s*\(',
-            r'input\s*\(',
-            r'raw_input\s*\(',
-            r'os\.system',
-            r'subprocess\.[a-zA-Z_]+',
-            r'import\s+os\s*$',
-            r'from\s+os\s+import',
-            r'import\s+subprocess',
-            r'from\s+subprocess\s+import',
-            r'import\s+sys\s*$',
-            r'from\s+sys\s+import',
-            r'import\s+shutil',
-            r'from\s+shutil\s+import',
-        ]
-    
-    def _check_code_safety(self, code: str) -> Tuple[bool, str]:
-        """检查代码安全性"""
-        # 检查危险模式
-        for pattern in self.dangerous_patterns:
-            if re.search(pattern, code, re.IGNORECASE | re.MULTILINE):
-                return False, f"检测到危险代码模式: {pattern}"
+        self._allowed_distributions = {
+            normalize_distribution_name(pkg) for pkg in self.allowed_packages
+        }
         
-        # 检查文件操作
-        if re.search(r'open\s*\(', code) and not re.search(r'open\s*\([^)]*[\'"]r[\'"]', code):
-            return False, "不允许写入文件操作"
+        # 已安装包索引，已可导入的模块不再调用pip
+        self.package_index = InstalledPackageIndex()
+        # 模块名到发行包名的映射（如 sklearn -> scikit-learn）
+        self.distribution_resolver = DistributionResolver()
         
-        return True, "代码安全检查通过"
-    
-    def _extract_imports(self, code: str) -> List[str]:
-        """提取代码中的import语句"""
-        imports = []
+        # 包安装协调器：合并并发安装请求，串行执行pip
+        self.install_timeout = 60
+        self.install_coordinator = InstallCoordinator(
+            self._run_pip_install,
+            batch_window=float(os.environ.get('INSTALL_BATCH_WINDOW', 0.05))
+        )
         
-        # 匹配 import 语句
-        import_pattern = r'import\s+([a-zA-Z_][a-zA-Z0-9_]*(?:\.[a-zA-Z_][a-zA-Z0-9_]*)*)'
-        from_pattern = r'from\s+([a-zA-Z_][a-zA-Z0-9_]*(?:\.[a-zA-Z_][a-zA-Z0-9_]*)*)\s+import'
+        # 依赖环境模式: global（安装到服务解释器）或 venv（按依赖集合缓存虚拟环境）
+        self.package_env_mode = os.environ.get('PACKAGE_ENV_MODE', 'global')
+        self.venv_cache = None
+        if self.package_env_mode == 'venv':
+            self.venv_cache = VenvCache(
+                self.base_dir / "venvs",
+                self._run_pip_install,
+                max_disk_mb=int(os.environ.get('VENV_CACHE_MAX_MB', 2048))
+            )
         
-        for match in re.finditer(import_pattern, code):
-            module = match.group(1).split('.')[0]  # 只取主模块名
-            imports.append(module)
+        # 危险函数、模块和属性黑名单
+        self.dangerous_calls = {
+            '__import__', 'exec', 'eval', 'compile', 'file', 'input', 'raw_input',
+        }
+        # builtins和importlib可以绕过名称检查取得__import__、exec或任意模块
+        self.dangerous_modules = {'os', 'subprocess', 'sys', 'shutil', 'builtins', 'importlib'}
+        self.dangerous_attributes = {
+            'os.system', 'subprocess.*',
+            '__builtins__', '__globals__', '__subclasses__', '__code__',
+        }
         
-        for match in re.finditer(from_pattern, code):
-            module = match.group(1).split('.')[0]  # 只取主模块名
-            imports.append(module)
+        # 基于AST的安全分析器，结果按代码哈希缓存
+        self.safety_analyzer = CodeSafetyAnalyzer(
+            self.dangerous_calls,
+            self.dangerous_modules,
+            self.dangerous_attributes,
+            cache_size=int(os.environ.get('SAFETY_CACHE_SIZE', 1024))
+        )
+        # 判题模式需要从标准输入读取用例，允许调用input()
+        self.judge_safety_analyzer = CodeSafetyAnalyzer(
+            self.dangerous_calls - {'input', 'raw_input'},
+            self.dangerous_modules,
+            self.dangerous_attributes,
+            cache_size=int(os.environ.get('SAFETY_CACHE_SIZE', 1024))
+        )
         
-        return list(set(imports))  # 去重
+        # 判题模式: 每次提交最多使用的判题进程数和默认的单用例时间限制（秒）
+        self.judge_workers = int(os.environ.get('JUDGE_WORKERS', 2))
+        self.judge_time_limit = float(os.environ.get('JUDGE_TIME_LIMIT', 2))
+    
+    def _check_code_safety(self, code: str) -> Tuple[bool, str]:
+        """检查代码安全性（语法错误同样在此处直接返回，无需启动子进程）"""
+        report = self.safety_analyzer.analyze(code)
+        return report.is_safe, report.message
+    
+    def _extract_imports(self, code: str) -> List[str]:
+        """从AST中提取代码导入的顶层模块（复用安全检查的缓存结果）"""
+        report = self.safety_analyzer.analyze(code)
+        if report.is_safe:
+            return list(report.imports)
+        return extract_imports(code)
+    
+    def _resolve_requirements(self, imports: List[str]) -> List[str]:
+        """把导入的模块映射为需要安装的发行包
+
+        跳过标准库和已可导入的模块，只保留在允许列表中的包。
+        """
+        requirements = []
+        for module in imports:
+            if self.package_index.is_satisfied(module):
+                continue
+            distribution = self.distribution_resolver.resolve(module)
+            allowed = (
+                module in self.allowed_packages
+                or normalize_distribution_name(distribution) in self._allowed_distributions
+            )
+            if allowed and distribution not in requirements:
+                requirements.append(distribution)
+        return requirements
     
     def _install_packages(self, packages: List[str], work_dir: Path) -> Tuple[bool, str]:
         """安装Python包"""
         if not packages:
             return True, "无需安装包"
         
-        # 过滤允许的包
-        allowed_packages = [pkg for pkg in packages if pkg in self.allowed_packages]
-        if not allowed_packages:
-            return True, "所有包都在允许列表中"
+        # 映射到发行包，跳过标准库、已安装和不在允许列表中的包
+        requirements = self._resolve_requirements(packages)
+        if not requirements:
+            self.metrics.install_cache_hits.inc()
+            return True, "所有依赖已安装"
+        self.metrics.install_cache_misses.inc()
+        
+        # 由安装协调器合并并发请求，等待pip执行完成
+        return self.install_coordinator.install(requirements)
+    
+    def _prepare_venv(self, packages: List[str]) -> Tuple[bool, str, Optional[str]]:
+        """获取满足依赖的缓存虚拟环境，返回 (是否成功, 消息, 解释器路径)
+
+        依赖全部已在服务解释器中可用时返回的解释器路径为None。
+        """
+        requirements = self._resolve_requirements(packages)
+        if not requirements:
+            self.metrics.install_cache_hits.inc()
+            return True, "所有依赖已安装", None
+        
+        self.metrics.install_cache_misses.inc()
+        return self.venv_cache.acquire(requirements)
+    
+    def _prepare_dependencies(self, imports: List[str], work_dir: Path) -> Tuple[bool, str, Optional[str]]:
+        """按依赖环境模式准备依赖，返回 (是否成功, 消息, 解释器路径)"""
+        python_executable = None
+        if self.venv_cache is not None:
+            install_success, install_msg, python_executable = self._prepare_venv(imports)
+        else:
+            install_success, install_msg = self._install_packages(imports, work_dir)
+        if not install_success:
+            logger.warning(f"包安装失败: {install_msg}")
+            # 继续执行，可能包已经安装
+        return install_success, install_msg, python_executable
+    
+    def _run_pip_install(self, packages: List[str], python_executable: str = None) -> Tuple[bool, str]:
+        """调用pip安装一批包
+
+        python_executable为空时安装到全局环境（由安装协调器串行调用），
+        否则安装到指定的缓存虚拟环境。
+        """
+        if python_executable is None:
+            # 等待期间可能已被其他批次安装
+            packages = self.package_index.missing(packages)
+            if not packages:
+                return True, "所有依赖已安装"
         
+        work_dir = Path(tempfile.mkdtemp(dir=self.base_dir))
         try:
             # 创建requirements.txt
             requirements_file = work_dir / "requirements.txt"
             with open(requirements_file, 'w') as f:
-                for pkg in allowed_packages:
+                for pkg in packages:
                     f.write(f"{pkg}\n")
             
             # 设置pip缓存目录为可写目录
@@ -142,6 +373,25 @@ class PythonExecutionEngine:
             os.makedirs(pip_cache_dir, exist_ok=True)
             os.chmod(pip_cache_dir, 0o777)
             
+            # 安装到缓存虚拟环境 - 环境目录归服务所有，无需root权限
+            if python_executable is not None:
+                cmd = [
+                    sys.executable, "-m", "pip", "--python", python_executable,
+                    "install", "-r", str(requirements_file),
+                    "--quiet", "--disable-pip-version-check",
+                    "--cache-dir", pip_cache_dir
+                ]
+                result = subprocess.run(
+                    cmd,
+                    capture_output=True,
+                    text=True,
+                    timeout=self.install_timeout,
+                    cwd=str(work_dir)
+                )
+                if result.returncode == 0:
+                    return True, f"成功安装包: {', '.join(packages)}"
+                return False, f"安装包失败: {result.stderr}"
+            
             # 安装包 - 使用root权限和可写缓存目录
             cmd = [
                 "sudo", sys.executable, "-m", "pip", "install", 
@@ -155,12 +405,13 @@ class PythonExecutionEngine:
                 cmd, 
                 capture_output=True, 
                 text=True, 
-                timeout=60,
+                timeout=self.install_timeout,
                 cwd=str(work_dir)
             )
             
             if result.returncode == 0:
-                return True, f"成功安装包: {', '.join(allowed_packages)}"
+                self.package_index.refresh()
+                return True, f"成功安装包: {', '.join(packages)}"
             else:
                 # 如果sudo失败，尝试不使用sudo
                 logger.warning(f"sudo安装失败，尝试普通安装: {result.stderr}")
@@ -176,12 +427,13 @@ class PythonExecutionEngine:
                     cmd_no_sudo, 
                     capture_output=True, 
                     text=True, 
-                    timeout=60,
+                    timeout=self.install_timeout,
                     cwd=str(work_dir)
                 )
                 
                 if result_no_sudo.returncode == 0:
-                    return True, f"成功安装包: {', '.join(allowed_packages)}"
+                    self.package_index.refresh()
+                    return True, f"成功安装包: {', '.join(packages)}"
                 else:
                     return False, f"安装包失败: {result_no_sudo.stderr}"
                 
@@ -189,137 +441,1130 @@ class PythonExecutionEngine:
             return False, "包安装超时"
         except Exception as e:
             return False, f"安装包时出错: {str(e)}"
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
     
-    def _execute_code(self, code: str, work_dir: Path, execution_id: str = None) -> Tuple[bool, str, str]:
-        """执行Python代码"""
+    def _start_process(self, script_file: Path, work_dir: Path,
+                       python_executable: str = None) -> subprocess.Popen:
+        """按执行后端启动运行脚本的子进程
+
+        指定python_executable（缓存虚拟环境）时直接用该解释器启动。
+        """
+        if python_executable is None and self.zygote is not None:
+            # 由zygote fork出已预加载模块的子进程
+            return self.zygote.spawn(script_file, work_dir)
+        
+        if python_executable is None and self.worker_pool is not None:
+            # 从预热进程池取出worker并派发任务
+            worker = self.worker_pool.acquire()
+            self.worker_pool.dispatch(worker, script_file, work_dir)
+            return worker
+        
+        # 使用Popen启动进程，以便可以管理；由sandbox_runner运行脚本，结束时保存打开的图像
+        # -u：输出到管道时不缓冲，流式执行才能实时收到输出
+        cmd = [python_executable or sys.executable, "-u", str(RUNNER_SCRIPT), str(script_file)]
+        cgroup = self.cgroups.create(work_dir.name)
         try:
-            # 创建执行脚本
-            script_file = work_dir / "main.py"
-            with open(script_file, 'w', encoding='utf-8') as f:
-                f.write(code)
-            
-            # 执行代码
-            cmd = [sys.executable, str(script_file)]
-            
-            # 使用Popen启动进程，以便可以管理
-            process = subprocess.Popen(
+            process = MeteredPopen(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
-                cwd=str(work_dir)
+                cwd=str(work_dir),
+                preexec_fn=self.resource_limits.preexec_fn(cgroup)
             )
+        except Exception:
+            if cgroup is not None:
+                cgroup.remove()
+            raise
+        process.cgroup = cgroup
+        return process
+    
+    def _collect_usage(self, process, wall_time: float) -> Tuple[Dict, Optional[str]]:
+        """收集已退出子进程的资源使用，返回 (资源使用, 超出限制的说明)
+
+        同时删除子进程所在的cgroup。
+        """
+        rusage = getattr(process, "rusage", None)
+        cgroup = getattr(process, "cgroup", None)
+        peak_memory = None
+        violation = self.resource_limits.describe_violation(process.returncode, rusage)
+        if cgroup is not None:
+            peak_memory = cgroup.peak_memory()
+            if violation is None and cgroup.oom_killed():
+                violation = f"超出内存限制（{self.max_memory_mb}MB）"
+            cgroup.remove()
+            process.cgroup = None
+        return usage_summary(rusage, wall_time, peak_memory), violation
+    
+    def _execute_code(self, code: str, work_dir: Path, execution_id: str = None,
+                      python_executable: str = None, timeline: Timeline = None,
+                      cancelled: Callable[[], bool] = None) -> Tuple[bool, str, str, Dict]:
+        """执行Python代码，返回 (是否成功, 标准输出, 标准错误, 执行统计)
+
+        cancelled在启动子进程前和登记进程后各检查一次：取消请求到达时进程尚未登记、
+        无法被stop_execution停止，由这两次检查保证不会照常运行。
+        """
+        stats = {}
+        if cancelled is not None and cancelled():
+            stats["stopped"] = True
+            return False, "", "", stats
+        try:
+            # 创建执行脚本和产物目录
+            script_file = work_dir / "main.py"
+            with open(script_file, 'w', encoding='utf-8') as f:
+                f.write(code)
+            (work_dir / ARTIFACTS_DIRNAME).mkdir(exist_ok=True)
+            
+            # 执行代码
+            started = time.monotonic()
+            with self.metrics.phase("spawn", timeline):
+                process = self._start_process(script_file, work_dir, python_executable)
+            if isinstance(process, ZygoteProcess):
+                stats["fork_time"] = process.fork_time
             
             # 如果有execution_id，存储进程信息
             if execution_id:
-                self.running_processes[execution_id] = process
+                self._track(execution_id, process)
+                if cancelled is not None and cancelled():
+                    self.stop_execution(execution_id)
             
+            # 输出超过内存上限时溢出到文件，只保留首尾预览
+            captures = {
+                stream: self.output_store.capture(execution_id or str(uuid.uuid4()), stream)
+                for stream in STREAMS
+            }
+            stats["output"] = captures
             try:
                 # 等待进程完成或超时
-                stdout, stderr = process.communicate(timeout=self.max_execution_time)
+                with self.metrics.phase("run", timeline):
+                    self._capture_output(process, captures, self.max_execution_time)
                 
-                # 从运行进程列表中移除
-                if execution_id and execution_id in self.running_processes:
-                    del self.running_processes[execution_id]
+                stdout, stderr = captures["stdout"].text(), captures["stderr"].text()
+                stats["resource_usage"], violation = self._collect_usage(process, time.monotonic() - started)
+                self._record_exit(stats, execution_id, process)
                 
-                return True, stdout, stderr
+                # 从运行进程列表中移除
+                if execution_id:
+                    self._untrack(execution_id, stats["resource_usage"])
+                if violation:
+                    stderr = f"{stderr}\n{violation}" if stderr else violation
+                return True, stdout, stderr, stats
                 
             except subprocess.TimeoutExpired:
                 # 超时时终止进程
+                self.metrics.timeouts.inc()
                 process.terminate()
                 try:
                     process.wait(timeout=5)
                 except subprocess.TimeoutExpired:
                     process.kill()
+                    process.wait()
                 
-                # 从运行进程列表中移除
-                if execution_id and execution_id in self.running_processes:
-                    del self.running_processes[execution_id]
+                stats["resource_usage"], _ = self._collect_usage(process, time.monotonic() - started)
+                self._record_exit(stats, execution_id, process)
                 
-                return False, "", f"代码执行超时（{self.max_execution_time}秒）"
+                # 从运行进程列表中移除
+                if execution_id:
+                    self._untrack(execution_id, stats["resource_usage"])
+                # 超时的执行不返回输出
+                for capture in captures.values():
+                    capture.discard()
+                return False, "", f"代码执行超时（{self.max_execution_time}秒）", stats
+            
+            finally:
+                for stream, capture in captures.items():
+                    capture.close()
+                    self.output_store.record(capture)
+                    self.metrics.output_bytes.inc(capture.size, stream=stream)
             
         except Exception as e:
             # 从运行进程列表中移除
-            if execution_id and execution_id in self.running_processes:
-                del self.running_processes[execution_id]
-            return False, "", f"执行代码时出错: {str(e)}"
+            if execution_id:
+                self._untrack(execution_id)
+            return False, "", f"执行代码时出错: {str(e)}", stats
+    
+    def _capture_output(self, process, captures: Dict[str, OutputCapture], timeout: float):
+        """读取子进程的全部输出并等待其退出，超时抛出subprocess.TimeoutExpired"""
+        deadline = time.monotonic() + timeout
+        try:
+            for stream, data in iter_output(process, timeout):
+                captures[stream].write(data)
+        finally:
+            close_pipes(process)
+            # 预热worker的任务管道
+            if getattr(process, "stdin", None) is not None:
+                process.stdin.close()
+        process.wait(timeout=max(0.0, deadline - time.monotonic()))
+    
+    def _track(self, execution_id: str, process):
+        """记录正在运行的执行，并登记到跨worker的登记表"""
+        self.running_processes[execution_id] = process
+        if self.registry is not None:
+            try:
+                self.registry.register(execution_id, process.pid)
+            except sqlite3.Error as e:
+                logger.warning(f"登记执行 {execution_id} 失败: {e}")
+    
+    def _untrack(self, execution_id: str, resource_usage: Optional[Dict] = None):
+        """执行结束：移出运行列表，在登记表中记录最终资源使用"""
+        self.running_processes.pop(execution_id, None)
+        self._stopped_executions.discard(execution_id)
+        if self.registry is not None:
+            try:
+                self.registry.finish(execution_id, resource_usage)
+            except sqlite3.Error as e:
+                logger.warning(f"更新执行 {execution_id} 的登记失败: {e}")
+    
+    def _record_exit(self, stats: Dict, execution_id: Optional[str], process):
+        """在执行统计中记录子进程的退出码，以及是否被/stop停止"""
+        stats["returncode"] = process.returncode
+        if execution_id in self._stopped_executions:
+            self._stopped_executions.discard(execution_id)
+            stats["stopped"] = True
+    
+    def _mark_stopped(self, execution_id: str):
+        self._stopped_executions.add(execution_id)
+        if self.registry is not None:
+            try:
+                self.registry.mark_stopped(execution_id)
+            except sqlite3.Error as e:
+                logger.warning(f"更新执行 {execution_id} 的登记失败: {e}")
     
     def stop_execution(self, execution_id: str) -> bool:
-        """停止正在执行的代码"""
+        """停止正在执行的代码（可以是其他worker启动的执行，或正在等待相同请求结果的请求）"""
+        if self.coalescer is not None and self.coalescer.stop(execution_id):
+            return True
         if execution_id in self.running_processes:
             process = self.running_processes[execution_id]
+            self._mark_stopped(execution_id)
             try:
                 process.terminate()
                 process.wait(timeout=5)
-                del self.running_processes[execution_id]
+                self.running_processes.pop(execution_id, None)
                 return True
             except subprocess.TimeoutExpired:
                 process.kill()
-                del self.running_processes[execution_id]
+                self.running_processes.pop(execution_id, None)
                 return True
             except Exception as e:
                 logger.error(f"停止进程时出错: {e}")
                 return False
+        if self.registry is not None:
+            try:
+                return self.registry.terminate(execution_id)
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"停止执行 {execution_id} 时出错: {e}")
         return False
     
-    def execute(self, code: str, execution_id: str = None) -> Dict:
-        """执行Python代码的主方法"""
+    def execute(self, code: str, execution_id: str = None, client_id: str = None,
+                trace: bool = False, cache: str = CACHE_BYPASS, coalesce: Optional[bool] = None,
+                cancelled: Callable[[], bool] = None) -> Dict:
+        """执行Python代码的主方法
+
+        结果中的timings为各阶段耗时；trace为True时附带Chrome trace-event格式的时间线。
+        cache为"allow"时先查找结果缓存，命中则不启动子进程，结果中的cache为hit、miss或bypass。
+        coalesce为None时无副作用的代码与进行中的相同请求共享结果，True/False为强制开启或关闭。
+        cancelled返回True时不再启动子进程（用于取消仍在等待名额或安装依赖的异步任务）。
+        超出并发上限且无法排队时抛出AdmissionRejected。
+        """
         start_time = time.time()
         
         # 如果没有提供execution_id，生成一个
         if not execution_id:
             execution_id = str(uuid.uuid4())
+        timeline = Timeline("execute", execution_id)
         
-        # 安全检查
-        is_safe, safety_msg = self._check_code_safety(code)
+        # 安全检查失败或结果缓存命中时直接返回，不占用执行名额
+        result, key = self._begin_execution(code, execution_id, cache, start_time, timeline, trace)
+        if result is not None:
+            return result
+        
+        # 相同的请求正在执行时等待其结果；该执行失败时重新加入，其中一个请求成为新的leader
+        coalesce_key = self._coalesce_key(code, cache, coalesce, client_id)
+        flight = None
+        while coalesce_key is not None:
+            flight, leader = self.coalescer.join(coalesce_key, execution_id)
+            if leader:
+                break
+            with self.metrics.phase("coalesce", timeline):
+                shared, stopped = flight.wait(execution_id)
+            if stopped:
+                result = self._stopped_waiter_result(execution_id, start_time)
+                return self._end_execution(result, start_time, timeline, trace)
+            if shared is not None:
+                result = self._coalesced_result(shared, flight, execution_id, start_time)
+                return self._end_execution(result, start_time, timeline, trace)
+            flight = None
+        
+        shared = None
+        try:
+            # 准入控制：超出并发上限时排队等待
+            try:
+                ticket = self.admission.acquire(client_id)
+            except AdmissionRejected:
+                self.metrics.executions.inc(mode="execute", outcome="rejected")
+                raise
+            self.metrics.observe_queue_wait(ticket.wait_time, timeline)
+            try:
+                result = self._execute_admitted(code, execution_id, start_time, timeline=timeline,
+                                                cancelled=cancelled)
+            finally:
+                self.admission.release(ticket)
+            self._store_admitted(result, ticket, key)
+            shared = self._shareable(result)
+        finally:
+            if flight is not None:
+                self.coalescer.finish(flight, shared)
+        return self._end_execution(result, start_time, timeline, trace)
+    
+    def _begin_execution(self, code: str, execution_id: str, cache: str, start_time: float,
+                         timeline: Timeline, trace: bool = False) -> Tuple[Optional[Dict], Optional[str]]:
+        """执行前的步骤：安全检查和结果缓存查找，返回 (结果, 结果缓存键)
+
+        安全检查失败或缓存命中时返回的结果已记录指标，可以直接返回给客户端；否则结果为None。
+        查找缓存可能读取磁盘，asyncio模式下在线程中调用。
+        """
+        with self.metrics.phase("safety", timeline):
+            is_safe, safety_msg = self._check_code_safety(code)
         if not is_safe:
-            return {
+            result = {
                 "success": False,
                 "output": "",
                 "error": f"安全检查失败: {safety_msg}",
                 "execution_time": time.time() - start_time,
                 "execution_id": execution_id
             }
+            return self._end_execution(result, start_time, timeline, trace), None
         
-        # 创建临时工作目录
-        work_dir = Path(tempfile.mkdtemp(dir=self.base_dir))
+        key, cached = self._lookup_result_cache(code, cache, execution_id, start_time, timeline)
+        if cached is not None:
+            return self._end_execution(cached, start_time, timeline, trace), key
+        return None, key
+    
+    def _store_admitted(self, result: Dict, ticket: AdmissionTicket, key: Optional[str]):
+        """执行结束后记录排队时间并写入结果缓存"""
+        result["queue_wait_time"] = round(ticket.wait_time, 3)
+        self._store_result_cache(key, result)
+    
+    def _end_execution(self, result: Dict, start_time: float, timeline: Timeline, trace: bool = False) -> Dict:
+        """记录执行指标并在结果中写入各阶段耗时"""
+        self.metrics.record_execution("execute", result, time.time() - start_time)
+        return self._finish_timeline(result, timeline, trace)
+    
+    def _coalesce_key(self, code: str, cache: str, coalesce: Optional[bool],
+                      client_id: Optional[str] = None) -> Optional[str]:
+        """请求合并的键，不合并时返回None
+
+        键中包含客户端标识：等待者不经过准入控制，只与同一客户端的请求合并，
+        不会绕过单客户端的并发上限。
+        """
+        if self.coalescer is None or coalesce is False:
+            return None
+        if coalesce is None and not self.safety_analyzer.analyze(code).side_effect_free:
+            return None
+        return f"{code_hash(code)}:{cache}:{client_id or 'anonymous'}"
+    
+    @staticmethod
+    def _shareable(result: Dict) -> Optional[Dict]:
+        """leader的结果能否交给等待者：被停止的执行返回None，等待者重新执行"""
+        if result.get("stopped"):
+            return None
+        return dict(result)
+    
+    def _stopped_waiter_result(self, execution_id: str, start_time: float) -> Dict:
+        """等待其他请求结果时被/stop停止"""
+        return {
+            "success": False,
+            "output": "",
+            "error": "执行已被停止",
+            "stopped": True,
+            "execution_time": round(time.time() - start_time, 3),
+            "execution_id": execution_id
+        }
+    
+    def _coalesced_result(self, shared: Dict, flight, execution_id: str, start_time: float) -> Dict:
+        """把共享的结果改为本请求的结果，coalesced_with为实际运行代码的执行"""
+        shared.pop("trace", None)
+        shared["execution_id"] = execution_id
+        shared["execution_time"] = round(time.time() - start_time, 3)
+        shared["coalesced_with"] = flight.leader_id
+        return shared
+    
+    def _result_cache_key(self, code: str) -> str:
+        """结果缓存键：代码、导入的第三方发行包及其已安装版本、解释器和资源限制"""
+        packages = []
+        for module in self._extract_imports(code):
+            if self.package_index.is_stdlib(module):
+                continue
+            distribution = self.distribution_resolver.resolve(module)
+            packages.append((distribution, self.package_index.version(distribution) or ""))
+        environment = (
+            sys.version,
+            sys.executable,
+            "venv" if self.venv_cache is not None else "shared",
+            str(self.max_execution_time),
+            str(self.max_memory_mb)
+        )
+        return cache_key(code, packages, environment)
+    
+    def _lookup_result_cache(self, code: str, cache: str, execution_id: str, start_time: float,
+                             timeline: Timeline = None) -> Tuple[Optional[str], Optional[Dict]]:
+        """查找结果缓存，返回 (缓存键, 命中的结果)；客户端未允许或缓存已关闭时缓存键为None"""
+        if cache != CACHE_ALLOW or self.result_cache is None:
+            return None, None
+        with self.metrics.phase("cache", timeline):
+            key = self._result_cache_key(code)
+            result = self.result_cache.get(key)
+        if result is not None:
+            result["execution_id"] = execution_id
+            result["execution_time"] = round(time.time() - start_time, 6)
+            result["cache"] = "hit"
+        return key, result
+    
+    def _store_result_cache(self, key: Optional[str], result: Dict):
+        """缓存成功的结果，并在结果中注明缓存状态"""
+        if key is None:
+            result["cache"] = CACHE_BYPASS
+            return
+        self.result_cache.put(key, result)
+        result["cache"] = "miss"
+    
+    def execute_in_session(self, session: Session, code: str, client_id: str = None,
+                           trace: bool = False) -> Dict:
+        """在会话中执行一个代码单元，之前代码单元定义的变量和导入的模块仍然可用
+
+        超时的代码单元被中断，会话保持可用；会话进程退出（如超出内存限制）时会话被移除。
+        会话正在执行其他代码时抛出SessionBusy，超出并发上限且无法排队时抛出AdmissionRejected。
+        """
+        start_time = time.time()
+        execution_id = str(uuid.uuid4())
+        timeline = Timeline("session", execution_id)
+        
+        with self.metrics.phase("safety", timeline):
+            is_safe, safety_msg = self._check_code_safety(code)
+        if not is_safe:
+            result = {
+                "success": False,
+                "output": "",
+                "error": f"安全检查失败: {safety_msg}",
+                "execution_time": round(time.time() - start_time, 3),
+                "execution_id": execution_id,
+                "session_id": session.session_id
+            }
+            self.metrics.record_execution("session", result, time.time() - start_time)
+            return self._finish_timeline(result, timeline, trace)
+        
+        try:
+            ticket = self.admission.acquire(client_id)
+        except AdmissionRejected:
+            self.metrics.executions.inc(mode="session", outcome="rejected")
+            raise
+        self.metrics.observe_queue_wait(ticket.wait_time, timeline)
+        try:
+            with self.metrics.phase("imports", timeline):
+                imports = self._extract_imports(code)
+            with self.metrics.phase("install", timeline):
+                if self.venv_cache is not None:
+                    # 会话进程的解释器在创建时已确定，无法切换到缓存虚拟环境
+                    install_success, install_msg = True, "会话只能使用服务解释器中已安装的包"
+                else:
+                    install_success, install_msg = self._install_packages(imports, session.work_dir)
+                if not install_success:
+                    logger.warning(f"包安装失败: {install_msg}")
+            with self.metrics.phase("run", timeline):
+                cell = session.execute(code, self.max_execution_time, execution_id)
+        finally:
+            self.admission.release(ticket)
+        
+        error = cell["error"]
+        if cell["timed_out"]:
+            self.metrics.timeouts.inc()
+            message = f"代码执行超时（{self.max_execution_time}秒），已中断"
+            error = f"{error}\n{message}" if error else message
+        if cell["session_closed"]:
+            self.sessions.discard(session)
+            message = "会话进程已退出（可能超出内存限制），会话已结束"
+            error = f"{error}\n{message}" if error else message
+        for stream, capture in cell["captures"].items():
+            self.metrics.output_bytes.inc(capture.size, stream=stream)
+        
+        resource_usage = {"wall_time": cell["wall_time"]}
+        usage = session.describe().get("resource_usage")
+        if usage and not cell["session_closed"]:
+            # 会话进程的累计CPU时间和当前常驻内存
+            resource_usage["session_cpu_time"] = usage["cpu_time"]
+            resource_usage["session_rss_mb"] = usage["rss_mb"]
+        
+        result = {
+            "success": cell["exit_code"] == 0 and not cell["timed_out"],
+            "output": cell["output"],
+            "error": error,
+            "execution_time": round(time.time() - start_time, 3),
+            "imports_used": imports,
+            "install_message": install_msg,
+            "execution_id": execution_id,
+            "session_id": session.session_id,
+            "execution_count": cell["execution_count"],
+            "interrupted": cell["interrupted"],
+            "session_closed": cell["session_closed"],
+            "resource_usage": resource_usage,
+            "queue_wait_time": round(ticket.wait_time, 3)
+        }
+        self.output_store.describe(result, cell["captures"], execution_id)
+        if not cell["session_closed"]:
+            artifacts = self._collect_artifacts(session.artifacts_dir, timeline, session.artifact_state)
+            if artifacts:
+                result["artifacts"] = artifacts
+        self.metrics.record_execution("session", result, time.time() - start_time)
+        return self._finish_timeline(result, timeline, trace)
+    
+    def _finish_timeline(self, result: Dict, timeline: Timeline, trace: bool = False) -> Dict:
+        """把各阶段耗时写入结果；请求了trace时附带时间线，慢请求的时间线保存到TRACE_DIR"""
+        result["timings"] = timeline.breakdown()
+        if trace:
+            result["trace"] = timeline.to_chrome_trace()
+        if self.trace_dir and result["timings"]["total"] >= self.trace_slow_seconds:
+            try:
+                path = timeline.save(self.trace_dir)
+                logger.info(f"慢请求trace已保存: {path}")
+            except OSError as e:
+                logger.warning(f"保存trace失败: {e}")
+        return result
+    
+    def _execute_admitted(self, code: str, execution_id: str, start_time: float,
+                          shared: SharedDependencies = None, timeline: Timeline = None,
+                          cancelled: Callable[[], bool] = None) -> Dict:
+        """获得执行名额后安装依赖并运行代码
+
+        shared为批量执行中同组代码共享的依赖准备结果，其虚拟环境由该组统一释放。
+        """
+        # 从沙箱池取出已清空的工作目录
+        work_dir = self.sandbox_pool.acquire()
+        python_executable = None
         
         try:
             # 提取imports
-            imports = self._extract_imports(code)
+            with self.metrics.phase("imports", timeline):
+                imports = self._extract_imports(code)
             logger.info(f"检测到导入: {imports}")
             
             # 安装依赖
-            install_success, install_msg = self._install_packages(imports, work_dir)
-            if not install_success:
-                logger.warning(f"包安装失败: {install_msg}")
-                # 继续执行，可能包已经安装
+            with self.metrics.phase("install", timeline):
+                if shared is None:
+                    install_success, install_msg, python_executable = self._prepare_dependencies(imports, work_dir)
+                else:
+                    install_success, install_msg, python_executable = shared.get(imports, work_dir)
             
             # 执行代码
-            exec_success, stdout, stderr = self._execute_code(code, work_dir, execution_id)
+            try:
+                exec_success, stdout, stderr, exec_stats = self._execute_code(
+                    code, work_dir, execution_id, python_executable, timeline, cancelled
+                )
+            finally:
+                if python_executable is not None and shared is None:
+                    with self.metrics.phase("cleanup", timeline):
+                        self.venv_cache.release(python_executable)
+            
+            return self._admitted_result(
+                execution_id, start_time, work_dir, imports, install_msg,
+                exec_success, stdout, stderr, exec_stats, timeline
+            )
+            
+        finally:
+            # 归还工作目录，清理在后台进行
+            with self.metrics.phase("cleanup", timeline):
+                self.sandbox_pool.release(work_dir)
+    
+    def _admitted_result(self, execution_id: str, start_time: float, work_dir: Path, imports: List[str],
+                         install_msg: str, exec_success: bool, stdout: str, stderr: str, exec_stats: Dict,
+                         timeline: Timeline = None) -> Dict:
+        """子进程结束后组装执行结果：空间配额检查、溢出输出信息和执行产物
+
+        需要遍历工作目录和读取文件，asyncio模式下在线程中调用。
+        """
+        result = {
+            "success": exec_success,
+            "output": stdout,
+            "error": stderr,
+            "execution_time": round(time.time() - start_time, 3),
+            "imports_used": imports,
+            "install_message": install_msg,
+            "execution_id": execution_id
+        }
+        
+        if "resource_usage" in exec_stats:
+            result["resource_usage"] = exec_stats["resource_usage"]
+        
+        if "returncode" in exec_stats:
+            result["returncode"] = exec_stats["returncode"]
+        if exec_stats.get("stopped"):
+            result["success"] = False
+            result["stopped"] = True
+            result["error"] = f"{stderr}\n执行已被停止" if stderr else "执行已被停止"
+        
+        if self.sandbox_pool.exceeds_quota(work_dir):
+            result["success"] = False
+            result["error"] = self._quota_error(stderr)
+        
+        if "output" in exec_stats:
+            self.output_store.describe(result, exec_stats["output"], execution_id)
+        
+        artifacts = self._collect_artifacts(work_dir / ARTIFACTS_DIRNAME, timeline)
+        if artifacts:
+            result["artifacts"] = artifacts
+        
+        if "fork_time" in exec_stats:
+            # 预加载节省的导入时间扣除fork开销
+            saved = self.zygote.estimate_saved_time(imports) - exec_stats["fork_time"]
+            result["fork_time"] = round(exec_stats["fork_time"], 4)
+            result["preload_time_saved"] = round(max(0.0, saved), 3)
+        
+        return result
+    
+    def _collect_artifacts(self, directory: Path, timeline: Timeline = None,
+                           previous: Optional[Dict] = None) -> List[Dict]:
+        """把产物目录中的文件存入产物存储，返回产物列表"""
+        with self.metrics.phase("artifacts", timeline):
+            try:
+                return self.artifact_store.collect(directory, previous)
+            except OSError as e:
+                logger.warning(f"收集产物失败: {e}")
+                return []
+    
+    def _quota_error(self, stderr: str) -> str:
+        """工作目录超出空间配额时的错误信息"""
+        message = f"工作目录超出空间配额（{self.sandbox_pool.quota_bytes // 1024 // 1024}MB）"
+        return f"{stderr}\n{message}" if stderr else message
+
+    def execute_batch(self, items: List[Dict], client_id: str = None,
+                      trace: bool = False) -> Iterator[Tuple[int, Dict]]:
+        """并行执行多段代码，按完成顺序产出 (序号, 结果)
+
+        items中每一项包含code和可选的execution_id。依赖集合相同的代码只准备一次依赖，
+        并行度不超过并发上限（以及单客户端上限）。生成器被提前关闭时停止未完成的执行。
+        每一项的结果带有各自的timings，trace为True时附带各自的时间线。
+        """
+        start_time = time.time()
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        runnable = []
+        
+        timelines: Dict[int, Timeline] = {}
+        for index, item in enumerate(items):
+            execution_id = item.get("execution_id") or str(uuid.uuid4())
+            timeline = timelines[index] = Timeline("batch_item", execution_id)
+            with self.metrics.phase("safety", timeline):
+                is_safe, safety_msg = self._check_code_safety(item["code"])
+            if not is_safe:
+                result = {
+                    "success": False,
+                    "output": "",
+                    "error": f"安全检查失败: {safety_msg}",
+                    "execution_time": round(time.time() - start_time, 3),
+                    "execution_id": execution_id
+                }
+                self.metrics.record_execution("batch", result, time.time() - start_time)
+                yield index, self._finish_timeline(result, timeline, trace)
+                continue
+            # 按需要安装的发行包分组，同组共享一次依赖准备
+            requirements = tuple(sorted(self._resolve_requirements(self._extract_imports(item["code"]))))
+            groups.setdefault(requirements, []).append(index)
+            runnable.append((index, item["code"], execution_id))
+        
+        if not runnable:
+            return
+        
+        release = self.venv_cache.release if self.venv_cache is not None else None
+        shared_by_index = {}
+        for indexes in groups.values():
+            shared = SharedDependencies(self._prepare_dependencies, release, len(indexes))
+            for index in indexes:
+                shared_by_index[index] = shared
+        
+        def run(index: int, code: str, execution_id: str) -> Dict:
+            item_start = time.time()
+            shared = shared_by_index[index]
+            timeline = timelines[index]
+            try:
+                with self.admission.slot(client_id) as ticket:
+                    self.metrics.observe_queue_wait(ticket.wait_time, timeline)
+                    result = self._execute_admitted(code, execution_id, item_start, shared, timeline)
+                result["queue_wait_time"] = round(ticket.wait_time, 3)
+                self.metrics.record_execution("batch", result, time.time() - item_start)
+                return self._finish_timeline(result, timeline, trace)
+            except AdmissionRejected as e:
+                self.metrics.executions.inc(mode="batch", outcome="rejected")
+                return {
+                    "success": False,
+                    "output": "",
+                    "error": e.reason,
+                    "retry_after": e.retry_after,
+                    "execution_time": round(time.time() - item_start, 3),
+                    "execution_id": execution_id
+                }
+            finally:
+                shared.done()
+        
+        workers = min(len(runnable), self.admission.max_in_flight)
+        if self.admission.per_client_limit:
+            workers = min(workers, self.admission.per_client_limit)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+        futures = {
+            executor.submit(run, index, code, execution_id): (index, execution_id)
+            for index, code, execution_id in runnable
+        }
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                index, execution_id = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"批量执行异常: {execution_id}: {e}")
+                    result = {
+                        "success": False,
+                        "output": "",
+                        "error": f"服务器内部错误: {str(e)}",
+                        "execution_id": execution_id
+                    }
+                yield index, result
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            for future, (index, execution_id) in futures.items():
+                if future.cancelled():
+                    # 被取消的run()不会执行，其finally中的done()需要在这里补上，否则环境一直被占用
+                    shared_by_index[index].done()
+                elif not future.done():
+                    self.stop_execution(execution_id)
+    
+    def judge(self, code: str, cases: List[Dict], time_limit: float = None, compare: str = "trim",
+              execution_id: str = None, client_id: str = None, trace: bool = False) -> Dict:
+        """判题模式：对每组用例的标准输入运行代码并与期望输出比较
+
+        cases中每一项包含input和expected_output。trace为True时附带时间线，其中每组用例
+        按所在的判题进程单独显示。超出并发上限且无法排队时抛出AdmissionRejected。
+        """
+        start_time = time.time()
+        if not execution_id:
+            execution_id = str(uuid.uuid4())
+        timeline = Timeline("judge", execution_id)
+        
+        with self.metrics.phase("safety", timeline):
+            report = self.judge_safety_analyzer.analyze(code)
+        if not report.is_safe:
+            result = {
+                "success": False,
+                "error": f"安全检查失败: {report.message}",
+                "execution_time": round(time.time() - start_time, 3),
+                "execution_id": execution_id
+            }
+            self.metrics.record_execution("judge", result, time.time() - start_time)
+            return self._finish_timeline(result, timeline, trace)
+        
+        time_limit = min(float(time_limit or self.judge_time_limit), self.max_execution_time)
+        try:
+            ticket = self.admission.acquire(client_id)
+        except AdmissionRejected:
+            self.metrics.executions.inc(mode="judge", outcome="rejected")
+            raise
+        self.metrics.observe_queue_wait(ticket.wait_time, timeline)
+        try:
+            result = self._judge_admitted(code, list(report.imports), cases, time_limit, compare, client_id,
+                                          timeline)
+        finally:
+            self.admission.release(ticket)
+        result["execution_id"] = execution_id
+        result["execution_time"] = round(time.time() - start_time, 3)
+        result["queue_wait_time"] = round(ticket.wait_time, 3)
+        self.metrics.record_execution("judge", result, time.time() - start_time)
+        return self._finish_timeline(result, timeline, trace)
+    
+    def _judge_admitted(self, code: str, imports: List[str], cases: List[Dict], time_limit: float,
+                        compare: str, client_id: str, timeline: Timeline = None) -> Dict:
+        """获得执行名额后准备依赖，并由多个判题进程并行运行用例"""
+        work_dir = self.sandbox_pool.acquire()
+        python_executable = None
+        # 有空闲名额时增加判题进程，每个额外进程占用一个名额
+        extra_tickets = []
+        try:
+            with self.metrics.phase("install", timeline):
+                install_success, install_msg, python_executable = self._prepare_dependencies(imports, work_dir)
+            script_file = work_dir / "main.py"
+            with open(script_file, 'w', encoding='utf-8') as f:
+                f.write(code)
             
-            execution_time = time.time() - start_time
+            for _ in range(min(self.judge_workers, len(cases)) - 1):
+                ticket = self.admission.try_acquire(client_id)
+                if ticket is None:
+                    break
+                extra_tickets.append(ticket)
             
-            return {
-                "success": exec_success,
-                "output": stdout,
-                "error": stderr,
-                "execution_time": round(execution_time, 3),
+            pending = queue.Queue()
+            for index in range(len(cases)):
+                pending.put(index)
+            outcomes: List[Optional[Dict]] = [None] * len(cases)
+            compile_errors = []
+            
+            def record(name: str, start: float, **args):
+                # 判题进程并行运行，各自的区间只显示在trace中，不计入阶段耗时
+                if timeline is not None:
+                    timeline.add(name, start, time.perf_counter(), "judge", **args)
+            
+            def run_worker():
+                load_started = time.perf_counter()
+                worker = JudgeWorker(
+                    python_executable or sys.executable,
+                    work_dir,
+                    popen_class=MeteredPopen,
+                    popen_kwargs={"preexec_fn": self.resource_limits.preexec_fn()}
+                )
+                try:
+                    error = worker.load(script_file, work_dir)
+                    record("load", load_started)
+                    if error:
+                        compile_errors.append(error)
+                        return
+                    while True:
+                        try:
+                            index = pending.get_nowait()
+                        except queue.Empty:
+                            return
+                        case = cases[index]
+                        case_started = time.perf_counter()
+                        try:
+                            outcome = worker.run_case(case.get("input", ""), time_limit)
+                        except Exception as e:
+                            # 判题进程异常时记录该用例，剩余用例交给其他判题进程
+                            logger.error(f"判题进程异常: {e}")
+                            outcomes[index] = {"verdict": SYSTEM_ERROR, "error": str(e)}
+                            worker.process.kill()
+                            return
+                        finally:
+                            record("case", case_started, index=index)
+                        outcomes[index] = outcome
+                finally:
+                    worker.close()
+            
+            threads = [
+                threading.Thread(target=run_worker, name=f"judge-{i}", daemon=True)
+                for i in range(1 + len(extra_tickets))
+            ]
+            with self.metrics.phase("run", timeline):
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            
+            verdicts = []
+            for index, case in enumerate(cases):
+                outcome = outcomes[index]
+                if outcome is None:
+                    # 编译失败或所有判题进程都已退出
+                    verdict = COMPILE_ERROR if compile_errors else SYSTEM_ERROR
+                    verdicts.append({"index": index, "verdict": verdict})
+                    continue
+                if "verdict" in outcome:
+                    verdicts.append({"index": index, **outcome})
+                    continue
+                expected = case.get("expected_output", "")
+                verdict = case_verdict(outcome, expected, time_limit, compare)
+                entry = {
+                    "index": index,
+                    "verdict": verdict,
+                    "time": round(outcome["time"], 3),
+                    "wall_time": round(outcome["wall_time"], 3),
+                    "memory_kb": outcome["max_rss_kb"]
+                }
+                if verdict != ACCEPTED:
+                    entry["output"] = preview(outcome["stdout"])
+                    entry["expected_output"] = preview(expected)
+                    if outcome["stderr"]:
+                        entry["error"] = outcome["stderr"]
+                verdicts.append(entry)
+            
+            passed = sum(1 for entry in verdicts if entry["verdict"] == ACCEPTED)
+            # 总体结果为第一个未通过用例的结果
+            overall = next((entry["verdict"] for entry in verdicts if entry["verdict"] != ACCEPTED), ACCEPTED)
+            result = {
+                "success": True,
+                "verdict": overall,
+                "passed": passed,
+                "total": len(cases),
+                "time_limit": time_limit,
+                "cases": verdicts,
+                "workers": len(threads),
+                "imports_used": imports,
+                "install_message": install_msg
+            }
+            if compile_errors:
+                result["error"] = compile_errors[0]
+            return result
+        
+        finally:
+            for ticket in extra_tickets:
+                self.admission.release(ticket)
+            with self.metrics.phase("cleanup", timeline):
+                if python_executable is not None:
+                    self.venv_cache.release(python_executable)
+                self.sandbox_pool.release(work_dir)
+    
+    def execute_stream(self, code: str, execution_id: str = None, client_id: str = None,
+                       ticket: AdmissionTicket = None, trace: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """流式执行Python代码，逐步产出 (事件名, 数据)
+
+        事件依次为 start、install，运行期间的 stdout/stderr 输出块，最后是 status。
+        status中的timings为各阶段耗时（不含status之后的清理），trace为True时附带时间线。
+        生成器被提前关闭（如客户端断开）时会终止子进程。
+        ticket为调用方已申请的执行名额，由调用方负责释放；为空时在此申请和释放。
+        """
+        start_time = time.time()
+        
+        if not execution_id:
+            execution_id = str(uuid.uuid4())
+        timeline = Timeline("stream", execution_id)
+        
+        # 安全检查
+        with self.metrics.phase("safety", timeline):
+            is_safe, safety_msg = self._check_code_safety(code)
+        if not is_safe:
+            status = {
+                "success": False,
+                "error": f"安全检查失败: {safety_msg}",
+                "execution_time": round(time.time() - start_time, 3),
+                "execution_id": execution_id
+            }
+            self.metrics.record_execution("stream", status, time.time() - start_time)
+            yield "status", self._finish_timeline(status, timeline, trace)
+            return
+        
+        own_ticket = None
+        if ticket is None:
+            try:
+                ticket = own_ticket = self.admission.acquire(client_id)
+            except AdmissionRejected as e:
+                self.metrics.executions.inc(mode="stream", outcome="rejected")
+                yield "status", {
+                    "success": False,
+                    "error": e.reason,
+                    "retry_after": e.retry_after,
+                    "execution_time": round(time.time() - start_time, 3),
+                    "execution_id": execution_id
+                }
+                return
+        
+        work_dir = self.sandbox_pool.acquire()
+        python_executable = None
+        process = None
+        resource_usage = None
+        
+        self.metrics.observe_queue_wait(ticket.wait_time, timeline)
+        try:
+            with self.metrics.phase("imports", timeline):
+                imports = self._extract_imports(code)
+            yield "start", {
+                "execution_id": execution_id,
+                "imports_used": imports,
+                "queue_wait_time": round(ticket.wait_time, 3)
+            }
+            
+            with self.metrics.phase("install", timeline):
+                install_success, install_msg, python_executable = self._prepare_dependencies(imports, work_dir)
+            yield "install", {"success": install_success, "message": install_msg}
+            
+            script_file = work_dir / "main.py"
+            with open(script_file, 'w', encoding='utf-8') as f:
+                f.write(code)
+            (work_dir / ARTIFACTS_DIRNAME).mkdir(exist_ok=True)
+            
+            started = time.monotonic()
+            with self.metrics.phase("spawn", timeline):
+                process = self._start_process(script_file, work_dir, python_executable)
+            self._track(execution_id, process)
+            
+            run_started = time.monotonic()
+            deadline = run_started + self.max_execution_time
+            decoders = {"stdout": make_decoder(), "stderr": make_decoder()}
+            success = True
+            error = ""
+            try:
+                # 非阻塞读取输出，到达即推送
+                for stream, data in iter_output(process, self.max_execution_time):
+                    self.metrics.output_bytes.inc(len(data), stream=stream)
+                    text = decoders[stream].decode(data)
+                    if text:
+                        yield stream, {"data": text}
+                for stream, decoder in decoders.items():
+                    text = decoder.decode(b"", final=True)
+                    if text:
+                        yield stream, {"data": text}
+                process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self.metrics.timeouts.inc()
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+                success = False
+                error = f"代码执行超时（{self.max_execution_time}秒）"
+            self.metrics.observe_phase("run", time.monotonic() - run_started, timeline)
+            
+            resource_usage, violation = self._collect_usage(process, time.monotonic() - started)
+            if violation and not error:
+                error = violation
+            if self.sandbox_pool.exceeds_quota(work_dir):
+                success = False
+                error = self._quota_error(error)
+            
+            status = {
+                "success": success,
+                "error": error,
+                "returncode": process.returncode,
+                "resource_usage": resource_usage,
+                "execution_time": round(time.time() - start_time, 3),
                 "imports_used": imports,
                 "install_message": install_msg,
                 "execution_id": execution_id
             }
+            artifacts = self._collect_artifacts(work_dir / ARTIFACTS_DIRNAME, timeline)
+            if artifacts:
+                status["artifacts"] = artifacts
+            self.metrics.record_execution("stream", status, time.time() - start_time)
+            yield "status", self._finish_timeline(status, timeline, trace)
             
         finally:
-            # 清理临时目录
-            try:
-                shutil.rmtree(work_dir)
-            except Exception as e:
-                logger.warning(f"清理临时目录失败: {e}")
+            if process is not None:
+                if process.poll() is None:
+                    process.kill()
+                    try:
+                        process.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        logger.warning(f"流式执行进程未能及时退出: {execution_id}")
+                close_pipes(process)
+                if getattr(process, "cgroup", None) is not None:
+                    process.cgroup.remove()
+                self._untrack(execution_id, resource_usage)
+            with self.metrics.phase("cleanup", timeline):
+                if python_executable is not None:
+                    self.venv_cache.release(python_executable)
+                self.sandbox_pool.release(work_dir)
+            if own_ticket is not None:
+                self.admission.release(own_ticket)
 
 # 创建执行引擎实例
 engine = PythonExecutionEngine()
 
+def _client_id() -> str:
+    """识别请求来源客户端，用于按客户端公平分配执行名额"""
+    return (
+        request.headers.get('X-Client-Id')
+        or request.headers.get('X-Real-IP')
+        or request.remote_addr
+        or 'anonymous'
+    )
+
+def _admission_rejected_response(e: AdmissionRejected):
+    """准入控制拒绝时的响应"""
+    return jsonify({
+        "success": False,
+        "error": e.reason,
+        "output": "",
+        "retry_after": e.retry_after
+    }), e.status_code, {"Retry-After": str(e.retry_after)}
+
+def _execute_job(code: str, execution_id: str, client_id: Optional[str],
+                 cancelled: Callable[[], bool]) -> Dict:
+    """异步任务的执行函数，被准入控制拒绝时作为失败结果保存"""
+    try:
+        return engine.execute(code, execution_id, client_id, cancelled=cancelled)
+    except AdmissionRejected as e:
+        logger.warning(f"异步任务被拒绝: {execution_id}: {e.reason}")
+        return {
+            "success": False,
+            "output": "",
+            "error": e.reason,
+            "retry_after": e.retry_after,
+            "execution_id": execution_id
+        }
+
+# 异步任务管理器
+job_manager = JobManager(
+    _execute_job,
+    engine.stop_execution,
+    workers=int(os.environ.get('JOB_WORKERS', 4)),
+    max_queue=int(os.environ.get('JOB_QUEUE_SIZE', 100)),
+    result_ttl=int(os.environ.get('JOB_RESULT_TTL', 3600))
+)
+
+def _register_status_metrics(metrics: ExecutionMetrics):
+    """把各组件已有的统计信息注册为抓取时读取的指标"""
+    registry = metrics.registry
+    registry.callback("pyexec_running_executions", "正在运行的执行数",
+                      lambda: len(engine.running_processes))
+    registry.callback("pyexec_admission_in_flight", "已获得执行名额的执行数",
+                      lambda: engine.admission.stats()["in_flight"])
+    registry.callback("pyexec_admission_queue_depth", "等待执行名额的请求数",
+                      lambda: engine.admission.stats()["queue_depth"])
+    registry.callback("pyexec_admission_rejections_total", "被准入控制拒绝的请求数",
+                      lambda: {
+                          ("queue_full",): engine.admission.stats()["rejected_queue_full"],
+                          ("timeout",): engine.admission.stats()["rejected_timeout"]
+                      },
+                      type_name="counter", labelnames=("reason",))
+    registry.callback("pyexec_pip_runs_total", "pip安装命令的运行次数",
+                      lambda: engine.install_coordinator.stats()["pip_runs"], type_name="counter")
+    registry.callback("pyexec_install_coalesced_total", "与其他请求合并的安装请求数",
+                      lambda: engine.install_coordinator.stats()["coalesced_requests"], type_name="counter")
+    registry.callback("pyexec_safety_cache_hits_total", "安全检查缓存命中数",
+                      lambda: engine.safety_analyzer.stats()["cache_hits"], type_name="counter")
+    registry.callback("pyexec_safety_cache_misses_total", "安全检查缓存未命中数",
+                      lambda: engine.safety_analyzer.stats()["cache_misses"], type_name="counter")
+    registry.callback("pyexec_sandbox_idle", "空闲的沙箱目录数",
+                      lambda: engine.sandbox_pool.stats()["idle"])
+    registry.callback("pyexec_sandbox_overflow_total", "沙箱池用完时临时创建的目录数",
+                      lambda: engine.sandbox_pool.stats()["overflow"], type_name="counter")
+    registry.callback("pyexec_jobs_queue_depth", "排队中的异步任务数",
+                      lambda: job_manager.stats()["queue_depth"])
+    registry.callback("pyexec_sessions_active", "当前的有状态会话数",
+                      lambda: engine.sessions.stats()["active"])
+    if engine.venv_cache is not None:
+        registry.callback("pyexec_venv_cache_hits_total", "复用缓存虚拟环境的次数",
+                          lambda: engine.venv_cache.stats()["hits"], type_name="counter")
+        registry.callback("pyexec_venv_cache_builds_total", "创建虚拟环境的次数",
+                          lambda: engine.venv_cache.stats()["builds"], type_name="counter")
+    if engine.result_cache is not None:
+        registry.callback("pyexec_result_cache_lookups_total", "结果缓存查找次数",
+                          lambda: {
+                              ("memory_hit",): engine.result_cache.stats()["memory_hits"],
+                              ("disk_hit",): engine.result_cache.stats()["disk_hits"],
+                              ("miss",): engine.result_cache.stats()["misses"]
+                          },
+                          type_name="counter", labelnames=("outcome",))
+    if engine.coalescer is not None:
+        registry.callback("pyexec_coalesced_requests_total", "与进行中的相同请求合并的请求数",
+                          lambda: engine.coalescer.stats()["coalesced"], type_name="counter")
+    if engine.worker_pool is not None:
+        registry.callback("pyexec_worker_pool_cold_starts_total", "进程池为空时同步启动worker的次数",
+                          lambda: engine.worker_pool.stats()["cold_starts"], type_name="counter")
+
+_register_status_metrics(engine.metrics)
+
+# 批量执行单次最多提交的代码段数
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 100))
+
+# 判题单次最多提交的用例数
+MAX_JUDGE_CASES = int(os.environ.get('MAX_JUDGE_CASES', 200))
+
+# /execute流量记录，供replay.py回放（TRAFFIC_LOG为空时关闭）
+traffic_recorder = None
+if os.environ.get('TRAFFIC_LOG'):
+    traffic_recorder = TrafficRecorder(
+        os.environ['TRAFFIC_LOG'],
+        anonymize=os.environ.get('TRAFFIC_LOG_ANONYMIZE', 'false').lower() == 'true',
+        sample_rate=float(os.environ.get('TRAFFIC_LOG_SAMPLE_RATE', 1.0))
+    )
+    atexit.register(traffic_recorder.close)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
@@ -332,6 +1577,7 @@ def health_check():
 @app.route('/execute', methods=['POST'])
 def execute_code():
     """执行Python代码接口"""
+    arrived_at = time.time()
     try:
         data = request.get_json()
         
@@ -353,10 +1599,39 @@ def execute_code():
         # 获取execution_id（可选）
         execution_id = data.get('execution_id')
         
+        # 结果缓存（可选）：allow允许返回相同代码的缓存结果，默认bypass
+        cache = data.get('cache', CACHE_BYPASS)
+        if cache not in CACHE_MODES:
+            return jsonify({
+                "success": False,
+                "error": f"cache必须是{' 或 '.join(CACHE_MODES)}",
+                "output": ""
+            }), 400
+        
+        # 请求合并（可选）：省略时只合并无副作用的代码
+        coalesce = data.get('coalesce')
+        if coalesce is not None and not isinstance(coalesce, bool):
+            return jsonify({
+                "success": False,
+                "error": "coalesce必须是布尔值",
+                "output": ""
+            }), 400
+        
         logger.info(f"收到执行请求，代码长度: {len(code)}, execution_id: {execution_id}")
         
         # 执行代码
-        result = engine.execute(code, execution_id)
+        client_id = _client_id()
+        try:
+            result = engine.execute(code, execution_id, client_id=client_id, trace=bool(data.get('trace')),
+                                    cache=cache, coalesce=coalesce)
+        except AdmissionRejected as e:
+            logger.warning(f"执行请求被拒绝: {e.reason}")
+            if traffic_recorder is not None:
+                traffic_recorder.record(code, client_id, arrived_at, time.time() - arrived_at, e.status_code)
+            return _admission_rejected_response(e)
+        
+        if traffic_recorder is not None:
+            traffic_recorder.record(code, client_id, arrived_at, time.time() - arrived_at, 200, result)
         
         # 记录执行结果
         if result['success']:
@@ -374,6 +1649,348 @@ def execute_code():
             "output": ""
         }), 500
 
+@app.route('/execute/stream', methods=['POST'])
+def execute_code_stream():
+    """流式执行Python代码接口（Server-Sent Events）"""
+    data = request.get_json(silent=True)
+    
+    if not data or 'code' not in data:
+        return jsonify({
+            "success": False,
+            "error": "缺少代码参数",
+            "output": ""
+        }), 400
+    
+    code = data['code']
+    if not code.strip():
+        return jsonify({
+            "success": False,
+            "error": "代码不能为空",
+            "output": ""
+        }), 400
+    
+    execution_id = data.get('execution_id')
+    trace = bool(data.get('trace'))
+    logger.info(f"收到流式执行请求，代码长度: {len(code)}, execution_id: {execution_id}")
+    
+    # 在返回响应前申请执行名额，以便返回正确的状态码
+    try:
+        ticket = engine.admission.acquire(_client_id())
+    except AdmissionRejected as e:
+        logger.warning(f"流式执行请求被拒绝: {e.reason}")
+        engine.metrics.executions.inc(mode="stream", outcome="rejected")
+        return _admission_rejected_response(e)
+    
+    def generate():
+        for event, payload in engine.execute_stream(code, execution_id, ticket=ticket, trace=trace):
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # 禁止Nginx缓冲，保证输出实时到达客户端
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    # 响应结束（包括客户端断开）后释放名额
+    response.call_on_close(lambda: engine.admission.release(ticket))
+    return response
+
+@app.route('/execute/batch', methods=['POST'])
+def execute_code_batch():
+    """批量执行Python代码接口
+
+    默认在全部完成后按提交顺序返回结果；stream为true时以NDJSON逐行返回完成的结果。
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "error": "缺少items参数"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"success": False, "error": f"单次最多提交{MAX_BATCH_SIZE}段代码"}), 400
+    
+    # 每一项可以是代码字符串，或包含code和execution_id的对象
+    normalized = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"code": item}
+        if not isinstance(item, dict) or not isinstance(item.get('code'), str) or not item['code'].strip():
+            return jsonify({"success": False, "error": f"第{index}项缺少代码"}), 400
+        normalized.append({"code": item['code'], "execution_id": item.get('execution_id')})
+    
+    client_id = _client_id()
+    trace = bool(data.get('trace'))
+    logger.info(f"收到批量执行请求，代码段数: {len(normalized)}")
+    
+    if data.get('stream'):
+        def generate():
+            for index, result in engine.execute_batch(normalized, client_id, trace):
+                yield json.dumps({"index": index, **result}, ensure_ascii=False) + "\n"
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    start_time = time.time()
+    results = [None] * len(normalized)
+    try:
+        for index, result in engine.execute_batch(normalized, client_id, trace):
+            results[index] = result
+    except Exception as e:
+        logger.error(f"批量执行时发生异常: {str(e)}")
+        return jsonify({"success": False, "error": f"服务器内部错误: {str(e)}"}), 500
+    
+    return jsonify({
+        "success": all(result["success"] for result in results),
+        "results": results,
+        "execution_time": round(time.time() - start_time, 3)
+    })
+
+@app.route('/judge', methods=['POST'])
+def judge_code():
+    """判题接口：对多组标准输入运行同一段代码并比较输出"""
+    data = request.get_json(silent=True)
+    
+    if not data or not isinstance(data.get('code'), str) or not data['code'].strip():
+        return jsonify({"success": False, "error": "缺少代码参数"}), 400
+    
+    cases = data.get('cases')
+    if not isinstance(cases, list) or not cases:
+        return jsonify({"success": False, "error": "缺少cases参数"}), 400
+    if len(cases) > MAX_JUDGE_CASES:
+        return jsonify({"success": False, "error": f"单次最多提交{MAX_JUDGE_CASES}组用例"}), 400
+    for index, case in enumerate(cases):
+        if not isinstance(case, dict) or not isinstance(case.get('input', ''), str) \
+                or not isinstance(case.get('expected_output', ''), str):
+            return jsonify({"success": False, "error": f"第{index}组用例格式错误"}), 400
+    
+    compare = data.get('compare', 'trim')
+    if compare not in ('trim', 'exact'):
+        return jsonify({"success": False, "error": "compare只能为trim或exact"}), 400
+    
+    try:
+        time_limit = float(data['time_limit']) if data.get('time_limit') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "time_limit必须为数字"}), 400
+    
+    logger.info(f"收到判题请求，代码长度: {len(data['code'])}, 用例数: {len(cases)}")
+    try:
+        result = engine.judge(
+            data['code'], cases, time_limit, compare,
+            execution_id=data.get('execution_id'),
+            client_id=_client_id(),
+            trace=bool(data.get('trace'))
+        )
+    except AdmissionRejected as e:
+        logger.warning(f"判题请求被拒绝: {e.reason}")
+        return _admission_rejected_response(e)
+    except Exception as e:
+        logger.error(f"判题时发生异常: {str(e)}")
+        return jsonify({"success": False, "error": f"服务器内部错误: {str(e)}"}), 500
+    
+    return jsonify(result)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """提交异步执行任务，立即返回execution_id"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'code' not in data:
+            return jsonify({
+                "success": False,
+                "error": "缺少代码参数"
+            }), 400
+        
+        code = data['code']
+        if not code.strip():
+            return jsonify({
+                "success": False,
+                "error": "代码不能为空"
+            }), 400
+        
+        execution_id = data.get('execution_id') or str(uuid.uuid4())
+        priority = data.get('priority', 0)
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            return jsonify({
+                "success": False,
+                "error": "priority必须是整数"
+            }), 400
+        
+        try:
+            job, created = job_manager.submit(code, execution_id, priority, _client_id())
+        except queue.Full:
+            logger.warning(f"任务队列已满，拒绝任务: {execution_id}")
+            return jsonify({
+                "success": False,
+                "error": "任务队列已满，请稍后重试"
+            }), 429, {"Retry-After": "5"}
+        
+        if created:
+            logger.info(f"收到异步任务，代码长度: {len(code)}, execution_id: {execution_id}")
+            return jsonify(job), 202
+        # 重复提交：返回已有任务的状态或结果
+        return jsonify(job)
+        
+    except Exception as e:
+        logger.error(f"提交任务时发生异常: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"服务器内部错误: {str(e)}"
+        }), 500
+
+@app.route('/jobs/<execution_id>', methods=['GET'])
+def get_job(execution_id):
+    """查询异步任务状态和结果"""
+    job = job_manager.get(execution_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": f"任务不存在或已过期: {execution_id}"
+        }), 404
+    return jsonify(job)
+
+@app.route('/jobs/<execution_id>', methods=['DELETE'])
+def cancel_job(execution_id):
+    """取消异步任务"""
+    if job_manager.cancel(execution_id):
+        logger.info(f"已取消任务: {execution_id}")
+        return jsonify({
+            "success": True,
+            "message": f"已取消任务: {execution_id}"
+        })
+    return jsonify({
+        "success": False,
+        "message": f"任务不存在或已结束: {execution_id}"
+    }), 404
+
+def _session_not_found(session_id: str):
+    return jsonify({
+        "success": False,
+        "error": f"会话不存在或已过期: {session_id}"
+    }), 404
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """创建有状态会话，之后的代码单元共享同一个全局命名空间"""
+    data = request.get_json(silent=True) or {}
+    memory_mb = data.get('memory_mb', 0)
+    if isinstance(memory_mb, bool) or not isinstance(memory_mb, int) or memory_mb < 0:
+        return jsonify({
+            "success": False,
+            "error": "memory_mb必须是非负整数"
+        }), 400
+    try:
+        session = engine.sessions.create(memory_mb=memory_mb)
+    except SessionLimitExceeded as e:
+        logger.warning(f"创建会话被拒绝: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 429, {"Retry-After": "30"}
+    except Exception as e:
+        logger.error(f"创建会话时发生异常: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"服务器内部错误: {str(e)}"
+        }), 500
+    return jsonify(session.describe()), 201
+
+@app.route('/sessions', methods=['GET'])
+def list_sessions():
+    """列出当前的会话"""
+    return jsonify({
+        "sessions": [session.describe() for session in engine.sessions.list()],
+        **engine.sessions.stats()
+    })
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """查询会话状态"""
+    session = engine.sessions.get(session_id)
+    if session is None:
+        return _session_not_found(session_id)
+    return jsonify(session.describe())
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def close_session(session_id):
+    """结束会话"""
+    if engine.sessions.close(session_id):
+        return jsonify({
+            "success": True,
+            "message": f"已结束会话: {session_id}"
+        })
+    return _session_not_found(session_id)
+
+@app.route('/sessions/<session_id>/execute', methods=['POST'])
+def execute_in_session(session_id):
+    """在会话中执行代码单元"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'code' not in data:
+            return jsonify({
+                "success": False,
+                "error": "缺少代码参数",
+                "output": ""
+            }), 400
+        
+        code = data['code']
+        if not code.strip():
+            return jsonify({
+                "success": False,
+                "error": "代码不能为空",
+                "output": ""
+            }), 400
+        
+        session = engine.sessions.get(session_id)
+        if session is None:
+            return _session_not_found(session_id)
+        
+        try:
+            result = engine.execute_in_session(session, code, client_id=_client_id(),
+                                               trace=bool(data.get('trace')))
+        except AdmissionRejected as e:
+            logger.warning(f"会话执行请求被拒绝: {e.reason}")
+            return _admission_rejected_response(e)
+        except SessionBusy as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "output": ""
+            }), 409
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        logger.error(f"会话执行代码时发生异常: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"服务器内部错误: {str(e)}",
+            "output": ""
+        }), 500
+
+@app.route('/sessions/<session_id>/interrupt', methods=['POST'])
+def interrupt_session(session_id):
+    """中断会话中正在执行的代码单元（会话保持可用）"""
+    session = engine.sessions.get(session_id)
+    if session is None:
+        return _session_not_found(session_id)
+    if session.interrupt():
+        return jsonify({
+            "success": True,
+            "message": f"已中断会话中的执行: {session_id}"
+        })
+    return jsonify({
+        "success": False,
+        "message": f"会话中没有正在执行的代码: {session_id}"
+    }), 409
+
 @app.route('/stop/<execution_id>', methods=['POST'])
 def stop_execution(execution_id):
     """停止正在执行的代码"""
@@ -400,16 +2017,117 @@ def stop_execution(execution_id):
             "error": f"服务器内部错误: {str(e)}"
         }), 500
 
+@app.route('/executions/<execution_id>', methods=['GET'])
+def get_execution(execution_id):
+    """查询执行的登记信息（运行中的执行附带实时资源使用）"""
+    if engine.registry is None:
+        return jsonify({
+            "success": False,
+            "error": "执行登记表未启用"
+        }), 404
+    record = engine.registry.get(execution_id)
+    if record is None:
+        return jsonify({
+            "success": False,
+            "error": f"未找到执行: {execution_id}"
+        }), 404
+    return jsonify(record)
+
+@app.route('/executions/<execution_id>/output', methods=['GET'])
+def get_execution_output(execution_id):
+    """按字节范围读取溢出到文件的完整输出（offset、length为字节数，stream为stdout或stderr）"""
+    stream = request.args.get('stream', 'stdout')
+    if stream not in STREAMS:
+        return jsonify({
+            "success": False,
+            "error": f"不支持的输出流: {stream}"
+        }), 400
+    try:
+        offset = int(request.args.get('offset', 0))
+        length = int(request.args['length']) if 'length' in request.args else None
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "offset和length必须是整数"
+        }), 400
+    
+    opened = engine.output_store.open_range(execution_id, stream, offset, length)
+    if opened is None:
+        return jsonify({
+            "success": False,
+            "error": f"输出不存在或已过期: {execution_id}"
+        }), 404
+    start, count, size, chunks = opened
+    headers = {
+        "Content-Length": str(count),
+        "X-Output-Size": str(size)
+    }
+    if count:
+        headers["Content-Range"] = f"bytes {start}-{start + count - 1}/{size}"
+    return Response(chunks, mimetype='text/plain; charset=utf-8', headers=headers)
+
+@app.route('/artifacts/<digest>/<path:name>', methods=['GET'])
+def get_artifact(digest, name):
+    """下载执行产物；地址由内容哈希决定，内容不会改变，可以长期缓存"""
+    f = engine.artifact_store.open(digest)
+    if f is None:
+        return jsonify({
+            "success": False,
+            "error": f"产物不存在或已被清理: {digest}"
+        }), 404
+    response = send_file(
+        f,
+        mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        download_name=os.path.basename(name),
+        etag=digest,
+        conditional=True
+    )
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus格式的运行指标"""
+    return Response(engine.metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/status', methods=['GET'])
 def get_status():
     """获取服务状态和正在运行的进程"""
     try:
         running_count = len(engine.running_processes)
-        return jsonify({
+        status = {
             "status": "running",
             "running_executions": running_count,
-            "execution_ids": list(engine.running_processes.keys())
-        })
+            "execution_ids": list(engine.running_processes.keys()),
+            "execution_backend": engine.execution_backend
+        }
+        if engine.registry is not None:
+            # 多worker部署时列出所有worker正在运行的执行
+            executions = engine.registry.running()
+            status["running_executions"] = len(executions)
+            status["execution_ids"] = [item["execution_id"] for item in executions]
+            status["executions"] = executions
+            status["local_running_executions"] = running_count
+            status["registry"] = engine.registry.stats()
+        if engine.worker_pool is not None:
+            status["worker_pool"] = engine.worker_pool.stats()
+        status["package_installs"] = engine.install_coordinator.stats()
+        status["safety_cache"] = engine.safety_analyzer.stats()
+        status["jobs"] = job_manager.stats()
+        status["admission"] = engine.admission.stats()
+        status["sandbox_pool"] = engine.sandbox_pool.stats()
+        status["sessions"] = engine.sessions.stats()
+        status["outputs"] = engine.output_store.stats()
+        status["artifacts"] = engine.artifact_store.stats()
+        if engine.result_cache is not None:
+            status["result_cache"] = engine.result_cache.stats()
+        if engine.coalescer is not None:
+            status["coalescing"] = engine.coalescer.stats()
+        if traffic_recorder is not None:
+            status["traffic_log"] = traffic_recorder.stats()
+        if engine.venv_cache is not None:
+            status["venv_cache"] = engine.venv_cache.stats()
+        return jsonify(status)
     except Exception as e:
         logger.error(f"获取状态时发生异常: {str(e)}")
         return jsonify({
@@ -431,7 +2149,12 @@ def get_config():
     return jsonify({
         "max_execution_time": engine.max_execution_time,
         "max_memory_mb": engine.max_memory_mb,
-        "allowed_packages_count": len(engine.allowed_packages)
+        "resource_limits": engine.resource_limits.to_dict(),
+        "cgroup_enabled": engine.cgroups.available,
+        "max_concurrent_executions": engine.admission.max_in_flight,
+        "allowed_packages_count": len(engine.allowed_packages),
+        "execution_backend": engine.execution_backend,
+        "worker_pool_size": engine.worker_pool_size
     })
 
 if __name__ == '__main__':
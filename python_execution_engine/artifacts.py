@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+执行产物存储
+执行结束后，沙箱artifacts目录中的文件（包括自动保存的matplotlib图像）按内容哈希存入产物目录，
+响应中只返回下载地址；相同内容只存一份，总大小超过预算时淘汰最久未使用的产物
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """按SHA-256寻址的产物目录
+
+    - collect() 把一个目录下的普通文件存入，返回每个文件的名称、大小、哈希和下载地址
+    - 产物按内容去重，多个执行产生的相同图像只占一份空间
+    - 总大小超过budget_bytes时按最近使用时间淘汰
+    """
+
+    def __init__(self, root: Path, budget_bytes: int = 512 * 1024 * 1024, max_files: int = 20):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.budget_bytes = budget_bytes
+        # 单次执行最多收集的文件数
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.stored = 0
+        self.deduplicated = 0
+        self.evicted = 0
+        self.total_bytes = sum(path.stat().st_size for path in self._files())
+
+    def _files(self) -> List[Path]:
+        # 跳过正在写入的临时文件
+        return [path for path in self.root.glob("*/*") if path.is_file() and not path.name.startswith(".")]
+
+    def path(self, digest: str) -> Optional[Path]:
+        """产物文件路径，哈希格式不正确时返回None"""
+        if len(digest) != 64 or any(ch not in "0123456789abcdef" for ch in digest):
+            return None
+        return self.root / digest[:2] / digest
+
+    def collect(self, directory: Path, previous: Optional[Dict[str, tuple]] = None) -> List[Dict]:
+        """存入目录下的文件（不跟随符号链接），按相对路径排序
+
+        previous为上次收集时各文件的 (修改时间, 大小)，未变化的文件跳过，收集后原地更新。
+        """
+        if not directory.is_dir():
+            return []
+        files = []
+        for path in sorted(directory.rglob("*")):
+            if not path.is_file() or path.is_symlink():
+                continue
+            if previous is not None:
+                stat = path.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                name = path.relative_to(directory).as_posix()
+                if previous.get(name) == signature:
+                    continue
+                previous[name] = signature
+            files.append(path)
+        if len(files) > self.max_files:
+            logger.warning(f"产物文件过多，只保存前{self.max_files}个: {directory}")
+            files = files[:self.max_files]
+
+        artifacts = []
+        for path in files:
+            try:
+                artifacts.append(self._store(path, path.relative_to(directory).as_posix()))
+            except OSError as e:
+                logger.warning(f"保存产物失败: {path}: {e}")
+        self._enforce_budget()
+        return artifacts
+
+    def _store(self, source: Path, name: str) -> Dict:
+        digest = _file_digest(source)
+        target = self.path(digest)
+        size = source.stat().st_size
+        if target.exists():
+            # 已有相同内容，只更新使用时间
+            os.utime(target)
+            with self._lock:
+                self.deduplicated += 1
+        else:
+            target.parent.mkdir(exist_ok=True)
+            # 先复制到临时文件再改名，读取方不会看到写了一半的文件
+            fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix=".incoming-")
+            try:
+                with os.fdopen(fd, "wb") as f, open(source, "rb") as src:
+                    shutil.copyfileobj(src, f)
+                os.replace(temp_path, target)
+            except BaseException:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                raise
+            with self._lock:
+                self.stored += 1
+                self.total_bytes += size
+
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return {
+            "name": name,
+            "size": size,
+            "sha256": digest,
+            "content_type": content_type,
+            "url": f"/artifacts/{digest}/{quote(name)}"
+        }
+
+    def open(self, digest: str):
+        """打开产物文件用于读取，不存在时返回None"""
+        path = self.path(digest)
+        if path is None:
+            return None
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def _enforce_budget(self):
+        with self._lock:
+            if self.total_bytes <= self.budget_bytes:
+                return
+        # 其他worker可能也在写入，以目录中的实际文件为准
+        entries = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.budget_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self.total_bytes = total
+            self.evicted += evicted
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "path": str(self.root),
+                "budget_bytes": self.budget_bytes,
+                "total_bytes": self.total_bytes,
+                "max_files": self.max_files,
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "evicted": self.evicted
+            }
@@ -0,0 +1,707 @@
+#!/usr/bin/env python3
+"""
+ASGI入口（asyncio执行模式），用于生产环境部署
+
+/execute和/stop在事件循环中处理：子进程由asyncio.create_subprocess_exec启动，输出由流读取器读取，
+子进程退出通过pidfd通知事件循环，运行中的执行不占用线程。其余接口交给Flask应用在线程池中处理，
+所有接口的请求和响应格式与WSGI模式一致。
+
+启动: uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import io
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from admission import AdmissionRejected
+from limits import rusage_to_dict
+from metrics import Timeline
+from outputs import OutputCapture, STREAMS
+from process_io import CHUNK_SIZE
+from result_cache import CACHE_BYPASS, CACHE_MODES
+from sandbox_runner import ARTIFACTS_DIRNAME
+from worker_pool import RUNNER_SCRIPT
+
+import app as flask_module
+
+logger = logging.getLogger(__name__)
+
+engine = flask_module.engine
+flask_app = flask_module.app
+
+# 转交给Flask处理的请求所用的线程数（流式接口在响应结束前占用一个线程）
+BRIDGE_THREADS = int(os.environ.get('ASGI_BRIDGE_THREADS', 64))
+
+# 请求体大小上限（字节）
+MAX_BODY_SIZE = int(os.environ.get('ASGI_MAX_BODY_MB', 16)) * 1024 * 1024
+
+
+class MeteredPidfdChildWatcher(getattr(asyncio, "PidfdChildWatcher", object)):
+    """用wait4回收子进程的pidfd监视器，保存每个子进程的资源使用
+
+    Python 3.12之前asyncio默认的ThreadedChildWatcher为每个子进程启动一个等待线程，
+    改用pidfd后由事件循环统一等待子进程退出。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rusage: Dict[int, Dict] = {}
+
+    def _do_wait(self, pid):
+        pidfd, callback, args = self._callbacks.pop(pid)
+        self._loop._remove_reader(pidfd)
+        try:
+            _, status, rusage = os.wait4(pid, 0)
+        except ChildProcessError:
+            returncode = 255
+        else:
+            returncode = os.waitstatus_to_exitcode(status)
+            self.rusage[pid] = rusage_to_dict(rusage)
+        os.close(pidfd)
+        callback(pid, returncode, *args)
+
+
+def _install_child_watcher(loop: asyncio.AbstractEventLoop) -> Optional[MeteredPidfdChildWatcher]:
+    """在支持pidfd的系统上为事件循环安装子进程监视器
+
+    Python 3.12起asyncio默认使用pidfd，此时不再替换监视器（也就没有逐进程的CPU时间统计）。
+    """
+    if sys.version_info >= (3, 12) or not hasattr(asyncio, "PidfdChildWatcher") \
+            or not hasattr(os, "pidfd_open"):
+        return None
+    watcher = MeteredPidfdChildWatcher()
+    watcher.attach_loop(loop)
+    asyncio.get_event_loop_policy().set_child_watcher(watcher)
+    return watcher
+
+
+class AsyncProcessHandle:
+    """asyncio子进程在engine.running_processes中的句柄
+
+    /status据此列出运行中的执行；其他线程（如异步任务取消）调用terminate/kill/wait时
+    转交给事件循环执行。
+    """
+
+    def __init__(self, process: asyncio.subprocess.Process, loop: asyncio.AbstractEventLoop):
+        self.process = process
+        self.pid = process.pid
+        self.loop = loop
+        self.exited = threading.Event()
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.returncode
+
+    def poll(self) -> Optional[int]:
+        return self.process.returncode
+
+    def _signal(self, sig: int):
+        if self.process.returncode is None:
+            try:
+                self.process.send_signal(sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.loop.call_soon_threadsafe(self._signal, signal.SIGTERM)
+
+    def kill(self):
+        self.loop.call_soon_threadsafe(self._signal, signal.SIGKILL)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        """在事件循环以外的线程中等待子进程退出"""
+        if not self.exited.wait(timeout):
+            raise subprocess.TimeoutExpired(str(self.pid), timeout)
+        return self.process.returncode
+
+    async def stop(self, timeout: float = 5) -> bool:
+        """在事件循环中终止子进程"""
+        self._signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self._signal(signal.SIGKILL)
+            await self.process.wait()
+        return True
+
+
+class AsyncExecutionApp:
+    """ASGI应用"""
+
+    def __init__(self):
+        self.watcher: Optional[MeteredPidfdChildWatcher] = None
+        self.bridge = concurrent.futures.ThreadPoolExecutor(
+            max_workers=BRIDGE_THREADS, thread_name_prefix="asgi-bridge"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        self._ensure_watcher()
+
+        path, method = scope["path"], scope["method"]
+        if path == "/execute" and method == "POST":
+            await self._handle_execute(scope, receive, send)
+        elif path.startswith("/stop/") and method == "POST" \
+                and isinstance(engine.running_processes.get(unquote(path[len("/stop/"):])), AsyncProcessHandle):
+            await self._handle_stop(unquote(path[len("/stop/"):]), send)
+        else:
+            await self._call_flask(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._ensure_watcher()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.bridge.shutdown(wait=False, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _ensure_watcher(self):
+        if self.watcher is None:
+            self.watcher = _install_child_watcher(asyncio.get_running_loop()) or False
+
+    # ------------------------------------------------------------------
+    # /execute
+    # ------------------------------------------------------------------
+
+    async def _handle_execute(self, scope, receive, send):
+        arrived_at = time.time()
+        try:
+            data = json.loads(await _read_body(receive) or b"null")
+        except (ValueError, UnicodeDecodeError):
+            data = None
+        except _BodyTooLarge:
+            await _send_json(send, {"success": False, "error": "请求体过大", "output": ""}, 413)
+            return
+
+        if not isinstance(data, dict) or 'code' not in data:
+            await _send_json(send, {"success": False, "error": "缺少代码参数", "output": ""}, 400)
+            return
+        code = data['code']
+        if not isinstance(code, str) or not code.strip():
+            await _send_json(send, {"success": False, "error": "代码不能为空", "output": ""}, 400)
+            return
+
+        execution_id = data.get('execution_id')
+        cache = data.get('cache', CACHE_BYPASS)
+        if cache not in CACHE_MODES:
+            await _send_json(
+                send, {"success": False, "error": f"cache必须是{' 或 '.join(CACHE_MODES)}", "output": ""}, 400
+            )
+            return
+        coalesce = data.get('coalesce')
+        if coalesce is not None and not isinstance(coalesce, bool):
+            await _send_json(send, {"success": False, "error": "coalesce必须是布尔值", "output": ""}, 400)
+            return
+        client_id = _client_id(scope)
+        logger.info(f"收到执行请求，代码长度: {len(code)}, execution_id: {execution_id}")
+
+        # 客户端断开时取消执行并终止子进程
+        task = asyncio.ensure_future(self.execute(
+            code, execution_id, client_id, bool(data.get('trace')), cache, coalesce
+        ))
+        disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+        if not task.done():
+            task.cancel()
+            logger.info(f"客户端已断开，取消执行: {execution_id}")
+            try:
+                await task
+            except (asyncio.CancelledError, AdmissionRejected):
+                pass
+            return
+
+        recorder = flask_module.traffic_recorder
+        try:
+            result = task.result()
+        except AdmissionRejected as e:
+            logger.warning(f"执行请求被拒绝: {e.reason}")
+            if recorder is not None:
+                recorder.record(code, client_id, arrived_at, time.time() - arrived_at, e.status_code)
+            await _send_json(
+                send,
+                {"success": False, "error": e.reason, "output": "", "retry_after": e.retry_after},
+                e.status_code,
+                [(b"retry-after", str(e.retry_after).encode())]
+            )
+            return
+        except Exception as e:
+            logger.error(f"执行代码时发生异常: {str(e)}")
+            await _send_json(send, {"success": False, "error": f"服务器内部错误: {str(e)}", "output": ""}, 500)
+            return
+
+        if recorder is not None:
+            recorder.record(code, client_id, arrived_at, time.time() - arrived_at, 200, result)
+        if result['success']:
+            logger.info(f"代码执行成功，耗时: {result['execution_time']}秒")
+        else:
+            logger.warning(f"代码执行失败: {result['error']}")
+        await _send_json(send, result)
+
+    async def execute(self, code: str, execution_id: Optional[str] = None, client_id: Optional[str] = None,
+                      trace: bool = False, cache: str = CACHE_BYPASS, coalesce: Optional[bool] = None) -> Dict:
+        """与PythonExecutionEngine.execute相同的流程，等待排队和子进程时不占用线程
+
+        执行前后的步骤复用引擎的实现，其中读写磁盘的部分在线程中进行，不阻塞事件循环。
+        """
+        start_time = time.time()
+        if not execution_id:
+            execution_id = str(uuid.uuid4())
+        timeline = Timeline("execute", execution_id)
+
+        result, key = await asyncio.to_thread(
+            engine._begin_execution, code, execution_id, cache, start_time, timeline, trace
+        )
+        if result is not None:
+            return result
+
+        # 等待进行中的相同请求时不占用线程
+        coalesce_key = engine._coalesce_key(code, cache, coalesce, client_id)
+        flight = None
+        while coalesce_key is not None:
+            flight, leader = engine.coalescer.join(coalesce_key, execution_id)
+            if leader:
+                break
+            with engine.metrics.phase("coalesce", timeline):
+                shared, stopped = await flight.wait_async(execution_id)
+            if stopped:
+                result = engine._stopped_waiter_result(execution_id, start_time)
+                return await asyncio.to_thread(engine._end_execution, result, start_time, timeline, trace)
+            if shared is not None:
+                result = engine._coalesced_result(shared, flight, execution_id, start_time)
+                return await asyncio.to_thread(engine._end_execution, result, start_time, timeline, trace)
+            flight = None
+
+        # 客户端断开导致取消时shared为None，等待者重新执行
+        shared = None
+        try:
+            try:
+                ticket = await engine.admission.acquire_async(client_id)
+            except AdmissionRejected:
+                engine.metrics.executions.inc(mode="execute", outcome="rejected")
+                raise
+            engine.metrics.observe_queue_wait(ticket.wait_time, timeline)
+            try:
+                result = await self._execute_admitted(code, execution_id, start_time, timeline)
+            finally:
+                engine.admission.release(ticket)
+            await asyncio.to_thread(engine._store_admitted, result, ticket, key)
+            shared = engine._shareable(result)
+        finally:
+            if flight is not None:
+                engine.coalescer.finish(flight, shared)
+        return await asyncio.to_thread(engine._end_execution, result, start_time, timeline, trace)
+
+    async def _execute_admitted(self, code: str, execution_id: str, start_time: float,
+                                timeline: Timeline) -> Dict:
+        work_dir = await _acquire_sandbox()
+        python_executable = None
+        try:
+            with engine.metrics.phase("imports", timeline):
+                imports = engine._extract_imports(code)
+            logger.info(f"检测到导入: {imports}")
+
+            # 依赖安装可能调用pip，在线程池中进行；等待期间断开时归还取得的虚拟环境
+            with engine.metrics.phase("install", timeline):
+                install_success, install_msg, python_executable = await _acquire_owned(
+                    engine._prepare_dependencies, imports, work_dir,
+                    release=_release_dependencies, executor=self.bridge
+                )
+
+            # 创建capture时可能清理过期的输出文件
+            captures = await asyncio.to_thread(
+                lambda: {stream: engine.output_store.capture(execution_id, stream) for stream in STREAMS}
+            )
+            try:
+                success, stdout, stderr, run_stats = await self._run_script(
+                    code, work_dir, execution_id, python_executable, timeline, captures
+                )
+            finally:
+                await asyncio.to_thread(_close_captures, captures)
+                if python_executable is not None:
+                    # 释放后可能淘汰并删除虚拟环境
+                    with engine.metrics.phase("cleanup", timeline):
+                        await asyncio.to_thread(engine.venv_cache.release, python_executable)
+
+            exec_stats = dict(run_stats, output=captures)
+            # 配额检查遍历工作目录，产物收集读取并哈希文件
+            return await asyncio.to_thread(
+                engine._admitted_result, execution_id, start_time, work_dir, imports, install_msg,
+                success, stdout, stderr, exec_stats, timeline
+            )
+        finally:
+            with engine.metrics.phase("cleanup", timeline):
+                engine.sandbox_pool.release(work_dir)
+
+    async def _run_script(self, code: str, work_dir, execution_id: str, python_executable: Optional[str],
+                          timeline: Timeline, captures: Dict[str, OutputCapture]
+                          ) -> Tuple[bool, str, str, Dict]:
+        """启动子进程并等待其结束，返回 (是否成功, 标准输出, 标准错误, 执行统计)
+
+        执行统计中包含资源使用、退出码和是否被停止，与同步模式的_execute_code一致。
+        输出逐块写入captures，超过内存上限的部分溢出到文件。
+        """
+        loop = asyncio.get_running_loop()
+        script_file = await asyncio.to_thread(_write_script, code, work_dir)
+
+        started = time.monotonic()
+        cgroup = await _acquire_owned(engine.cgroups.create, work_dir.name, release=_remove_cgroup)
+        process = None
+        handle = None
+        track = None
+        resource_usage = None
+        try:
+            with engine.metrics.phase("spawn", timeline):
+                process = await asyncio.create_subprocess_exec(
+                    python_executable or sys.executable, "-u", str(RUNNER_SCRIPT), str(script_file),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=str(work_dir),
+                    preexec_fn=engine.resource_limits.preexec_fn(cgroup)
+                )
+            handle = AsyncProcessHandle(process, loop)
+            # 登记表写入SQLite；被取消时finally中等待登记完成后再注销
+            track = asyncio.ensure_future(asyncio.to_thread(engine._track, execution_id, handle))
+            await asyncio.shield(track)
+
+            timed_out = False
+            with engine.metrics.phase("run", timeline):
+                try:
+                    await asyncio.wait_for(asyncio.gather(
+                        _pump(process.stdout, captures["stdout"]),
+                        _pump(process.stderr, captures["stderr"]),
+                        process.wait()
+                    ), engine.max_execution_time)
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    engine.metrics.timeouts.inc()
+                    await handle.stop()
+                    for capture in captures.values():
+                        await asyncio.to_thread(capture.discard)
+
+            stdout, stderr = captures["stdout"].text(), captures["stderr"].text()
+
+            # 与MeteredPopen一致，供_collect_usage读取
+            process.rusage = self.watcher.rusage.pop(process.pid, None) if self.watcher else None
+            process.cgroup, cgroup = cgroup, None
+            resource_usage, violation = engine._collect_usage(process, time.monotonic() - started)
+            stats = {"resource_usage": resource_usage}
+            engine._record_exit(stats, execution_id, process)
+            if timed_out:
+                return False, "", f"代码执行超时（{engine.max_execution_time}秒）", stats
+            if violation:
+                stderr = f"{stderr}\n{violation}" if stderr else violation
+            return True, stdout, stderr, stats
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return False, "", f"执行代码时出错: {str(e)}", {}
+        finally:
+            if process is not None and process.returncode is None:
+                # 被取消（客户端断开）时终止子进程
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+                await process.wait()
+            if process is not None and self.watcher:
+                self.watcher.rusage.pop(process.pid, None)
+            if handle is not None:
+                handle.exited.set()
+                if track is not None:
+                    await asyncio.wait({track})
+                if engine.running_processes.get(execution_id) is handle:
+                    await asyncio.to_thread(engine._untrack, execution_id, resource_usage)
+            if cgroup is not None:
+                await asyncio.to_thread(cgroup.remove)
+
+    # ------------------------------------------------------------------
+    # /stop
+    # ------------------------------------------------------------------
+
+    async def _handle_stop(self, execution_id: str, send):
+        handle = engine.running_processes.get(execution_id)
+        if not isinstance(handle, AsyncProcessHandle) or handle.returncode is not None:
+            logger.warning(f"停止执行失败或执行不存在: {execution_id}")
+            await _send_json(send, {"success": False, "message": f"停止执行失败或执行不存在: {execution_id}"}, 404)
+            return
+        engine._mark_stopped(execution_id)
+        await handle.stop()
+        logger.info(f"成功停止执行: {execution_id}")
+        await _send_json(send, {"success": True, "message": f"成功停止执行: {execution_id}"})
+
+    # ------------------------------------------------------------------
+    # 其余接口交给Flask
+    # ------------------------------------------------------------------
+
+    async def _call_flask(self, scope, receive, send):
+        """在线程中运行Flask应用，响应体逐块转发（支持SSE和NDJSON流式响应）"""
+        try:
+            body = await _read_body(receive)
+        except _BodyTooLarge:
+            await _send_json(send, {"success": False, "error": "请求体过大"}, 413)
+            return
+        environ = _wsgi_environ(scope, body)
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def emit(item):
+            loop.call_soon_threadsafe(events.put_nowait, item)
+
+        def run():
+            # 整个响应在同一线程中迭代，Flask的请求上下文在迭代期间保持有效
+            started = []
+
+            def start_response(status, headers, exc_info=None):
+                started[:] = [status, headers]
+                return lambda data: None
+
+            iterable = None
+            try:
+                iterable = flask_app(environ, start_response)
+                for chunk in iterable:
+                    if started:
+                        emit(("start", started.copy()))
+                        started.clear()
+                    if cancelled.is_set():
+                        break
+                    if chunk:
+                        emit(("body", chunk))
+                if started:
+                    emit(("start", started.copy()))
+            except Exception as e:
+                emit(("error", e))
+            finally:
+                if iterable is not None and hasattr(iterable, "close"):
+                    iterable.close()
+                emit(("end", None))
+
+        future = loop.run_in_executor(self.bridge, run)
+        disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+        response_started = False
+        try:
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    # 客户端断开，通知线程停止迭代（关闭生成器会终止流式执行的子进程）
+                    cancelled.set()
+                    break
+                kind, payload = getter.result()
+                if kind == "start":
+                    status, headers = payload
+                    await send({
+                        "type": "http.response.start",
+                        "status": int(status.split(" ", 1)[0]),
+                        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                    for name, value in headers]
+                    })
+                    response_started = True
+                elif kind == "body":
+                    await send({"type": "http.response.body", "body": payload, "more_body": True})
+                elif kind == "error":
+                    logger.error(f"处理请求时发生异常: {payload}")
+                    if not response_started:
+                        await _send_json(send, {"success": False, "error": f"服务器内部错误: {payload}"}, 500)
+                        response_started = None
+                elif kind == "end":
+                    if response_started:
+                        await send({"type": "http.response.body", "body": b"", "more_body": False})
+                    break
+        finally:
+            disconnect.cancel()
+            cancelled.set()
+        await future
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+async def _acquire_sandbox():
+    """在线程中从沙箱池取出工作目录（池用完时需要创建目录）；等待期间被取消时归还取出的目录"""
+    return await _acquire_owned(engine.sandbox_pool.acquire, release=engine.sandbox_pool.release)
+
+
+async def _acquire_owned(func, *args, release: Callable, executor=None):
+    """在线程中调用func取得需要归还的资源；等待期间被取消时，在资源就绪后用release归还"""
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, functools.partial(func, *args))
+
+    def release_unused(done: asyncio.Future):
+        if not done.cancelled() and done.exception() is None:
+            loop.run_in_executor(None, release, done.result())
+
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(release_unused)
+        raise
+
+
+def _release_dependencies(prepared: Tuple[bool, str, Optional[str]]):
+    python_executable = prepared[2]
+    if python_executable is not None:
+        engine.venv_cache.release(python_executable)
+
+
+def _remove_cgroup(cgroup):
+    if cgroup is not None:
+        cgroup.remove()
+
+
+def _write_script(code: str, work_dir) -> Path:
+    script_file = work_dir / "main.py"
+    with open(script_file, 'w', encoding='utf-8') as f:
+        f.write(code)
+    (work_dir / ARTIFACTS_DIRNAME).mkdir(exist_ok=True)
+    return script_file
+
+
+def _close_captures(captures: Dict[str, OutputCapture]):
+    for stream, capture in captures.items():
+        capture.close()
+        engine.output_store.record(capture)
+        engine.metrics.output_bytes.inc(capture.size, stream=stream)
+
+
+async def _pump(reader: asyncio.StreamReader, capture: OutputCapture):
+    """把子进程的一个输出流逐块写入capture，直到管道关闭
+
+    只写入内存缓冲的数据直接写入；需要写溢出文件的在线程中写入。
+    """
+    while True:
+        data = await reader.read(CHUNK_SIZE)
+        if not data:
+            return
+        if capture.fits_in_memory(len(data)):
+            capture.write(data)
+        else:
+            await asyncio.to_thread(capture.write, data)
+
+
+async def _read_body(receive) -> bytes:
+    chunks: List[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            # 之后的receive()仍会返回http.disconnect，由_wait_disconnect处理
+            return b"".join(chunks)
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            raise _BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _send_json(send, payload: Dict, status: int = 200, headers: Optional[List] = None):
+    body = (json.dumps(payload) + "\n").encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *(headers or [])
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _client_id(scope) -> str:
+    """与Flask接口相同的客户端识别规则"""
+    client = scope.get("client")
+    return (
+        _header(scope, b"x-client-id")
+        or _header(scope, b"x-real-ip")
+        or (client[0] if client else None)
+        or 'anonymous'
+    )
+
+
+def _wsgi_environ(scope, body: bytes) -> Dict:
+    """由ASGI请求构造WSGI environ"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client")
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0] if client else "",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for key, value in scope.get("headers", []):
+        name = key.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            continue
+        else:
+            name = f"HTTP_{name}"
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+app = AsyncExecutionApp()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', 5000))
+    )
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+批量执行
+依赖集合相同的代码只准备一次依赖，多段代码在执行容量内并行运行
+"""
+
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+PrepareResult = Tuple[bool, str, Optional[str]]
+
+
+class SharedDependencies:
+    """批量中依赖集合相同的一组代码共享的依赖准备结果
+
+    第一段开始执行的代码负责安装依赖，其余代码等待并复用结果；
+    组内全部代码结束后释放缓存虚拟环境。
+    """
+
+    def __init__(self, prepare: Callable[[List[str], Path], PrepareResult],
+                 release: Callable[[str], None], users: int):
+        self._prepare = prepare
+        self._release = release
+        self._users = users
+        self._result: Optional[PrepareResult] = None
+        self._lock = threading.Lock()
+
+    def get(self, imports: List[str], work_dir: Path) -> PrepareResult:
+        """返回 (是否成功, 消息, 解释器路径)，只在第一次调用时准备依赖"""
+        with self._lock:
+            if self._result is None:
+                self._result = self._prepare(imports, work_dir)
+            return self._result
+
+    def done(self):
+        """组内一段代码结束（无论是否执行），最后一段结束时释放环境"""
+        with self._lock:
+            self._users -= 1
+            if self._users > 0 or self._result is None:
+                return
+            python_executable = self._result[2]
+        if python_executable is not None:
+            self._release(python_executable)
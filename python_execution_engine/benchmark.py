@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+执行服务压测工具
+在本地启动服务（或连接已有服务），按配置的负载组合以固定并发或固定到达速率发送请求，
+输出吞吐量、延迟分位数和错误率（JSON），可与基线结果比较以发现性能回退
+
+示例:
+    python benchmark.py --concurrency 8 --duration 30
+    python benchmark.py --rate 20 --duration 60 --mix print=80,large_output=20
+    python benchmark.py --backend zygote --output zygote.json --baseline subprocess.json
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ENGINE_DIR = Path(__file__).resolve().parent
+
+# 负载类型: 代码和判断结果是否符合预期的函数（不符合计为错误）
+WORKLOADS: Dict[str, Dict] = {
+    "print": {
+        "code": "print('hello, world')",
+        "check": lambda result: result.get("success") and result.get("output") == "hello, world\n"
+    },
+    "numpy": {
+        "code": (
+            "import numpy as np\n"
+            "a = np.random.rand(300, 300)\n"
+            "print(float(np.linalg.eigvals(a @ a.T).real.max()) > 0)"
+        ),
+        "check": lambda result: result.get("success") and result.get("output") == "True\n"
+    },
+    # 超出CPU时间限制或执行超时被终止属于预期结果
+    "timeout": {
+        "code": "while True:\n    pass",
+        "check": lambda result: any(word in (result.get("error") or "") for word in ("CPU时间限制", "超时"))
+    },
+    "large_output": {
+        "code": "for i in range(20000):\n    print('x' * 100, i)",
+        "check": lambda result: result.get("success") and result.get("output", "").count("\n") == 20000
+    },
+}
+
+DEFAULT_MIX = "print=70,numpy=10,timeout=5,large_output=15"
+
+# 本地启动服务时使用的环境变量，缩短timeout负载的运行时间
+DEFAULT_SERVER_ENV = {"MAX_CPU_TIME": "2"}
+
+
+def parse_mix(text: str) -> List[Tuple[str, float]]:
+    """解析 name=weight,... 形式的负载组合"""
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in WORKLOADS:
+            raise ValueError(f"未知的负载类型: {name}（可选: {', '.join(WORKLOADS)}）")
+        value = float(weight) if weight else 1.0
+        if value > 0:
+            mix.append((name, value))
+    if not mix:
+        raise ValueError("负载组合为空")
+    return mix
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """最近秩法分位数，sorted_values需已排序"""
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), int(round(q / 100 * len(sorted_values) + 0.5))))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(latencies: List[float]) -> Dict:
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(values[-1], 4)
+    }
+
+
+class Sample:
+    """单个请求的结果"""
+
+    __slots__ = ("workload", "latency", "status", "ok", "rejected", "error")
+
+    def __init__(self, workload: str, latency: float, status: int, ok: bool, rejected: bool = False,
+                 error: str = ""):
+        self.workload = workload
+        self.latency = latency
+        self.status = status
+        self.ok = ok
+        self.rejected = rejected
+        self.error = error
+
+
+def post_json(url: str, payload: Dict, timeout: float) -> Tuple[int, Dict]:
+    """发送JSON请求，返回 (状态码, 响应体)"""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            body = json.loads(e.read())
+        except ValueError:
+            body = {}
+        return e.code, body
+
+
+def run_request(base_url: str, workload: str, timeout: float, scheduled: float,
+                coalesce: bool = False) -> Sample:
+    """执行一个请求；延迟从计划发送时间开始计算，避免协调遗漏
+
+    负载的代码都相同，默认关闭请求合并，使每个请求都实际执行
+    """
+    payload = {"code": WORKLOADS[workload]["code"], "coalesce": coalesce}
+    try:
+        status, body = post_json(f"{base_url}/execute", payload, timeout)
+    except Exception as e:
+        return Sample(workload, time.perf_counter() - scheduled, 0, False, error=str(e))
+    latency = time.perf_counter() - scheduled
+    if status in (429, 503):
+        return Sample(workload, latency, status, False, rejected=True, error=body.get("error", ""))
+    ok = status == 200 and bool(WORKLOADS[workload]["check"](body))
+    return Sample(workload, latency, status, ok, error="" if ok else str(body.get("error", ""))[:200])
+
+
+class LoadGenerator:
+    """按负载组合生成请求，支持固定并发（闭环）和固定到达速率（开环）"""
+
+    def __init__(self, base_url: str, mix: List[Tuple[str, float]], timeout: float, seed: int = 0,
+                 coalesce: bool = False):
+        self.base_url = base_url
+        self.names = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.timeout = timeout
+        self.coalesce = coalesce
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.samples: List[Sample] = []
+
+    def _next_workload(self) -> str:
+        with self._lock:
+            return self._random.choices(self.names, self.weights)[0]
+
+    def _record(self, sample: Sample):
+        with self._lock:
+            self.samples.append(sample)
+
+    def run_closed(self, concurrency: int, duration: float, max_requests: int = 0):
+        """固定并发：每个客户端收到响应后立即发送下一个请求"""
+        deadline = time.perf_counter() + duration
+        counter = iter(range(max_requests)) if max_requests else None
+
+        def client():
+            while time.perf_counter() < deadline:
+                if counter is not None and next(counter, None) is None:
+                    return
+                self._record(run_request(self.base_url, self._next_workload(), self.timeout,
+                                         time.perf_counter(), self.coalesce))
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_open(self, rate: float, duration: float, max_in_flight: int, max_requests: int = 0):
+        """固定到达速率：按计划时间发送请求，不等待之前的响应"""
+        start = time.perf_counter()
+        total = int(rate * duration)
+        if max_requests:
+            total = min(total, max_requests)
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for index in range(total):
+                scheduled = start + index / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(
+                    lambda workload, at: self._record(
+                        run_request(self.base_url, workload, self.timeout, at, self.coalesce)
+                    ),
+                    self._next_workload(), scheduled
+                )
+
+
+def build_report(samples: List[Sample], elapsed: float, config: Dict) -> Dict:
+    """汇总为JSON报告"""
+    def summarize(group: List[Sample]) -> Dict:
+        errors = sum(1 for s in group if not s.ok and not s.rejected)
+        rejected = sum(1 for s in group if s.rejected)
+        return {
+            "requests": len(group),
+            "errors": errors,
+            "rejected": rejected,
+            "error_rate": round(errors / len(group), 4) if group else 0.0,
+            "rejection_rate": round(rejected / len(group), 4) if group else 0.0,
+            # 延迟只统计被服务处理的请求（不含429/503）
+            "latency": latency_summary([s.latency for s in group if not s.rejected])
+        }
+
+    overall = summarize(samples)
+    overall["throughput"] = round(sum(1 for s in samples if not s.rejected) / elapsed, 3) if elapsed else 0.0
+    overall["duration"] = round(elapsed, 3)
+
+    status_codes: Dict[str, int] = {}
+    for sample in samples:
+        status_codes[str(sample.status)] = status_codes.get(str(sample.status), 0) + 1
+
+    error_examples = []
+    for sample in samples:
+        if not sample.ok and sample.error and len(error_examples) < 5:
+            error_examples.append({"workload": sample.workload, "status": sample.status, "error": sample.error})
+
+    return {
+        "config": config,
+        "summary": overall,
+        "workloads": {
+            name: summarize([s for s in samples if s.workload == name])
+            for name in sorted({s.workload for s in samples})
+        },
+        "status_codes": status_codes,
+        "error_examples": error_examples
+    }
+
+
+def compare_reports(report: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """与基线比较，返回超出允许回退比例的指标说明"""
+    regressions = []
+    current, previous = report["summary"], baseline["summary"]
+    for key in ("p50", "p95", "p99"):
+        new, old = current["latency"].get(key), previous["latency"].get(key)
+        if new is not None and old and new > old * (1 + max_regression):
+            regressions.append(f"延迟{key}: {old}s -> {new}s")
+    if previous.get("throughput") and current["throughput"] < previous["throughput"] * (1 - max_regression):
+        regressions.append(f"吞吐量: {previous['throughput']} -> {current['throughput']} req/s")
+    if current["error_rate"] > previous["error_rate"] + max_regression / 10:
+        regressions.append(f"错误率: {previous['error_rate']} -> {current['error_rate']}")
+    return regressions
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """在子进程中启动执行服务"""
+
+    def __init__(self, env: Dict[str, str], log_file: Optional[str] = None):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {**os.environ, **DEFAULT_SERVER_ENV, **env, "HOST": "127.0.0.1", "PORT": str(self.port)}
+        self.log_file = log_file
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, ready_timeout: float = 60):
+        log = open(self.log_file, "ab") if self.log_file else subprocess.DEVNULL
+        self.process = subprocess.Popen(
+            [sys.executable, str(ENGINE_DIR / "run.py")],
+            cwd=str(ENGINE_DIR),
+            env=self.env,
+            stdout=log,
+            stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + ready_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"服务启动失败，退出码: {self.process.returncode}")
+            try:
+                with urllib.request.urlopen(f"{self.url}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("等待服务启动超时")
+
+    def stop(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def fetch_json(url: str) -> Optional[Dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.loads(response.read())
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+def parse_env(pairs: List[str]) -> Dict[str, str]:
+    env = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"环境变量格式应为KEY=VALUE: {pair}")
+        env[key] = value
+    return env
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Python执行服务压测工具")
+    parser.add_argument("--url", help="已运行服务的地址；不指定时在本地启动服务")
+    parser.add_argument("--backend", choices=["subprocess", "pool", "zygote"],
+                        help="本地启动服务时使用的执行后端（EXECUTION_BACKEND）")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="本地启动服务时额外设置的环境变量，可重复")
+    parser.add_argument("--server-log", help="本地服务的日志文件")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"负载组合，默认 {DEFAULT_MIX}")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=4, help="固定并发数（默认4）")
+    mode.add_argument("--rate", type=float, help="固定到达速率（请求/秒），指定时使用开环模式")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="开环模式下同时等待响应的请求数上限")
+    parser.add_argument("--duration", type=float, default=30, help="压测时长（秒）")
+    parser.add_argument("--requests", type=int, default=0, help="最多发送的请求数，0表示只受时长限制")
+    parser.add_argument("--warmup", type=int, default=5, help="正式计时前按负载组合发送的预热请求数")
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求的超时时间（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="负载选择的随机种子")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="允许服务合并相同的并发请求（默认关闭，每个请求都实际执行）")
+    parser.add_argument("--output", help="报告写入的文件，默认输出到标准输出")
+    parser.add_argument("--baseline", help="基线报告文件，超出允许的回退时返回非零退出码")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="允许的回退比例（默认0.1）")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+        server_env = parse_env(args.env)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.backend:
+        server_env["EXECUTION_BACKEND"] = args.backend
+
+    server = None
+    base_url = args.url.rstrip("/") if args.url else None
+    if base_url is None:
+        server = LocalServer(server_env, args.server_log)
+        print(f"启动本地服务: {server.url}", file=sys.stderr)
+        server.start()
+        base_url = server.url
+
+    try:
+        generator = LoadGenerator(base_url, mix, args.timeout, args.seed, args.coalesce)
+        for _ in range(args.warmup):
+            run_request(base_url, generator._next_workload(), args.timeout, time.perf_counter(), args.coalesce)
+
+        mode_desc = f"开环 {args.rate} req/s" if args.rate else f"闭环 并发{args.concurrency}"
+        print(f"开始压测: {mode_desc}, 时长{args.duration}秒, 负载组合 {args.mix}", file=sys.stderr)
+        started = time.perf_counter()
+        if args.rate:
+            generator.run_open(args.rate, args.duration, args.max_in_flight, args.requests)
+        else:
+            generator.run_closed(args.concurrency, args.duration, args.requests)
+        elapsed = time.perf_counter() - started
+
+        server_config = fetch_json(f"{base_url}/config") or {}
+        config = {
+            "url": base_url if server is None else "local",
+            "execution_backend": server_config.get("execution_backend"),
+            "max_concurrent_executions": server_config.get("max_concurrent_executions"),
+            "server_env": server_env,
+            "mix": dict(mix),
+            "mode": "open" if args.rate else "closed",
+            "rate": args.rate,
+            "concurrency": None if args.rate else args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "coalesce": args.coalesce,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        }
+        report = build_report(generator.samples, elapsed, config)
+    finally:
+        if server is not None:
+            server.stop()
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.max_regression)
+        report["regressions"] = regressions
+        for line in regressions:
+            print(f"性能回退: {line}", file=sys.stderr)
+        if regressions:
+            exit_code = 1
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"报告已写入: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+进行中请求合并
+嵌入示例代码的页面被大量访问时，同一秒内会收到很多完全相同的 /execute 请求。
+相同代码和选项的请求在已有执行进行中时不再启动新进程，而是等待该执行完成并共享其结果。
+"""
+
+import asyncio
+import threading
+from typing import Callable, Dict, Optional, Set, Tuple
+
+
+class Flight:
+    """一次进行中的执行，由先到的请求（leader）运行，后到的相同请求等待其结果"""
+
+    def __init__(self, key: str, leader_id: str):
+        self.key = key
+        self.leader_id = leader_id
+        self.followers = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._done = False
+        self._result: Optional[Dict] = None
+        # 被停止的等待者，不再等待leader的结果
+        self._stopped: Set[str] = set()
+        # 异步等待者的回调：(结果, 是否被停止)
+        self._callbacks: Dict[str, Callable[[Optional[Dict], bool], None]] = {}
+
+    def _complete(self, result: Optional[Dict]):
+        with self._lock:
+            self._result = result
+            self._done = True
+            self._changed.notify_all()
+            callbacks, self._callbacks = self._callbacks, {}
+        for callback in callbacks.values():
+            callback(result, False)
+
+    def _stop(self, execution_id: str) -> bool:
+        """停止一个等待者，leader已完成时返回False"""
+        with self._lock:
+            if self._done or execution_id in self._stopped:
+                return False
+            self._stopped.add(execution_id)
+            self._changed.notify_all()
+            callback = self._callbacks.pop(execution_id, None)
+        if callback is not None:
+            callback(None, True)
+        return True
+
+    @staticmethod
+    def _copy(result: Optional[Dict]) -> Optional[Dict]:
+        # 各请求只修改顶层字段（execution_id、timings等），浅拷贝即可
+        return dict(result) if result is not None else None
+
+    def wait(self, execution_id: str, timeout: Optional[float] = None) -> Tuple[Optional[Dict], bool]:
+        """等待leader完成，返回 (结果副本, 等待者是否被停止)
+
+        leader失败（如被准入控制拒绝、被停止）时结果为None。
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._done or execution_id in self._stopped, timeout)
+            if execution_id in self._stopped:
+                return None, True
+            return self._copy(self._result), False
+
+    async def wait_async(self, execution_id: str) -> Tuple[Optional[Dict], bool]:
+        """wait()的asyncio版本，等待期间不占用线程"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(outcome: Tuple[Optional[Dict], bool]):
+            if not future.done():
+                future.set_result(outcome)
+
+        with self._lock:
+            if execution_id in self._stopped:
+                return None, True
+            if self._done:
+                return self._copy(self._result), False
+            self._callbacks[execution_id] = \
+                lambda result, stopped: loop.call_soon_threadsafe(resolve, (result, stopped))
+        try:
+            result, stopped = await future
+        finally:
+            with self._lock:
+                self._callbacks.pop(execution_id, None)
+        return self._copy(result), stopped
+
+
+class InFlightCoalescer:
+    """按键合并进行中的执行
+
+    - join() 返回 (Flight, 是否为leader)；键不存在时调用方成为leader并负责执行
+    - leader完成后调用finish()，把结果交给所有等待者；传入None表示执行失败或被停止，
+      等待者应重新join()，其中一个成为新的leader
+    - stop() 停止一个等待中的请求，其他等待者和leader不受影响
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        # 等待者的execution_id -> 所等待的Flight，用于停止等待者
+        self._waiting: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.leaders = 0
+        self.coalesced = 0
+        self.retried = 0
+
+    def join(self, key: str, execution_id: str) -> Tuple[Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+                self._waiting[execution_id] = flight
+                return flight, False
+            flight = Flight(key, execution_id)
+            self._flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, flight: Flight, result: Optional[Dict]):
+        """结束一次执行；result应为不再修改的快照"""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            for execution_id in [i for i, waiting in self._waiting.items() if waiting is flight]:
+                del self._waiting[execution_id]
+            if result is None:
+                # 这些等待者会重新执行
+                self.coalesced -= flight.followers
+                self.retried += flight.followers
+        flight._complete(result)
+
+    def stop(self, execution_id: str) -> bool:
+        """停止一个等待其他请求结果的请求，不是等待者时返回False"""
+        with self._lock:
+            flight = self._waiting.pop(execution_id, None)
+            if flight is None or not flight._stop(execution_id):
+                return False
+            flight.followers -= 1
+            self.coalesced -= 1
+            return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "waiting": sum(flight.followers for flight in self._flights.values()),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "retried": self.retried
+            }
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+代码静态分析
+基于AST一次遍历完成安全检查和导入提取，并缓存分析结果
+"""
+
+import ast
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+class CodeReport(NamedTuple):
+    """代码分析结果"""
+    is_safe: bool
+    message: str
+    # 代码导入的顶层模块名（排序去重，不含相对导入）
+    imports: Tuple[str, ...] = ()
+    # 不读取时间、随机数、网络和文件等外部状态，相同代码的结果可以共享
+    side_effect_free: bool = False
+
+
+def code_hash(code: str) -> str:
+    """代码内容的哈希，用作缓存键"""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def imported_modules(node: ast.AST) -> List[str]:
+    """返回import节点导入的顶层模块名"""
+    if isinstance(node, ast.Import):
+        return [alias.name.split(".")[0] for alias in node.names]
+    if isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+        return [node.module.split(".")[0]]
+    return []
+
+
+def extract_imports(code: str) -> List[str]:
+    """从源码的AST中提取导入的顶层模块名，语法错误时返回空列表"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+
+    imports: Set[str] = set()
+    for node in ast.walk(tree):
+        imports.update(imported_modules(node))
+    return sorted(imports)
+
+
+class CodeSafetyAnalyzer:
+    """基于AST的代码安全分析器
+
+    解析一次源码，在同一次遍历中检查函数调用、模块导入和属性访问，
+    结果按代码哈希缓存在有界LRU中。
+    """
+
+    # open()中表示写入的模式字符
+    WRITE_MODE_CHARS = set("wax+")
+    # 形如open()模式参数的字符串
+    MODE_PATTERN = re.compile(r"^[rwxabtU+]+$")
+
+    # 结果依赖外部状态（时间、随机数、网络、文件系统、线程调度）的模块
+    EFFECTFUL_MODULES = frozenset({
+        "random", "secrets", "uuid", "time", "datetime", "socket", "ssl", "select", "urllib", "http",
+        "requests", "httpx", "aiohttp", "ftplib", "smtplib", "sqlite3", "tempfile", "threading",
+        "multiprocessing", "concurrent", "asyncio", "signal", "pathlib", "glob", "io", "webbrowser", "ctypes",
+    })
+    # 读取外部状态的内置函数；object()的repr包含内存地址，set()/frozenset()中字符串的顺序随哈希种子变化
+    EFFECTFUL_CALLS = frozenset({"open", "input", "breakpoint", "hash", "id", "object", "set", "frozenset"})
+    # 任意对象上访问（或作为函数直接调用）即视为有副作用的名称，如 np.random.rand()、pd.Timestamp.now()、
+    # scipy.stats.norm.rvs()、torch.normal()、df.sample()
+    EFFECTFUL_ATTRIBUTES = frozenset({
+        "random", "now", "today", "utcnow", "urandom", "read_csv", "read_json",
+        "rvs", "shuffle", "permutation", "seed", "manual_seed", "default_rng", "choice", "choices", "sample",
+        "normal", "uniform", "bernoulli", "multinomial", "poisson",
+    })
+    # 以此开头的名称视为随机数函数，如 rand、randn、randint、randperm
+    RANDOM_PREFIX = "rand"
+
+    def __init__(self, dangerous_calls: Iterable[str], dangerous_modules: Iterable[str],
+                 dangerous_attributes: Iterable[str], cache_size: int = 1024):
+        self.dangerous_calls: Set[str] = set(dangerous_calls)
+        self.dangerous_modules: Set[str] = set(dangerous_modules)
+        # 形如 "os.system" 表示特定属性，"__globals__" 表示任意对象上的该属性
+        self.dangerous_attributes: Set[str] = set(dangerous_attributes)
+        self.cache_size = cache_size
+
+        self._cache: "OrderedDict[str, CodeReport]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def analyze(self, code: str) -> CodeReport:
+        """分析代码，相同代码直接返回缓存结果"""
+        key = code_hash(code)
+        with self._lock:
+            report = self._cache.get(key)
+            if report is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return report
+            self.cache_misses += 1
+
+        report = self._analyze(code)
+
+        with self._lock:
+            self._cache[key] = report
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return report
+
+    def _analyze(self, code: str) -> CodeReport:
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            return CodeReport(False, f"语法错误: {e.msg} (第{e.lineno}行)")
+        except ValueError as e:
+            # 例如源码中包含空字节
+            return CodeReport(False, f"语法错误: {e}")
+
+        imports: Set[str] = set()
+        side_effect_free = True
+        for node in ast.walk(tree):
+            problem = self._check_node(node)
+            if problem:
+                return CodeReport(False, f"{problem} (第{getattr(node, 'lineno', '?')}行)")
+            imports.update(imported_modules(node))
+            if side_effect_free and self._has_side_effect(node):
+                side_effect_free = False
+
+        return CodeReport(True, "代码安全检查通过", tuple(sorted(imports)), side_effect_free)
+
+    def _check_node(self, node: ast.AST) -> Optional[str]:
+        """检查单个节点，发现问题时返回描述"""
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                module = alias.name.split(".")[0]
+                if module in self.dangerous_modules:
+                    return f"检测到危险模块导入: {alias.name}"
+
+        elif isinstance(node, ast.ImportFrom):
+            module = (node.module or "").split(".")[0]
+            if node.level == 0 and module in self.dangerous_modules:
+                return f"检测到危险模块导入: {node.module}"
+
+        elif isinstance(node, ast.Call):
+            # builtins.exec(...)、io.open(...) 等通过属性调用同名函数的写法同样检查
+            if isinstance(node.func, ast.Name):
+                name = node.func.id
+            elif isinstance(node.func, ast.Attribute):
+                name = node.func.attr
+            else:
+                name = None
+            if name in self.dangerous_calls:
+                return f"检测到危险函数调用: {name}"
+            if name == "open" and not self._is_read_only_open(node):
+                return "不允许写入文件操作"
+
+        elif isinstance(node, ast.Attribute):
+            if node.attr in self.dangerous_attributes:
+                return f"检测到危险属性访问: {node.attr}"
+            if isinstance(node.value, ast.Name):
+                dotted = f"{node.value.id}.{node.attr}"
+                if dotted in self.dangerous_attributes or f"{node.value.id}.*" in self.dangerous_attributes:
+                    return f"检测到危险属性访问: {dotted}"
+
+        elif isinstance(node, ast.Name):
+            if node.id in self.dangerous_attributes:
+                return f"检测到危险名称引用: {node.id}"
+
+        return None
+
+    def _has_side_effect(self, node: ast.AST) -> bool:
+        """节点是否读取外部状态（只用于判断结果能否共享，不影响安全检查）"""
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if any(module in self.EFFECTFUL_MODULES for module in imported_modules(node)):
+                return True
+            # import numpy.random / from numpy import random
+            return any(
+                part in self.EFFECTFUL_ATTRIBUTES
+                for alias in node.names for part in alias.name.split(".")
+            )
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            # from torch import rand / from scipy.stats import norm 之后直接调用
+            return (node.func.id in self.EFFECTFUL_CALLS or node.func.id in self.EFFECTFUL_ATTRIBUTES
+                    or node.func.id.startswith(self.RANDOM_PREFIX))
+        if isinstance(node, ast.Attribute):
+            return node.attr in self.EFFECTFUL_ATTRIBUTES or node.attr.startswith(self.RANDOM_PREFIX)
+        if isinstance(node, (ast.Set, ast.SetComp)):
+            # 集合中字符串的迭代顺序随每个进程的哈希种子变化
+            return True
+        if isinstance(node, ast.ClassDef):
+            # 未定义__repr__的类，其实例的默认repr包含内存地址
+            return not self._defines_repr(node)
+        return False
+
+    @staticmethod
+    def _defines_repr(node: ast.ClassDef) -> bool:
+        """类是否定义了__repr__（包括dataclass生成的）"""
+        for decorator in node.decorator_list:
+            target = decorator.func if isinstance(decorator, ast.Call) else decorator
+            name = target.attr if isinstance(target, ast.Attribute) else getattr(target, "id", None)
+            if name == "dataclass":
+                return True
+        return any(
+            isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == "__repr__"
+            for item in node.body
+        )
+
+    def _is_read_only_open(self, node: ast.Call) -> bool:
+        """open()调用是否为只读模式（模式必须是字面量）
+
+        Path.open(mode) 这类方法的第一个参数就是模式，属性调用的第一个参数为模式字符串时按模式检查。
+        """
+        mode = None
+        if any(isinstance(arg, ast.Starred) for arg in node.args):
+            # *args 无法静态判断
+            return False
+        if len(node.args) >= 2:
+            mode = node.args[1]
+        elif (isinstance(node.func, ast.Attribute) and node.args
+              and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)
+              and self.MODE_PATTERN.match(node.args[0].value)):
+            mode = node.args[0]
+        for keyword in node.keywords:
+            if keyword.arg == "mode":
+                mode = keyword.value
+            elif keyword.arg is None:
+                # **kwargs 无法静态判断
+                return False
+
+        if mode is None:
+            # 默认模式为只读
+            return True
+        if isinstance(mode, ast.Constant) and isinstance(mode.value, str):
+            return not (set(mode.value) & self.WRITE_MODE_CHARS)
+        return False
+
+    def stats(self) -> dict:
+        """分析缓存状态"""
+        with self._lock:
+            return {
+                "cache_size": len(self._cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses
+            }
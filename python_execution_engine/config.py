@@ -11,6 +11,85 @@ class Config:
     # 执行配置
     MAX_EXECUTION_TIME = int(os.environ.get('MAX_EXECUTION_TIME', 30))
     MAX_MEMORY_MB = int(os.environ.get('MAX_MEMORY_MB', 512))
+    MAX_CPU_TIME = int(os.environ.get('MAX_CPU_TIME', 30))
+    MAX_PROCESSES = int(os.environ.get('MAX_PROCESSES', 256))
+    MAX_FILE_SIZE_MB = int(os.environ.get('MAX_FILE_SIZE_MB', 64))
+    # 委派给服务的cgroup v2目录，留空时只使用rlimit
+    CGROUP_PARENT = os.environ.get('CGROUP_PARENT', '')
+    
+    # 执行后端: subprocess、pool（预热进程池）或 zygote（预加载fork服务）
+    EXECUTION_BACKEND = os.environ.get('EXECUTION_BACKEND', 'subprocess')
+    WORKER_POOL_SIZE = int(os.environ.get('WORKER_POOL_SIZE', 4))
+    ZYGOTE_PRELOAD = os.environ.get('ZYGOTE_PRELOAD', 'numpy,pandas,matplotlib')
+    
+    # 包安装批量合并窗口（秒）
+    INSTALL_BATCH_WINDOW = float(os.environ.get('INSTALL_BATCH_WINDOW', 0.05))
+    
+    # 依赖环境模式: global 或 venv（按依赖集合缓存虚拟环境）
+    PACKAGE_ENV_MODE = os.environ.get('PACKAGE_ENV_MODE', 'global')
+    VENV_CACHE_MAX_MB = int(os.environ.get('VENV_CACHE_MAX_MB', 2048))
+    
+    # 准入控制: 同时运行的执行数（0表示按CPU核数和内存自动估算）、等待队列长度和超时、单客户端并发上限
+    MAX_CONCURRENT_EXECUTIONS = int(os.environ.get('MAX_CONCURRENT_EXECUTIONS', 0))
+    EXECUTION_QUEUE_SIZE = int(os.environ.get('EXECUTION_QUEUE_SIZE', 50))
+    EXECUTION_QUEUE_TIMEOUT = float(os.environ.get('EXECUTION_QUEUE_TIMEOUT', 10))
+    PER_CLIENT_LIMIT = int(os.environ.get('PER_CLIENT_LIMIT', 0))
+    
+    # 批量执行单次最多提交的代码段数
+    MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 100))
+    
+    # 判题模式: 每次提交最多使用的判题进程数、默认单用例时间限制（秒）和最多用例数
+    JUDGE_WORKERS = int(os.environ.get('JUDGE_WORKERS', 2))
+    JUDGE_TIME_LIMIT = float(os.environ.get('JUDGE_TIME_LIMIT', 2))
+    MAX_JUDGE_CASES = int(os.environ.get('MAX_JUDGE_CASES', 200))
+    
+    # 慢请求trace: 耗时超过TRACE_SLOW_SECONDS秒的请求把Chrome trace写入TRACE_DIR（为空时不保存）
+    TRACE_DIR = os.environ.get('TRACE_DIR', '')
+    TRACE_SLOW_SECONDS = float(os.environ.get('TRACE_SLOW_SECONDS', 5))
+    
+    # /execute流量记录: 日志文件（为空时关闭）、是否匿名化和抽样比例
+    TRAFFIC_LOG = os.environ.get('TRAFFIC_LOG', '')
+    TRAFFIC_LOG_ANONYMIZE = os.environ.get('TRAFFIC_LOG_ANONYMIZE', 'false').lower() == 'true'
+    TRAFFIC_LOG_SAMPLE_RATE = float(os.environ.get('TRAFFIC_LOG_SAMPLE_RATE', 1.0))
+    
+    # 跨worker执行登记表: SQLite文件（默认BASE_DIR/executions.db，设为空时关闭）和已结束记录的保留时间（秒）
+    EXECUTION_REGISTRY = os.environ.get(
+        'EXECUTION_REGISTRY',
+        os.path.join(os.environ.get('BASE_DIR', '/tmp/python_execution'), 'executions.db')
+    )
+    EXECUTION_REGISTRY_RETENTION = float(os.environ.get('EXECUTION_REGISTRY_RETENTION', 300))
+    
+    # 执行输出: 内存中保留的输出上限（KB），超出后溢出到OUTPUT_DIR（默认BASE_DIR/outputs），
+    # 响应中只返回首尾各OUTPUT_PREVIEW_KB的预览；溢出文件的大小上限（MB）和保留时间（秒）
+    OUTPUT_MEMORY_LIMIT_KB = int(os.environ.get('OUTPUT_MEMORY_LIMIT_KB', 1024))
+    OUTPUT_PREVIEW_KB = int(os.environ.get('OUTPUT_PREVIEW_KB', 16))
+    OUTPUT_DIR = os.environ.get('OUTPUT_DIR', '')
+    OUTPUT_MAX_MB = int(os.environ.get('OUTPUT_MAX_MB', 256))
+    OUTPUT_RETENTION = float(os.environ.get('OUTPUT_RETENTION', 3600))
+    
+    # 进行中的相同请求共享一次执行（默认只合并无副作用的代码）
+    COALESCE_EXECUTIONS = os.environ.get('COALESCE_EXECUTIONS', 'false').lower() == 'true'
+    
+    # 结果缓存: 内存预算（MB，为0时关闭）、磁盘预算（MB）、目录（默认BASE_DIR/result-cache）和有效期（秒）
+    RESULT_CACHE_MB = int(os.environ.get('RESULT_CACHE_MB', 64))
+    RESULT_CACHE_DISK_MB = int(os.environ.get('RESULT_CACHE_DISK_MB', 512))
+    RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', '')
+    RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+    
+    # 执行产物: 产物目录（默认BASE_DIR/artifacts）、总大小预算（MB）和单次执行最多收集的文件数
+    ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', '')
+    ARTIFACT_STORE_MB = int(os.environ.get('ARTIFACT_STORE_MB', 512))
+    ARTIFACT_MAX_FILES = int(os.environ.get('ARTIFACT_MAX_FILES', 20))
+    
+    # 有状态会话: 会话数上限、空闲回收时间（秒）和单个会话的内存上限（MB）
+    MAX_SESSIONS = int(os.environ.get('MAX_SESSIONS', 20))
+    SESSION_IDLE_TTL = float(os.environ.get('SESSION_IDLE_TTL', 1800))
+    SESSION_MAX_MEMORY_MB = int(os.environ.get('SESSION_MAX_MEMORY_MB', MAX_MEMORY_MB))
+    
+    # 异步任务配置
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+    JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 100))
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
     
     # 服务配置
     HOST = os.environ.get('HOST', '0.0.0.0')
@@ -20,8 +99,14 @@ class Config:
     # 工作目录
     BASE_DIR = os.environ.get('BASE_DIR', '/tmp/python_execution')
     
+    # 沙箱工作目录池: 根目录（默认/dev/shm/python_execution）、目录数（0表示并发上限的两倍）和单目录空间配额
+    SANDBOX_ROOT = os.environ.get('SANDBOX_ROOT', '')
+    SANDBOX_POOL_SIZE = int(os.environ.get('SANDBOX_POOL_SIZE', 0))
+    SANDBOX_QUOTA_MB = int(os.environ.get('SANDBOX_QUOTA_MB', 64))
+    
     # 安全配置
     ALLOWED_ORIGINS = os.environ.get('ALLOWED_ORIGINS', '*').split(',')
+    SAFETY_CACHE_SIZE = int(os.environ.get('SAFETY_CACHE_SIZE', 1024))
 
 class ProductionConfig(Config):
     """生产环境配置"""
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+异步执行任务
+提交后立即返回execution_id，由固定数量的工作线程从有界优先队列中取出执行，
+结果在保留期内可查询
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+
+
+class JobManager:
+    """异步任务管理器"""
+
+    def __init__(self, execute: Callable[[str, str, Optional[str], Callable[[], bool]], Dict],
+                 stop: Callable[[str], bool],
+                 workers: int = 4, max_queue: int = 100, result_ttl: int = 3600):
+        self.execute = execute
+        self.stop = stop
+        self.result_ttl = result_ttl
+
+        self._queue = queue.PriorityQueue(maxsize=max_queue)
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+        self._workers = []
+        for i in range(max(1, workers)):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _purge_expired(self):
+        """清理超过保留期的已结束任务（调用方持有锁）"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and now - job["finished_at"] > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, code: str, execution_id: str, priority: int = 0,
+               client_id: Optional[str] = None) -> Tuple[Dict, bool]:
+        """提交任务，返回 (任务信息, 是否新建)
+
+        相同execution_id的任务已存在时直接返回已有任务，不会重复执行。
+        client_id随任务传给execute，执行时与同步请求一样按客户端分配执行名额。
+        队列已满时抛出queue.Full。
+        """
+        with self._lock:
+            self._purge_expired()
+            existing = self._jobs.get(execution_id)
+            if existing is not None:
+                return self._public(existing), False
+
+            job = {
+                "execution_id": execution_id,
+                "status": QUEUED,
+                "priority": priority,
+                "code": code,
+                "client_id": client_id,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None
+            }
+            # 数值越小优先级越高，同优先级按提交顺序
+            self._queue.put_nowait((priority, next(self._sequence), execution_id))
+            self._jobs[execution_id] = job
+            return self._public(job), True
+
+    def get(self, execution_id: str) -> Optional[Dict]:
+        """查询任务状态和结果"""
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(execution_id)
+            return self._public(job) if job is not None else None
+
+    def cancel(self, execution_id: str) -> bool:
+        """取消排队中或正在运行的任务
+
+        正在运行的任务可能还在等待执行名额或安装依赖，此时没有可停止的进程：
+        execute通过传入的cancelled检查取消状态，不再启动子进程。
+        运行中的任务在工作线程返回后才记录结束时间，结果不保存。
+        """
+        with self._lock:
+            job = self._jobs.get(execution_id)
+            if job is None or job["status"] in (COMPLETED, CANCELLED):
+                return False
+            was_running = job["status"] == RUNNING
+            job["status"] = CANCELLED
+            if not was_running:
+                job["finished_at"] = time.time()
+
+        if was_running:
+            self.stop(execution_id)
+        return True
+
+    def _worker_loop(self):
+        while True:
+            _, _, execution_id = self._queue.get()
+            try:
+                with self._lock:
+                    job = self._jobs.get(execution_id)
+                    if job is None or job["status"] != QUEUED:
+                        continue
+                    job["status"] = RUNNING
+                    job["started_at"] = time.time()
+                    code = job.pop("code")
+                    client_id = job.pop("client_id")
+
+                def cancelled(job=job):
+                    return job["status"] == CANCELLED
+
+                try:
+                    result = self.execute(code, execution_id, client_id, cancelled)
+                except Exception as e:
+                    logger.error(f"异步任务执行异常: {execution_id}: {e}")
+                    result = {
+                        "success": False,
+                        "output": "",
+                        "error": f"服务器内部错误: {str(e)}",
+                        "execution_id": execution_id
+                    }
+
+                with self._lock:
+                    if job["status"] == RUNNING:
+                        job["status"] = COMPLETED
+                        job["result"] = result
+                    job["finished_at"] = time.time()
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _public(job: Dict) -> Dict:
+        """对外返回的任务信息（不含代码和客户端标识）"""
+        info = {key: value for key, value in job.items() if key not in ("code", "client_id")}
+        if job["started_at"] is not None:
+            info["queue_wait_time"] = round(job["started_at"] - job["submitted_at"], 3)
+        return info
+
+    def stats(self) -> Dict:
+        """任务队列状态"""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, COMPLETED: 0, CANCELLED: 0}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "workers": len(self._workers),
+                "jobs": counts
+            }
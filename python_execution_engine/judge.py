@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+判题模式
+同一段代码对多组标准输入运行并与期望输出比较。判题进程只编译一次代码，
+每组用例fork出独立的子进程执行，用例之间互不影响，也不再为每组用例启动解释器
+"""
+
+import atexit
+import json
+import math
+import os
+import resource
+import selectors
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from limits import rusage_to_dict
+
+JUDGE_SCRIPT = Path(__file__).resolve()
+
+# 单个用例允许的最大输出字节数，超出判为OLE
+MAX_CASE_OUTPUT = 1024 * 1024
+# 返回的标准错误只保留末尾部分
+MAX_ERROR_PREVIEW = 2000
+# 墙钟时间上限为时间限制的倍数（等待I/O等不消耗CPU的情况）
+WALL_TIME_FACTOR = 2
+
+# 判题结果
+ACCEPTED = "AC"
+WRONG_ANSWER = "WA"
+TIME_LIMIT_EXCEEDED = "TLE"
+MEMORY_LIMIT_EXCEEDED = "MLE"
+OUTPUT_LIMIT_EXCEEDED = "OLE"
+RUNTIME_ERROR = "RE"
+COMPILE_ERROR = "CE"
+SYSTEM_ERROR = "SE"
+
+
+# ---------------------------------------------------------------------------
+# 判题进程
+# ---------------------------------------------------------------------------
+
+def _run_case_child(code, script_path: str, input_fd: int, out_fd: int, err_fd: int,
+                    close_fds: List[int], time_limit: float) -> int:
+    """fork出的子进程：连接标准输入输出并运行已编译的代码"""
+    import random
+    import sandbox_runner
+
+    # 独立进程组，超时时连同其子进程一起终止
+    os.setsid()
+    os.dup2(input_fd, 0)
+    os.dup2(out_fd, 1)
+    os.dup2(err_fd, 2)
+    for fd in set(close_fds + [input_fd, out_fd, err_fd]):
+        os.close(fd)
+    # 丢弃父进程标准输入对象中预读的协议数据
+    sys.stdin = open(0, "r", closefd=False)
+
+    # 子进程的CPU时间从0开始计算
+    soft = max(1, math.ceil(time_limit))
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+        hard = min(soft + 1, hard)
+    else:
+        hard = soft + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    random.seed()
+    exit_code = sandbox_runner.run_script(script_path, code)
+    atexit._run_exitfuncs()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return exit_code
+
+
+def _run_case(code, script_path: str, protocol_fd: int, case: Dict) -> Dict:
+    """运行一组用例，返回原始结果"""
+    time_limit = float(case["time_limit"])
+
+    with tempfile.TemporaryFile() as stdin_file:
+        stdin_file.write(case.get("input", "").encode("utf-8"))
+        stdin_file.flush()
+        stdin_file.seek(0)
+
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        started = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                exit_code = _run_case_child(
+                    code, script_path, stdin_file.fileno(), out_w, err_w,
+                    [out_r, err_r, protocol_fd], time_limit
+                )
+            finally:
+                os._exit(exit_code)
+
+    os.close(out_w)
+    os.close(err_w)
+
+    buffers = {out_r: bytearray(), err_r: bytearray()}
+    selector = selectors.DefaultSelector()
+    for fd in buffers:
+        os.set_blocking(fd, False)
+        selector.register(fd, selectors.EVENT_READ)
+
+    deadline = started + time_limit * WALL_TIME_FACTOR
+    timed_out = False
+    output_limit_exceeded = False
+    try:
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                try:
+                    data = os.read(key.fd, 65536)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    selector.unregister(key.fd)
+                    continue
+                buffers[key.fd] += data
+            if len(buffers[out_r]) > MAX_CASE_OUTPUT:
+                output_limit_exceeded = True
+                break
+    finally:
+        selector.close()
+        os.close(out_r)
+        os.close(err_r)
+
+    if timed_out or output_limit_exceeded:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    _, status, rusage = os.wait4(pid, 0)
+    wall_time = time.monotonic() - started
+    # 清理用例进程遗留的后台子进程
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+    usage = rusage_to_dict(rusage)
+    stderr = bytes(buffers[err_r]).decode("utf-8", errors="replace")
+    return {
+        "stdout": bytes(buffers[out_r][:MAX_CASE_OUTPUT]).decode("utf-8", errors="replace"),
+        "stderr": stderr[-MAX_ERROR_PREVIEW:],
+        "returncode": os.waitstatus_to_exitcode(status),
+        "time": usage["user_time"] + usage["sys_time"],
+        "wall_time": wall_time,
+        "max_rss_kb": usage["max_rss_kb"],
+        "timed_out": timed_out,
+        "output_limit_exceeded": output_limit_exceeded
+    }
+
+
+def serve() -> int:
+    """判题进程主循环
+
+    第一行消息为 {"script", "cwd"}，编译后回复 {"ready": true} 或 {"error"}；
+    之后每行消息为一组用例 {"input", "time_limit"}，回复一行运行结果。
+    """
+    import sandbox_runner  # noqa: F401  预先导入，用例子进程无需再加载
+
+    # 协议使用复制出的描述符，标准输出指向/dev/null，避免意外输出破坏协议
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+    def reply(message: Dict):
+        protocol.write(json.dumps(message, ensure_ascii=False) + "\n")
+        protocol.flush()
+
+    line = sys.stdin.readline()
+    if not line:
+        return 0
+    job = json.loads(line)
+    script_path = os.path.abspath(job["script"])
+    os.chdir(job["cwd"])
+    sys.argv = [script_path]
+    sys.path[0] = os.path.dirname(script_path)
+
+    try:
+        with open(script_path, encoding="utf-8") as f:
+            code = compile(f.read(), script_path, "exec")
+    except (SyntaxError, ValueError) as e:
+        reply({"error": f"编译错误: {e}"})
+        return 1
+    reply({"ready": True})
+
+    for line in sys.stdin:
+        reply(_run_case(code, script_path, protocol.fileno(), json.loads(line)))
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# 引擎侧
+# ---------------------------------------------------------------------------
+
+class JudgeWorker:
+    """判题进程句柄，一个进程依次运行分配给它的多组用例"""
+
+    def __init__(self, python_executable: str, work_dir: Path, popen_class=subprocess.Popen,
+                 popen_kwargs: Optional[Dict] = None):
+        self.process = popen_class(
+            [python_executable, str(JUDGE_SCRIPT), "--serve"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=str(work_dir),
+            **(popen_kwargs or {})
+        )
+
+    def _request(self, message: Dict, timeout: float) -> Dict:
+        self.process.stdin.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.process.stdin.flush()
+
+        # 每次请求只有一行回复，可读后readline不会长时间阻塞
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ)
+            if not selector.select(timeout):
+                raise subprocess.TimeoutExpired("judge", timeout)
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("判题进程意外退出")
+        return json.loads(line)
+
+    def load(self, script_file: Path, work_dir: Path, timeout: float = 30) -> Optional[str]:
+        """加载并编译代码，失败时返回错误信息"""
+        reply = self._request({"script": str(script_file), "cwd": str(work_dir)}, timeout)
+        return reply.get("error")
+
+    def run_case(self, input_text: str, time_limit: float) -> Dict:
+        """运行一组用例，返回原始运行结果"""
+        # 判题进程自身会在墙钟时间上限后终止用例，这里额外留出余量
+        timeout = time_limit * WALL_TIME_FACTOR + 5
+        return self._request({"input": input_text, "time_limit": time_limit}, timeout)
+
+    def close(self):
+        """关闭判题进程"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+
+def outputs_match(actual: str, expected: str, mode: str = "trim") -> bool:
+    """比较输出
+
+    exact: 完全一致；trim: 忽略每行行尾空白和末尾空行。
+    """
+    if mode == "exact":
+        return actual == expected
+    actual_lines = [line.rstrip() for line in actual.rstrip().splitlines()]
+    expected_lines = [line.rstrip() for line in expected.rstrip().splitlines()]
+    return actual_lines == expected_lines
+
+
+def case_verdict(outcome: Dict, expected: str, time_limit: float, compare: str = "trim") -> str:
+    """根据用例运行结果给出判定"""
+    if outcome["output_limit_exceeded"]:
+        return OUTPUT_LIMIT_EXCEEDED
+    if outcome["timed_out"] or outcome["time"] > time_limit:
+        return TIME_LIMIT_EXCEEDED
+    if outcome["returncode"] == -signal.SIGXCPU:
+        return TIME_LIMIT_EXCEEDED
+    if outcome["returncode"] != 0:
+        if "MemoryError" in outcome["stderr"]:
+            return MEMORY_LIMIT_EXCEEDED
+        return RUNTIME_ERROR
+    return ACCEPTED if outputs_match(outcome["stdout"], expected, compare) else WRONG_ANSWER
+
+
+def preview(text: str, limit: int = 200) -> str:
+    """截断过长的文本"""
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--serve"]:
+        sys.exit(serve())
+    print("用法: judge.py --serve", file=sys.stderr)
+    sys.exit(2)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+执行资源限制与资源使用统计
+通过setrlimit（或cgroup v2）限制子进程的内存、CPU时间、进程数和文件大小，
+并用wait4收集峰值内存和CPU时间
+"""
+
+import logging
+import os
+import resource
+import signal
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def rusage_to_dict(rusage) -> Dict:
+    """把resource.struct_rusage转换为可序列化的字典（Linux下ru_maxrss单位为KB）"""
+    return {
+        "max_rss_kb": rusage.ru_maxrss,
+        "user_time": rusage.ru_utime,
+        "sys_time": rusage.ru_stime
+    }
+
+
+def usage_summary(rusage: Optional[Dict], wall_time: float, peak_memory_bytes: Optional[int] = None) -> Dict:
+    """返回给客户端的资源使用情况"""
+    summary = {"wall_time": round(wall_time, 3)}
+    if rusage:
+        summary["peak_memory_mb"] = round(rusage["max_rss_kb"] / 1024, 1)
+        summary["user_time"] = round(rusage["user_time"], 3)
+        summary["sys_time"] = round(rusage["sys_time"], 3)
+    if peak_memory_bytes is not None:
+        # cgroup统计的峰值包含脚本启动的所有子进程
+        summary["peak_memory_mb"] = round(peak_memory_bytes / 1024 / 1024, 1)
+    return summary
+
+
+class ResourceLimits:
+    """单次执行的资源限制，取值为0表示不限制"""
+
+    def __init__(self, memory_mb: int = 0, cpu_seconds: int = 0, max_processes: int = 0,
+                 max_file_size_mb: int = 0):
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        # RLIMIT_NPROC按用户统计进程（线程）数，而非按进程树
+        self.max_processes = max_processes
+        self.max_file_size_mb = max_file_size_mb
+
+    def apply(self, cgroup_managed: bool = False):
+        """在当前进程上设置rlimit（在子进程中调用）
+
+        cgroup_managed为True时内存和进程数由cgroup限制，不再设置对应的rlimit。
+        """
+        if self.memory_mb and not cgroup_managed:
+            limit = self.memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if self.cpu_seconds:
+            # 超过软限制收到SIGXCPU，再超过1秒被SIGKILL
+            resource.setrlimit(resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 1))
+        if self.max_processes and not cgroup_managed:
+            resource.setrlimit(resource.RLIMIT_NPROC, (self.max_processes, self.max_processes))
+        if self.max_file_size_mb:
+            limit = self.max_file_size_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_FSIZE, (limit, limit))
+
+    def preexec_fn(self, cgroup: Optional["Cgroup"] = None) -> Callable[[], None]:
+        """返回用于Popen的preexec_fn：加入cgroup并设置rlimit"""
+        def _preexec():
+            if cgroup is not None:
+                cgroup.join()
+            self.apply(cgroup_managed=cgroup is not None)
+        return _preexec
+
+    def describe_violation(self, returncode: Optional[int], rusage: Optional[Dict]) -> Optional[str]:
+        """根据退出信号和CPU用量判断是否因超出限制被终止"""
+        if returncode is None or returncode >= 0 or not self.cpu_seconds:
+            return None
+        cpu_time = 0.0
+        if rusage:
+            cpu_time = rusage["user_time"] + rusage["sys_time"]
+        if returncode == -signal.SIGXCPU or (returncode == -signal.SIGKILL and cpu_time >= self.cpu_seconds):
+            return f"超出CPU时间限制（{self.cpu_seconds}秒）"
+        return None
+
+    def to_dict(self) -> Dict:
+        return {
+            "memory_mb": self.memory_mb,
+            "cpu_seconds": self.cpu_seconds,
+            "max_processes": self.max_processes,
+            "max_file_size_mb": self.max_file_size_mb
+        }
+
+
+class MeteredPopen(subprocess.Popen):
+    """用wait4回收子进程的Popen，退出后可通过rusage获取资源使用"""
+
+    def __init__(self, *args, **kwargs):
+        self.rusage = None
+        # 子进程所在的cgroup（由调用方设置，执行结束后删除）
+        self.cgroup = None
+        super().__init__(*args, **kwargs)
+
+    def _try_wait(self, wait_flags):
+        try:
+            pid, sts, rusage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            # 与Popen一致：子进程已被其他地方回收
+            return self.pid, 0
+        if pid == self.pid:
+            self.rusage = rusage_to_dict(rusage)
+        return pid, sts
+
+
+class Cgroup:
+    """单次执行的cgroup v2子组"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def join(self):
+        """把当前进程移入该cgroup（在子进程中调用）"""
+        with open(self.path / "cgroup.procs", "w") as f:
+            f.write("0")
+
+    def _read(self, name: str) -> Optional[str]:
+        try:
+            return (self.path / name).read_text()
+        except OSError:
+            return None
+
+    def peak_memory(self) -> Optional[int]:
+        """cgroup内所有进程的内存峰值（字节），内核不支持memory.peak时返回None"""
+        value = self._read("memory.peak")
+        return int(value) if value and value.strip().isdigit() else None
+
+    def oom_killed(self) -> bool:
+        """是否有进程因超出memory.max被OOM终止"""
+        for line in (self._read("memory.events") or "").splitlines():
+            key, _, value = line.partition(" ")
+            if key == "oom_kill" and value.strip() != "0":
+                return True
+        return False
+
+    def remove(self):
+        """删除cgroup（其中的进程必须都已退出）"""
+        try:
+            # 结束残留的子进程后才能删除
+            kill_file = self.path / "cgroup.kill"
+            if kill_file.exists():
+                kill_file.write_text("1")
+            self.path.rmdir()
+        except OSError as e:
+            logger.warning(f"删除cgroup失败: {self.path}: {e}")
+
+
+class CgroupV2Manager:
+    """在委派给服务的cgroup v2目录下为每次执行创建子组
+
+    memory.max和pids.max对整个进程树生效，比按用户统计的RLIMIT_NPROC更准确。
+    parent不可用（非cgroup v2或无写权限）时available为False，只使用rlimit。
+    """
+
+    def __init__(self, parent: str, limits: ResourceLimits):
+        self.parent = Path(parent) if parent else None
+        self.limits = limits
+        self.available = self._check_available()
+
+    def _check_available(self) -> bool:
+        if self.parent is None:
+            return False
+        controllers = self.parent / "cgroup.controllers"
+        if not controllers.exists() or not os.access(self.parent, os.W_OK):
+            logger.warning(f"cgroup v2目录不可用，仅使用rlimit限制资源: {self.parent}")
+            return False
+        try:
+            # 为子组启用memory和pids控制器
+            (self.parent / "cgroup.subtree_control").write_text("+memory +pids")
+        except OSError as e:
+            logger.warning(f"启用cgroup控制器失败，仅使用rlimit限制资源: {e}")
+            return False
+        return True
+
+    def create(self, name: str, limits: Optional[ResourceLimits] = None) -> Optional[Cgroup]:
+        """创建并配置子组，limits为空时使用默认限制，失败时返回None"""
+        if not self.available:
+            return None
+        limits = limits or self.limits
+        path = self.parent / f"exec-{name}"
+        try:
+            path.mkdir(exist_ok=True)
+            if limits.memory_mb:
+                (path / "memory.max").write_text(str(limits.memory_mb * 1024 * 1024))
+                (path / "memory.swap.max").write_text("0")
+            if limits.max_processes:
+                (path / "pids.max").write_text(str(limits.max_processes))
+        except OSError as e:
+            logger.warning(f"创建cgroup失败: {path}: {e}")
+            try:
+                path.rmdir()
+            except OSError:
+                pass
+            return None
+        return Cgroup(path)
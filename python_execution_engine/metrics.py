@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Prometheus格式的运行指标
+实现计数器、直方图和在抓取时读取的回调指标，按文本格式输出，不依赖prometheus_client；
+以及单次请求的阶段时间线，可导出为Chrome trace-event格式
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 执行各阶段耗时的直方图分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类，按标签值分别记录"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标{self.name}需要标签: {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> (各分桶计数, 总和, 总数)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """记录代码块耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, ([*entry[0]], entry[1], entry[2])) for key, entry in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """抓取时调用回调读取当前值的指标（用于已有组件的统计信息）
+
+    回调返回单个数值，或 {标签值元组: 数值} 字典。
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable, type_name: str = "gauge",
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.type_name = type_name
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        value = self.callback()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(sample)}"
+            for key, sample in sorted(value.items())
+        ]
+
+
+class MetricsRegistry:
+    """指标集合，按注册顺序输出"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, callback: Callable, type_name: str = "gauge",
+                 labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, callback, type_name, labelnames))
+
+    def render(self) -> str:
+        """Prometheus文本格式（version 0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class Timeline:
+    """单次请求的阶段时间线
+
+    记录各阶段的起止时间，汇总为响应中的耗时明细，或导出为Chrome trace-event JSON
+    （可在chrome://tracing或Perfetto中打开）。
+    """
+
+    def __init__(self, name: str, execution_id: str):
+        self.name = name
+        self.execution_id = execution_id
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        # (名称, 类别, 开始, 结束, 线程, 附加参数)
+        self._spans: List[Tuple[str, str, float, float, int, Dict]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float, category: str = "phase", **args):
+        """记录一个区间，start和end为time.perf_counter()的值"""
+        with self._lock:
+            self._spans.append((name, category, start, end, threading.get_ident(), args))
+
+    @contextmanager
+    def span(self, name: str, category: str = "phase", **args) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), category, **args)
+
+    def breakdown(self) -> Dict[str, float]:
+        """各阶段耗时（秒），同名阶段累加，total为请求开始至今的耗时"""
+        with self._lock:
+            spans = list(self._spans)
+        timings: Dict[str, float] = {}
+        for name, category, start, end, _, _ in spans:
+            if category == "phase":
+                timings[name] = timings.get(name, 0.0) + (end - start)
+        timings = {name: round(value, 4) for name, value in timings.items()}
+        timings["total"] = round(time.perf_counter() - self.origin, 4)
+        return timings
+
+    def to_chrome_trace(self) -> Dict:
+        """导出为Chrome trace-event格式，时间戳为相对请求开始的微秒数"""
+        end = time.perf_counter()
+        with self._lock:
+            spans = list(self._spans)
+        pid = os.getpid()
+        request_tid = threading.get_ident()
+
+        def micros(value: float) -> float:
+            return round((value - self.origin) * 1e6, 1)
+
+        events = [{
+            "name": self.name,
+            "cat": "request",
+            "ph": "X",
+            "ts": 0,
+            "dur": micros(end),
+            "pid": pid,
+            "tid": spans[0][4] if spans else request_tid,
+            "args": {"execution_id": self.execution_id}
+        }]
+        for name, category, start, stop, tid, args in spans:
+            events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": micros(start),
+                "dur": round((stop - start) * 1e6, 1),
+                "pid": pid,
+                "tid": tid,
+                "args": args
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "execution_id": self.execution_id,
+                "started_at": self.started_at
+            }
+        }
+
+    def save(self, directory: str) -> str:
+        """把trace写入directory/<execution_id>.json，返回文件路径"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.execution_id}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        return path
+
+
+class ExecutionMetrics:
+    """执行引擎的指标"""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.executions = r.counter(
+            "pyexec_executions_total", "执行请求数，按模式和结果分类", ("mode", "outcome")
+        )
+        self.execution_seconds = r.histogram(
+            "pyexec_execution_duration_seconds", "执行请求的总耗时", ("mode",)
+        )
+        self.phase_seconds = r.histogram(
+            "pyexec_phase_duration_seconds", "执行各阶段耗时", ("phase",)
+        )
+        self.queue_wait_seconds = r.histogram(
+            "pyexec_queue_wait_seconds", "准入控制中的排队耗时"
+        )
+        self.timeouts = r.counter("pyexec_timeouts_total", "超时被终止的执行数")
+        self.install_cache_hits = r.counter(
+            "pyexec_install_cache_hits_total", "依赖已满足、无需安装的执行数"
+        )
+        self.install_cache_misses = r.counter(
+            "pyexec_install_cache_misses_total", "需要安装依赖或创建虚拟环境的执行数"
+        )
+        self.output_bytes = r.counter(
+            "pyexec_output_bytes_total", "子进程输出的字节数", ("stream",)
+        )
+
+    @contextmanager
+    def phase(self, name: str, timeline: Optional[Timeline] = None) -> Iterator[None]:
+        """记录一个执行阶段的耗时，给出timeline时同时记入请求的时间线"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_phase(name, time.perf_counter() - start, timeline)
+
+    def observe_phase(self, name: str, duration: float, timeline: Optional[Timeline] = None):
+        """记录一个刚结束、持续duration秒的阶段"""
+        self.phase_seconds.observe(duration, phase=name)
+        if timeline is not None:
+            end = time.perf_counter()
+            timeline.add(name, end - duration, end)
+
+    def observe_queue_wait(self, wait_time: float, timeline: Optional[Timeline] = None):
+        """记录准入控制的排队耗时，在时间线中记为queue阶段"""
+        self.queue_wait_seconds.observe(wait_time)
+        if timeline is not None:
+            end = time.perf_counter()
+            timeline.add("queue", end - wait_time, end)
+
+    def record_execution(self, mode: str, result: Dict, duration: float):
+        """记录一次执行的结果和总耗时"""
+        if result.get("success"):
+            outcome = "success"
+        elif str(result.get("error", "")).startswith("安全检查失败"):
+            outcome = "unsafe"
+        else:
+            outcome = "failure"
+        self.executions.inc(mode=mode, outcome=outcome)
+        self.execution_seconds.observe(duration, mode=mode)
+
+    def render(self) -> str:
+        return self.registry.render()
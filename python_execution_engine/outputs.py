@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+有界的执行输出
+输出不超过内存上限时完整保留在内存中；超出后全部写入输出目录中的文件，内存中只保留首尾预览，
+完整输出可通过 /executions/<id>/output 按字节范围读取，服务进程的内存占用与用户代码打印的数据量无关
+"""
+
+import codecs
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STREAMS = ("stdout", "stderr")
+READ_CHUNK_SIZE = 65536
+
+
+def _decode_head(data: bytes) -> str:
+    """解码开头部分，丢弃末尾被截断的多字节字符"""
+    return codecs.getincrementaldecoder("utf-8")(errors="replace").decode(data, final=False)
+
+
+def _decode_tail(data: bytes) -> str:
+    """解码结尾部分，跳过开头被截断的多字节字符"""
+    start = 0
+    while start < min(len(data), 3) and 0x80 <= data[start] < 0xC0:
+        start += 1
+    return data[start:].decode("utf-8", errors="replace")
+
+
+class OutputCapture:
+    """单个输出流的有界缓冲
+
+    累计不超过memory_limit字节时保存在内存中；超出后把已有内容和之后的数据写入spill_path，
+    内存中只保留开头和结尾各preview_bytes字节。文件最多写入max_bytes字节（0表示不限制），
+    超出的部分只计入size和结尾预览。
+    """
+
+    def __init__(self, spill_path: Path, memory_limit: int, preview_bytes: int, max_bytes: int = 0):
+        self.spill_path = spill_path
+        self.memory_limit = memory_limit
+        self.preview_bytes = preview_bytes
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stored = 0
+        self.spilled = False
+        self._buffer = bytearray()
+        self._tail = b""
+        self._file = None
+
+    @classmethod
+    def from_file(cls, path: Path, spill_path: Path, memory_limit: int, preview_bytes: int) -> "OutputCapture":
+        """从已写入文件的输出创建（如会话的代码单元输出），超出上限时把文件移入输出目录"""
+        capture = cls(spill_path, memory_limit, preview_bytes)
+        try:
+            capture.size = capture.stored = path.stat().st_size
+        except OSError:
+            return capture
+        if capture.size <= memory_limit:
+            capture._buffer = bytearray(path.read_bytes())
+            return capture
+
+        shutil.move(str(path), str(spill_path))
+        capture.spilled = True
+        with open(spill_path, "rb") as f:
+            capture._buffer = bytearray(f.read(preview_bytes))
+            f.seek(max(0, capture.size - preview_bytes))
+            capture._tail = f.read(preview_bytes)
+        return capture
+
+    def fits_in_memory(self, size: int) -> bool:
+        """再写入size字节是否仍只写内存缓冲（不涉及溢出文件）"""
+        return not self.spilled and len(self._buffer) + size <= self.memory_limit
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if not self.spilled:
+            if len(self._buffer) + len(data) <= self.memory_limit:
+                self._buffer += data
+                self.stored += len(data)
+                return
+            self._spill()
+        if self.max_bytes:
+            data_to_store = data[:max(0, self.max_bytes - self.stored)]
+        else:
+            data_to_store = data
+        if data_to_store:
+            self._file.write(data_to_store)
+            self.stored += len(data_to_store)
+        # 只保留最后preview_bytes字节
+        self._tail = (self._tail + data[-self.preview_bytes:])[-self.preview_bytes:]
+
+    def _spill(self):
+        self._file = open(self.spill_path, "wb")
+        self._file.write(self._buffer)
+        self._tail = bytes(self._buffer[-self.preview_bytes:])
+        del self._buffer[self.preview_bytes:]
+        self.spilled = True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """丢弃已溢出的输出文件"""
+        self.close()
+        if self.spilled:
+            try:
+                self.spill_path.unlink()
+            except OSError:
+                pass
+            self.spilled = False
+            del self._buffer[:]
+
+    def text(self) -> str:
+        """未溢出时为完整输出，溢出时为开头部分的预览"""
+        if self.spilled:
+            return _decode_head(bytes(self._buffer))
+        return self._buffer.decode("utf-8", errors="replace")
+
+    def tail(self) -> str:
+        return _decode_tail(self._tail) if self.spilled else ""
+
+
+class OutputStore:
+    """溢出输出文件的目录，文件按execution_id的哈希命名，保留retention秒
+
+    多个worker共用同一目录时，任一worker都可以读取其他worker的输出。
+    """
+
+    def __init__(self, root: Path, memory_limit: int = 1024 * 1024, preview_bytes: int = 16 * 1024,
+                 retention: float = 3600, max_bytes: int = 0):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.memory_limit = memory_limit
+        # 单个输出文件的大小上限，0表示不限制
+        self.max_bytes = max_bytes
+        # 预览不超过内存上限
+        self.preview_bytes = min(preview_bytes, memory_limit)
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+        # 统计信息
+        self.spilled = 0
+        self.spilled_bytes = 0
+
+    def path(self, execution_id: str, stream: str) -> Path:
+        digest = hashlib.sha256(execution_id.encode("utf-8")).hexdigest()[:32]
+        return self.root / f"{digest}.{stream}"
+
+    def capture(self, execution_id: str, stream: str) -> OutputCapture:
+        self._maybe_purge()
+        return OutputCapture(self.path(execution_id, stream), self.memory_limit, self.preview_bytes,
+                             self.max_bytes)
+
+    def capture_file(self, path: Path, execution_id: str, stream: str) -> OutputCapture:
+        self._maybe_purge()
+        capture = OutputCapture.from_file(path, self.path(execution_id, stream), self.memory_limit,
+                                          self.preview_bytes)
+        self.record(capture)
+        return capture
+
+    def record(self, capture: OutputCapture):
+        """统计溢出到文件的输出"""
+        if capture.spilled:
+            with self._lock:
+                self.spilled += 1
+                self.spilled_bytes += capture.size
+
+    def describe(self, result: Dict, captures: Dict[str, OutputCapture], execution_id: str):
+        """在执行结果中加入溢出输出的预览信息和读取地址"""
+        for stream, field in (("stdout", "output"), ("stderr", "error")):
+            capture = captures[stream]
+            if not capture.spilled:
+                continue
+            result[f"{field}_truncated"] = True
+            result[f"{field}_tail"] = capture.tail()
+            result[f"{field}_size"] = capture.size
+            if capture.stored < capture.size:
+                # 超出文件大小上限，只能读取前stored字节
+                result[f"{field}_stored_size"] = capture.stored
+            result[f"{field}_ref"] = f"/executions/{execution_id}/output?stream={stream}"
+
+    def open_range(self, execution_id: str, stream: str, offset: int = 0,
+                   length: Optional[int] = None) -> Optional[Tuple[int, int, int, Iterator[bytes]]]:
+        """按字节范围读取溢出的输出，返回 (起始偏移, 读取长度, 总大小, 数据块迭代器)
+
+        输出不存在（未溢出或已过期）时返回None。数据按块读取，不会整体载入内存。
+        """
+        path = self.path(execution_id, stream)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        size = os.fstat(f.fileno()).st_size
+        start = min(max(0, offset), size)
+        count = size - start if length is None else min(max(0, length), size - start)
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                f.seek(start)
+                remaining = count
+                while remaining > 0:
+                    data = f.read(min(READ_CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+            finally:
+                f.close()
+
+        return start, count, size, chunks()
+
+    def _maybe_purge(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < min(60.0, self.retention):
+                return
+            self._last_purge = now
+        for path in self.root.iterdir():
+            try:
+                if now - path.stat().st_mtime > self.retention:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "path": str(self.root),
+                "memory_limit": self.memory_limit,
+                "preview_bytes": self.preview_bytes,
+                "retention": self.retention,
+                "max_bytes": self.max_bytes,
+                "spilled": self.spilled,
+                "spilled_bytes": self.spilled_bytes
+            }
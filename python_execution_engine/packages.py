@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+包管理辅助组件
+维护已安装包索引，协调并发的包安装请求，按依赖集合缓存虚拟环境
+"""
+
+import hashlib
+import importlib
+import importlib.metadata
+import importlib.util
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_distribution_name(name: str) -> str:
+    """按PEP 503规范化发行包名称"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+class InstalledPackageIndex:
+    """已安装包索引
+
+    启动时收集标准库模块和已安装的发行包，按需用find_spec判断模块能否导入，
+    安装新包后调用refresh()刷新。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stdlib: Set[str] = set(getattr(sys, "stdlib_module_names", ())) | set(sys.builtin_module_names)
+        self._distributions: Set[str] = set()
+        self._versions: Dict[str, str] = {}
+        self._spec_cache: Dict[str, bool] = {}
+        self.refresh()
+
+    def refresh(self):
+        """重新扫描已安装的发行包并清空模块查找缓存"""
+        importlib.invalidate_caches()
+        distributions = set()
+        versions = {}
+        for dist in importlib.metadata.distributions():
+            name = dist.metadata.get("Name")
+            if name:
+                normalized = normalize_distribution_name(name)
+                distributions.add(normalized)
+                # sys.path中靠前的同名发行包优先
+                versions.setdefault(normalized, dist.version)
+
+        with self._lock:
+            self._distributions = distributions
+            self._versions = versions
+            self._spec_cache.clear()
+        logger.info(f"已安装包索引已刷新，发行包数量: {len(distributions)}")
+
+    def _is_importable(self, module: str) -> bool:
+        with self._lock:
+            cached = self._spec_cache.get(module)
+        if cached is not None:
+            return cached
+
+        try:
+            importable = importlib.util.find_spec(module) is not None
+        except (ImportError, ValueError):
+            importable = False
+
+        with self._lock:
+            self._spec_cache[module] = importable
+        return importable
+
+    def is_satisfied(self, name: str) -> bool:
+        """判断模块或发行包是否已经可用"""
+        if name in self._stdlib:
+            return True
+        with self._lock:
+            if normalize_distribution_name(name) in self._distributions:
+                return True
+        return self._is_importable(name)
+
+    def is_stdlib(self, module: str) -> bool:
+        return module in self._stdlib
+
+    def version(self, distribution: str) -> Optional[str]:
+        """已安装发行包的版本，未安装时返回None"""
+        with self._lock:
+            return self._versions.get(normalize_distribution_name(distribution))
+
+    def missing(self, names: Iterable[str]) -> List[str]:
+        """返回尚未安装的名称"""
+        return [name for name in names if not self.is_satisfied(name)]
+
+
+class _InstallBatch:
+    """一次pip调用所覆盖的一组包"""
+
+    def __init__(self):
+        self.packages: Set[str] = set()
+        # 加入本批次的各个请求各自需要的包，批量安装失败时按请求分别重试
+        self.requests: List[FrozenSet[str]] = []
+        self.done = threading.Event()
+        self.success = False
+        self.message = ""
+        # 重试后仍安装失败的包 -> 错误消息
+        self.failed: Dict[str, str] = {}
+
+    def failure_for(self, packages: Iterable[str]) -> Optional[str]:
+        """本批次中这些包的安装错误，全部成功时返回None"""
+        if self.success:
+            return None
+        messages = []
+        for pkg in packages:
+            message = self.failed.get(pkg)
+            if message is not None and message not in messages:
+                messages.append(message)
+        return "; ".join(messages) if messages else None
+
+
+class InstallCoordinator:
+    """包安装协调器
+
+    - 并发请求安装同一个包时只执行一次pip，其余请求等待同一结果
+    - 短时间窗口内到达的不同包合并为一次pip调用
+    - pip调用串行执行，避免并发写入同一环境
+    - 合并安装失败时按请求分别重试，一个请求中无法安装的包不会导致同批次其他请求失败
+    """
+
+    def __init__(self, installer: Callable[[List[str]], Tuple[bool, str]], batch_window: float = 0.05):
+        self.installer = installer
+        self.batch_window = batch_window
+
+        self._lock = threading.Lock()
+        self._pip_lock = threading.Lock()
+        # 正在收集中、尚未开始安装的批次
+        self._pending: Optional[_InstallBatch] = None
+        # 正在安装中的包 -> 所属批次
+        self._inflight: Dict[str, _InstallBatch] = {}
+
+        # 统计信息
+        self.pip_runs = 0
+        self.coalesced_requests = 0
+        self.retried_batches = 0
+
+    def install(self, packages: List[str], timeout: Optional[float] = None) -> Tuple[bool, str]:
+        """安装包并等待结果，返回 (是否成功, 消息)"""
+        # 批次 -> 本请求在该批次中等待的包
+        batches: Dict[_InstallBatch, Set[str]] = {}
+        leader_batch = None
+
+        with self._lock:
+            for pkg in packages:
+                batch = self._inflight.get(pkg)
+                if batch is None:
+                    if self._pending is None:
+                        # 第一个请求负责在窗口结束后执行安装
+                        self._pending = _InstallBatch()
+                        leader_batch = self._pending
+                    elif pkg in self._pending.packages:
+                        self.coalesced_requests += 1
+                    batch = self._pending
+                    batch.packages.add(pkg)
+                else:
+                    self.coalesced_requests += 1
+                batches.setdefault(batch, set()).add(pkg)
+            if self._pending is not None and self._pending in batches:
+                self._pending.requests.append(frozenset(batches[self._pending]))
+
+        if leader_batch is not None:
+            self._run_batch(leader_batch)
+
+        failures = []
+        for batch, waiting in batches.items():
+            if not batch.done.wait(timeout):
+                return False, "等待包安装超时"
+            failure = batch.failure_for(waiting)
+            if failure is not None:
+                failures.append(failure)
+
+        if failures:
+            return False, "; ".join(failures)
+        return True, f"成功安装包: {', '.join(packages)}"
+
+    def _run_batch(self, batch: _InstallBatch):
+        """等待收集窗口结束后执行一次pip安装"""
+        time.sleep(self.batch_window)
+
+        with self._pip_lock:
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+                for pkg in batch.packages:
+                    self._inflight[pkg] = batch
+                self.pip_runs += 1
+
+            packages = sorted(batch.packages)
+            logger.info(f"批量安装包: {packages}")
+            try:
+                batch.success, batch.message = self._install(packages)
+                if not batch.success:
+                    self._retry_requests(batch)
+            finally:
+                with self._lock:
+                    for pkg in batch.packages:
+                        if self._inflight.get(pkg) is batch:
+                            del self._inflight[pkg]
+                batch.done.set()
+
+    def _install(self, packages: List[str]) -> Tuple[bool, str]:
+        try:
+            return self.installer(packages)
+        except Exception as e:
+            return False, f"安装包时出错: {str(e)}"
+
+    def _retry_requests(self, batch: _InstallBatch):
+        """合并安装失败后，按请求分别安装，找出真正失败的包（调用方持有_pip_lock）"""
+        requests = list(dict.fromkeys(batch.requests))
+        if len(requests) <= 1:
+            batch.failed = {pkg: batch.message for pkg in batch.packages}
+            return
+
+        with self._lock:
+            self.retried_batches += 1
+        logger.warning(f"批量安装失败，按请求分别重试: {batch.message}")
+        installed: Set[str] = set()
+        failed: Dict[str, str] = {}
+        for request in requests:
+            if request <= installed:
+                continue
+            with self._lock:
+                self.pip_runs += 1
+            success, message = self._install(sorted(request))
+            if success:
+                installed.update(request)
+            else:
+                for pkg in request:
+                    failed.setdefault(pkg, message)
+        batch.failed = {pkg: message for pkg, message in failed.items() if pkg not in installed}
+
+    def stats(self) -> Dict:
+        """安装协调器状态"""
+        with self._lock:
+            return {
+                "pip_runs": self.pip_runs,
+                "coalesced_requests": self.coalesced_requests,
+                "retried_batches": self.retried_batches,
+                "installing": sorted(self._inflight),
+                "pending": sorted(self._pending.packages) if self._pending else []
+            }
+
+
+class VenvCache:
+    """按依赖集合缓存的虚拟环境
+
+    每个不同的依赖集合（排序后取哈希）对应base_dir下的一个虚拟环境，
+    相同依赖集合的请求直接复用；总占用超过磁盘预算时按LRU淘汰未被使用的环境。
+    """
+
+    READY_MARKER = ".ready"
+    # 被淘汰、等待删除的环境目录前缀
+    TOMBSTONE_PREFIX = ".evicted-"
+
+    def __init__(self, root: Path, installer: Callable[[List[str], str], Tuple[bool, str]],
+                 max_disk_mb: int = 2048):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        # installer(packages, python_executable) 在指定解释器环境中安装包
+        self.installer = installer
+        self.max_disk_bytes = max_disk_mb * 1024 * 1024
+
+        self._lock = threading.Lock()
+        # key -> {"packages", "size", "last_used", "in_use"}，按最近使用排序
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # key -> [构建锁, 等待者数]，没有等待者时删除，避免随依赖集合数无限增长
+        self._build_locks: Dict[str, List] = {}
+
+        # 统计信息
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+
+        self._load_existing()
+
+    @staticmethod
+    def key_for(packages: Iterable[str]) -> str:
+        """依赖集合的缓存键"""
+        canonical = "\n".join(sorted({normalize_distribution_name(pkg) for pkg in packages}))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+    def _env_dir(self, key: str) -> Path:
+        return self.root / key
+
+    @staticmethod
+    def _python_path(env_dir: Path) -> Path:
+        return env_dir / "bin" / "python"
+
+    @staticmethod
+    def _dir_size(path: Path) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, filename)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def _load_existing(self):
+        """加载磁盘上已构建完成的环境，删除未完成的残留目录"""
+        existing = []
+        for env_dir in self.root.iterdir():
+            if not env_dir.is_dir():
+                continue
+            if env_dir.name.startswith(self.TOMBSTONE_PREFIX):
+                # 上次淘汰时未删除完的目录
+                shutil.rmtree(env_dir, ignore_errors=True)
+                continue
+            marker = env_dir / self.READY_MARKER
+            if not marker.exists():
+                shutil.rmtree(env_dir, ignore_errors=True)
+                continue
+            try:
+                meta = json.loads(marker.read_text())
+            except (OSError, ValueError):
+                shutil.rmtree(env_dir, ignore_errors=True)
+                continue
+            existing.append((marker.stat().st_mtime, env_dir.name, meta))
+
+        for last_used, key, meta in sorted(existing):
+            self._entries[key] = {
+                "packages": meta.get("packages", []),
+                "size": meta.get("size", 0),
+                "last_used": last_used,
+                "in_use": 0
+            }
+        if existing:
+            logger.info(f"加载已缓存的虚拟环境: {len(existing)}个")
+
+    def _build(self, key: str, packages: List[str]) -> Tuple[bool, str]:
+        """创建虚拟环境并安装依赖
+
+        成功时环境以in_use=1加入缓存，由调用方持有，发布和占用之间不会被其他请求淘汰。
+        """
+        env_dir = self._env_dir(key)
+        shutil.rmtree(env_dir, ignore_errors=True)
+
+        # 继承系统site-packages，预装的包无需重复安装
+        result = subprocess.run(
+            [sys.executable, "-m", "venv", "--without-pip", "--system-site-packages", str(env_dir)],
+            capture_output=True,
+            text=True,
+            timeout=60
+        )
+        if result.returncode != 0:
+            shutil.rmtree(env_dir, ignore_errors=True)
+            return False, f"创建虚拟环境失败: {result.stderr}"
+
+        success, message = self.installer(packages, str(self._python_path(env_dir)))
+        if not success:
+            shutil.rmtree(env_dir, ignore_errors=True)
+            return False, message
+
+        size = self._dir_size(env_dir)
+        marker = env_dir / self.READY_MARKER
+        marker.write_text(json.dumps({"packages": packages, "size": size}))
+
+        with self._lock:
+            self._entries[key] = {
+                "packages": packages,
+                "size": size,
+                "last_used": time.time(),
+                "in_use": 1
+            }
+            self.builds += 1
+        return True, message
+
+    def acquire(self, packages: List[str]) -> Tuple[bool, str, Optional[str]]:
+        """获取满足依赖集合的环境，返回 (是否成功, 消息, 解释器路径)
+
+        成功时调用方在执行结束后需要调用release()。
+        """
+        packages = sorted(set(packages))
+        key = self.key_for(packages)
+
+        with self._lock:
+            slot = self._build_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+
+        # 同一依赖集合只构建一次，并发请求等待构建结果
+        try:
+            with slot[0]:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        self._entries.move_to_end(key)
+                        entry["last_used"] = time.time()
+                        entry["in_use"] += 1
+                        self.hits += 1
+                        message = f"复用缓存环境 {key}"
+
+                if entry is None:
+                    logger.info(f"创建虚拟环境 {key}: {packages}")
+                    success, install_msg = self._build(key, packages)
+                    if not success:
+                        return False, install_msg, None
+                    message = f"创建缓存环境 {key}，{install_msg}"
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0 and self._build_locks.get(key) is slot:
+                    del self._build_locks[key]
+
+        try:
+            os.utime(self._env_dir(key) / self.READY_MARKER)
+        except OSError:
+            pass
+
+        self._evict()
+        return True, message, str(self._python_path(self._env_dir(key)))
+
+    def release(self, python_executable: str):
+        """执行结束后释放环境"""
+        key = Path(python_executable).parent.parent.name
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["in_use"] > 0:
+                entry["in_use"] -= 1
+        self._evict()
+
+    def _evict(self):
+        """超出磁盘预算时按LRU淘汰空闲环境
+
+        在锁内把目录改名为墓碑目录，之后才在锁外删除：同一依赖集合随后重新构建的环境
+        使用原目录名，不会被进行中的删除波及。
+        """
+        victims = []
+        with self._lock:
+            total = sum(entry["size"] for entry in self._entries.values())
+            for key, entry in list(self._entries.items()):
+                if total <= self.max_disk_bytes:
+                    break
+                if entry["in_use"] > 0:
+                    continue
+                total -= entry["size"]
+                del self._entries[key]
+                tombstone = self.root / f"{self.TOMBSTONE_PREFIX}{key}-{uuid.uuid4().hex[:8]}"
+                try:
+                    os.rename(self._env_dir(key), tombstone)
+                except OSError as e:
+                    logger.warning(f"淘汰虚拟环境 {key} 失败: {e}")
+                    continue
+                victims.append((key, tombstone))
+                self.evictions += 1
+
+        for key, tombstone in victims:
+            logger.info(f"淘汰虚拟环境 {key}")
+            shutil.rmtree(tombstone, ignore_errors=True)
+
+    def stats(self) -> Dict:
+        """虚拟环境缓存状态"""
+        with self._lock:
+            return {
+                "environments": len(self._entries),
+                "disk_usage_mb": round(sum(e["size"] for e in self._entries.values()) / 1024 / 1024, 1),
+                "max_disk_mb": self.max_disk_bytes // 1024 // 1024,
+                "hits": self.hits,
+                "builds": self.builds,
+                "evictions": self.evictions
+            }
+
+
+# 导入名与发行包名不一致的常见包
+MODULE_DISTRIBUTION_OVERRIDES = {
+    "sklearn": "scikit-learn",
+    "cv2": "opencv-python",
+    "PIL": "pillow",
+    "bs4": "beautifulsoup4",
+    "yaml": "pyyaml",
+    "skimage": "scikit-image",
+    "dateutil": "python-dateutil",
+    "Crypto": "pycryptodome",
+    "dotenv": "python-dotenv",
+    "docx": "python-docx",
+    "IPython": "ipython",
+}
+
+
+class DistributionResolver:
+    """模块名到pip发行包名的映射
+
+    映射表由importlib.metadata.packages_distributions()和内置的覆盖表组成，
+    首次使用时构建，进程生命周期内缓存。
+    """
+
+    def __init__(self, overrides: Optional[Dict[str, str]] = None):
+        self.overrides = dict(MODULE_DISTRIBUTION_OVERRIDES)
+        if overrides:
+            self.overrides.update(overrides)
+        self._table: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def _build_table(self) -> Dict[str, str]:
+        table = {}
+        for module, distributions in importlib.metadata.packages_distributions().items():
+            if distributions:
+                table[module] = distributions[0]
+        # 覆盖表优先，保证未安装的包也能映射到正确的发行包
+        table.update(self.overrides)
+        return table
+
+    @property
+    def table(self) -> Dict[str, str]:
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    self._table = self._build_table()
+        return self._table
+
+    def resolve(self, module: str) -> str:
+        """返回模块对应的发行包名，未知模块按同名发行包处理"""
+        return self.table.get(module, module)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+子进程输出读取
+以非阻塞方式同时读取stdout/stderr，适用于subprocess.Popen和zygote子进程句柄
+"""
+
+import codecs
+import os
+import selectors
+import subprocess
+import time
+from typing import Iterator, Optional, Tuple
+
+CHUNK_SIZE = 65536
+
+
+def iter_output(process, timeout: Optional[float] = None) -> Iterator[Tuple[str, bytes]]:
+    """按到达顺序产出 (流名称, 数据块)，两个管道都关闭后结束
+
+    超过timeout秒仍未结束时抛出subprocess.TimeoutExpired。
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    streams = {
+        process.stdout.fileno(): "stdout",
+        process.stderr.fileno(): "stderr"
+    }
+
+    selector = selectors.DefaultSelector()
+    for fd in streams:
+        os.set_blocking(fd, False)
+        selector.register(fd, selectors.EVENT_READ)
+
+    try:
+        while selector.get_map():
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(str(process.pid), timeout)
+
+            for key, _ in selector.select(remaining):
+                try:
+                    data = os.read(key.fd, CHUNK_SIZE)
+                except BlockingIOError:
+                    continue
+                if data:
+                    yield streams[key.fd], data
+                else:
+                    selector.unregister(key.fd)
+    finally:
+        selector.close()
+
+
+def make_decoder():
+    """增量UTF-8解码器，多字节字符被拆分到两个数据块时也能正确解码"""
+    return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def close_pipes(process):
+    """关闭子进程的输出管道"""
+    for stream in (process.stdout, process.stderr):
+        if stream is not None:
+            try:
+                stream.close()
+            except OSError:
+                pass
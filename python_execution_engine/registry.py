@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+跨进程的执行登记表
+gunicorn多worker部署时，各worker把正在运行的执行登记到同一个SQLite（WAL模式）文件中，
+任一worker都可以列出或停止其他worker启动的执行
+"""
+
+import json
+import logging
+import os
+import signal
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+FINISHED = "finished"
+STOPPED = "stopped"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS executions (
+    execution_id TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    pid_start INTEGER,
+    worker_pid INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT NOT NULL,
+    resource_usage TEXT
+);
+CREATE INDEX IF NOT EXISTS executions_status ON executions (status, finished_at);
+"""
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _read_stat(pid: int) -> Optional[List[str]]:
+    """读取/proc/<pid>/stat，返回从state开始的字段（进程名可能含空格，按最后一个括号切分）"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            data = f.read()
+    except OSError:
+        return None
+    return data[data.rfind(")") + 2:].split()
+
+
+def process_start_time(pid: int) -> Optional[int]:
+    """进程启动时间（自系统启动以来的时钟周期），用于识别PID是否被复用"""
+    fields = _read_stat(pid)
+    return int(fields[19]) if fields else None
+
+
+def process_usage(pid: int) -> Optional[Dict]:
+    """运行中进程的CPU时间和常驻内存"""
+    fields = _read_stat(pid)
+    if not fields:
+        return None
+    return {
+        "state": fields[0],
+        "cpu_time": round((int(fields[11]) + int(fields[12])) / _CLOCK_TICKS, 3),
+        "rss_mb": round(int(fields[21]) * _PAGE_SIZE / 1024 / 1024, 1)
+    }
+
+
+def _process_alive(pid: int, pid_start: Optional[int]) -> bool:
+    """进程仍在运行（僵尸进程视为已退出，PID被复用时也视为已退出）"""
+    fields = _read_stat(pid)
+    if not fields or fields[0] in ("Z", "X"):
+        return False
+    return pid_start is None or int(fields[19]) == pid_start
+
+
+def _worker_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ExecutionRegistry:
+    """基于SQLite WAL文件的执行登记表
+
+    - register() / finish() 由启动子进程的worker调用
+    - running() 列出所有worker正在运行的执行，并附带从/proc读取的实时资源使用
+    - terminate() 停止任一worker启动的执行（只要求在同一台机器上）
+    - 已结束的记录保留retention秒，供查询最终的资源使用
+    """
+
+    def __init__(self, path: str, retention: float = 300):
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+        self._last_purge = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+        self._purge_dead_workers()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用各自的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def register(self, execution_id: str, pid: int):
+        """登记一个已启动的执行"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO executions (execution_id, pid, pid_start, worker_pid, started_at, status) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (execution_id, pid, process_start_time(pid), os.getpid(), time.time(), RUNNING)
+        )
+
+    def finish(self, execution_id: str, resource_usage: Optional[Dict] = None):
+        """执行结束时记录最终的资源使用（被停止的执行保持stopped状态）"""
+        self._connect().execute(
+            "UPDATE executions SET finished_at = ?, resource_usage = ?, "
+            "status = CASE status WHEN ? THEN ? ELSE status END "
+            "WHERE execution_id = ? AND worker_pid = ?",
+            (time.time(), json.dumps(resource_usage) if resource_usage else None,
+             RUNNING, FINISHED, execution_id, os.getpid())
+        )
+        self._maybe_purge()
+
+    def get(self, execution_id: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT * FROM executions WHERE execution_id = ?", (execution_id,)
+        ).fetchone()
+        return self._describe(row) if row else None
+
+    def running(self) -> List[Dict]:
+        """所有worker正在运行的执行"""
+        rows = self._connect().execute(
+            "SELECT * FROM executions WHERE status = ? ORDER BY started_at", (RUNNING,)
+        ).fetchall()
+        executions = []
+        for row in rows:
+            if not _worker_alive(row["worker_pid"]):
+                # worker异常退出后遗留的记录
+                self._connect().execute("DELETE FROM executions WHERE execution_id = ?", (row["execution_id"],))
+                continue
+            executions.append(self._describe(row))
+        return executions
+
+    def _describe(self, row: sqlite3.Row) -> Dict:
+        record = {
+            "execution_id": row["execution_id"],
+            "pid": row["pid"],
+            "worker_pid": row["worker_pid"],
+            "status": row["status"],
+            "started_at": row["started_at"]
+        }
+        if row["finished_at"] is not None:
+            record["finished_at"] = row["finished_at"]
+            record["resource_usage"] = json.loads(row["resource_usage"]) if row["resource_usage"] else None
+        else:
+            record["running_time"] = round(time.time() - row["started_at"], 3)
+            if _process_alive(row["pid"], row["pid_start"]):
+                usage = process_usage(row["pid"])
+                if usage:
+                    record["resource_usage"] = {"cpu_time": usage["cpu_time"], "rss_mb": usage["rss_mb"]}
+        return record
+
+    def terminate(self, execution_id: str, timeout: float = 5) -> bool:
+        """停止任一worker启动的执行：先SIGTERM，超时后SIGKILL
+
+        子进程由所属worker回收，该worker随后照常返回执行结果。
+        """
+        row = self._connect().execute(
+            "SELECT pid, pid_start FROM executions WHERE execution_id = ? AND status = ?",
+            (execution_id, RUNNING)
+        ).fetchone()
+        if row is None or not _process_alive(row["pid"], row["pid_start"]):
+            return False
+        self._connect().execute(
+            "UPDATE executions SET status = ? WHERE execution_id = ?", (STOPPED, execution_id)
+        )
+        pid, pid_start = row["pid"], row["pid_start"]
+        try:
+            os.kill(pid, signal.SIGTERM)
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                if not _process_alive(pid, pid_start):
+                    return True
+                time.sleep(0.05)
+            if _process_alive(pid, pid_start):
+                os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return True
+
+    def mark_stopped(self, execution_id: str):
+        """本worker停止了执行"""
+        self._connect().execute(
+            "UPDATE executions SET status = ? WHERE execution_id = ? AND status = ?",
+            (STOPPED, execution_id, RUNNING)
+        )
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < min(60.0, self.retention):
+            return
+        self._last_purge = now
+        self._connect().execute(
+            "DELETE FROM executions WHERE finished_at IS NOT NULL AND finished_at < ?",
+            (now - self.retention,)
+        )
+
+    def _purge_dead_workers(self):
+        """删除已退出的worker遗留的运行中记录"""
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT DISTINCT worker_pid FROM executions WHERE finished_at IS NULL"
+        ).fetchall()
+        for row in rows:
+            if not _worker_alive(row["worker_pid"]):
+                conn.execute(
+                    "DELETE FROM executions WHERE worker_pid = ? AND finished_at IS NULL", (row["worker_pid"],)
+                )
+
+    def stats(self) -> Dict:
+        counts = dict(self._connect().execute(
+            "SELECT status, COUNT(*) FROM executions GROUP BY status"
+        ).fetchall())
+        return {
+            "path": self.path,
+            "running": counts.get(RUNNING, 0),
+            "finished": counts.get(FINISHED, 0),
+            "stopped": counts.get(STOPPED, 0),
+            "retention": self.retention
+        }
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+/execute流量回放工具
+按记录的到达间隔（可按比例加速或减速）把TRAFFIC_LOG中的请求重新发送到服务，
+输出每个请求的延迟；diff子命令比较两次回放（如两个版本）的延迟分布
+
+示例:
+    python replay.py run traffic.jsonl --output before.json
+    python replay.py run traffic.jsonl --speed 2 --backend zygote --output after.json
+    python replay.py diff before.json after.json --max-regression 0.1
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from benchmark import LocalServer, compare_reports, fetch_json, latency_summary, parse_env, post_json
+from traffic import read_traffic
+
+
+def import_group(imports: Optional[List[str]]) -> str:
+    """按导入的模块对请求分组，未导入模块的为stdlib"""
+    return ",".join(sorted(imports)) if imports else "stdlib"
+
+
+def replay(base_url: str, entries: List[Dict], speed: float, timeout: float, max_in_flight: int,
+           coalesce: bool = False) -> List[Dict]:
+    """按原始到达间隔除以speed发送请求（开环），返回按记录顺序排列的结果
+
+    默认关闭请求合并，使每个请求都实际执行，延迟不受回放时请求重叠方式的影响
+    """
+    results: List[Optional[Dict]] = [None] * len(entries)
+    lock = threading.Lock()
+    origin = entries[0]["ts"] if entries else 0.0
+
+    def send(index: int, entry: Dict, scheduled: float):
+        try:
+            payload = {"code": entry["code"], "coalesce": coalesce}
+            status, body = post_json(f"{base_url}/execute", payload, timeout)
+            error = "" if status == 200 else str(body.get("error", ""))[:200]
+        except Exception as e:
+            status, body, error = 0, {}, str(e)
+        latency = time.perf_counter() - scheduled
+        result = {
+            "index": index,
+            "offset": round(entry["ts"] - origin, 6),
+            "latency": round(latency, 4),
+            "status": status,
+            "success": body.get("success") if status == 200 else None,
+            "original_status": entry.get("status"),
+            "original_success": entry.get("success"),
+            "original_duration": entry.get("duration"),
+            "group": import_group(body.get("imports_used") or entry.get("imports"))
+        }
+        if error:
+            result["error"] = error
+        with lock:
+            results[index] = result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for index, entry in enumerate(entries):
+            # 延迟从计划发送时间开始计算，服务变慢时不会推迟后续请求
+            scheduled = start + (entry["ts"] - origin) / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, index, entry, scheduled)
+    return results
+
+
+def summarize(results: List[Dict], elapsed: Optional[float] = None) -> Dict:
+    """汇总一组回放结果，字段与benchmark.py的报告一致"""
+    rejected = [r for r in results if r["status"] in (429, 503)]
+    served = [r for r in results if r["status"] not in (429, 503)]
+    errors = [r for r in served if r["status"] != 200]
+    summary = {
+        "requests": len(results),
+        "errors": len(errors),
+        "rejected": len(rejected),
+        "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+        "rejection_rate": round(len(rejected) / len(results), 4) if results else 0.0,
+        "latency": latency_summary([r["latency"] for r in served]),
+        # 与原始记录结果（成功/失败）不一致的请求数，匿名化的代码通常会改变结果
+        "outcome_mismatches": sum(
+            1 for r in served
+            if r["status"] == 200 and r["original_success"] is not None and r["success"] != r["original_success"]
+        )
+    }
+    if elapsed:
+        summary["throughput"] = round(len(served) / elapsed, 3)
+        summary["duration"] = round(elapsed, 3)
+    return summary
+
+
+def build_report(results: List[Dict], elapsed: float, config: Dict) -> Dict:
+    groups: Dict[str, List[Dict]] = {}
+    for result in results:
+        groups.setdefault(result["group"], []).append(result)
+    return {
+        "config": config,
+        "summary": summarize(results, elapsed),
+        "groups": {name: summarize(items) for name, items in sorted(groups.items())},
+        "requests": results
+    }
+
+
+def _ratio(new: Optional[float], old: Optional[float]) -> Optional[float]:
+    return round(new / old, 3) if new is not None and old else None
+
+
+def diff_reports(base: Dict, new: Dict) -> Dict:
+    """比较两次回放的延迟分布
+
+    除整体和按导入分组的分位数外，对两次回放中同一条记录的延迟逐个求比值，
+    比值分布不受两次回放中负载差异的影响。
+    """
+    def compare(old: Dict, current: Dict) -> Dict:
+        result = {}
+        for key in ("mean", "p50", "p95", "p99", "max"):
+            before, after = old["latency"].get(key), current["latency"].get(key)
+            result[key] = {"base": before, "new": after, "ratio": _ratio(after, before)}
+        result["error_rate"] = {"base": old["error_rate"], "new": current["error_rate"]}
+        return result
+
+    groups = {}
+    for name in sorted(set(base["groups"]) & set(new["groups"])):
+        groups[name] = compare(base["groups"][name], new["groups"][name])
+
+    ratios = sorted(
+        after["latency"] / before["latency"]
+        for before, after in zip(base["requests"], new["requests"])
+        if before["status"] == 200 and after["status"] == 200 and before["latency"] > 0
+    )
+    paired = latency_summary(ratios)
+    paired.pop("max", None)
+
+    return {
+        "summary": compare(base["summary"], new["summary"]),
+        "groups": groups,
+        "paired_latency_ratio": paired,
+        "base_config": base.get("config"),
+        "new_config": new.get("config")
+    }
+
+
+def cmd_run(args) -> int:
+    entries = list(read_traffic(args.log))
+    if args.skip_rejected:
+        entries = [entry for entry in entries if entry.get("status") not in (429, 503)]
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        print("流量日志中没有可回放的请求", file=sys.stderr)
+        return 1
+
+    server_env = parse_env(args.env)
+    if args.backend:
+        server_env["EXECUTION_BACKEND"] = args.backend
+    server = None
+    base_url = args.url.rstrip("/") if args.url else None
+    if base_url is None:
+        server = LocalServer(server_env, args.server_log)
+        print(f"启动本地服务: {server.url}", file=sys.stderr)
+        server.start()
+        base_url = server.url
+
+    try:
+        span = (entries[-1]["ts"] - entries[0]["ts"]) / args.speed
+        print(f"回放{len(entries)}个请求，预计{span:.1f}秒（速度x{args.speed}）", file=sys.stderr)
+        started = time.perf_counter()
+        results = replay(base_url, entries, args.speed, args.timeout, args.max_in_flight, args.coalesce)
+        elapsed = time.perf_counter() - started
+        server_config = fetch_json(f"{base_url}/config") or {}
+    finally:
+        if server is not None:
+            server.stop()
+
+    config = {
+        "log": args.log,
+        "url": base_url if server is None else "local",
+        "execution_backend": server_config.get("execution_backend"),
+        "server_env": server_env,
+        "speed": args.speed,
+        "coalesce": args.coalesce,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    }
+    write_json(build_report(results, elapsed, config), args.output)
+    return 0
+
+
+def cmd_diff(args) -> int:
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    if len(base["requests"]) != len(new["requests"]):
+        print("警告: 两次回放的请求数不同，逐请求比较只使用前面共同的部分", file=sys.stderr)
+    report = diff_reports(base, new)
+    regressions = compare_reports(new, base, args.max_regression)
+    report["regressions"] = regressions
+    for line in regressions:
+        print(f"性能回退: {line}", file=sys.stderr)
+    write_json(report, args.output)
+    return 1 if regressions else 0
+
+
+def write_json(report: Dict, path: Optional[str]):
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"报告已写入: {path}", file=sys.stderr)
+    else:
+        print(text)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="/execute流量回放工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="回放流量日志")
+    run.add_argument("log", help="TRAFFIC_LOG记录的流量日志")
+    run.add_argument("--url", help="已运行服务的地址；不指定时在本地启动服务")
+    run.add_argument("--backend", choices=["subprocess", "pool", "zygote"],
+                     help="本地启动服务时使用的执行后端（EXECUTION_BACKEND）")
+    run.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                     help="本地启动服务时额外设置的环境变量，可重复")
+    run.add_argument("--server-log", help="本地服务的日志文件")
+    run.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，2表示到达间隔缩短一半")
+    run.add_argument("--limit", type=int, default=0, help="只回放前N个请求")
+    run.add_argument("--skip-rejected", action="store_true", help="跳过记录时被准入控制拒绝的请求")
+    run.add_argument("--max-in-flight", type=int, default=256, help="同时等待响应的请求数上限")
+    run.add_argument("--timeout", type=float, default=120, help="单个请求的超时时间（秒）")
+    run.add_argument("--coalesce", action="store_true",
+                     help="允许服务合并相同的并发请求（默认关闭，每个请求都实际执行）")
+    run.add_argument("--output", help="报告写入的文件，默认输出到标准输出")
+    run.set_defaults(func=cmd_run)
+
+    diff = subparsers.add_parser("diff", help="比较两次回放的延迟分布")
+    diff.add_argument("base", help="基线回放报告")
+    diff.add_argument("new", help="新版本回放报告")
+    diff.add_argument("--max-regression", type=float, default=0.1, help="允许的回退比例（默认0.1）")
+    diff.add_argument("--output", help="报告写入的文件，默认输出到标准输出")
+    diff.set_defaults(func=cmd_diff)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "speed", 1.0) <= 0:
+        parser.error("--speed必须大于0")
+    try:
+        return args.func(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+执行结果缓存
+文档和教程中的示例代码会被原样提交成千上万次。客户端传入 cache: "allow" 时，
+以代码、所用依赖的版本和解释器版本为键缓存成功的执行结果，命中时直接返回，不再启动子进程。
+内存中为有界LRU；磁盘层供同一台机器上的多个worker共享，两层都按TTL过期。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALLOW = "allow"
+CACHE_BYPASS = "bypass"
+CACHE_MODES = (CACHE_ALLOW, CACHE_BYPASS)
+
+# 与单次执行相关、不应随缓存返回的字段
+VOLATILE_FIELDS = ("execution_id", "execution_time", "queue_wait_time", "timings", "trace", "cache")
+
+
+def cache_key(code: str, packages: Iterable[Tuple[str, str]], environment: Iterable[str]) -> str:
+    """缓存键：代码、依赖 (发行包, 版本) 和运行环境描述的哈希"""
+    payload = json.dumps([code, sorted(packages), list(environment)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(result: Dict) -> bool:
+    """只缓存成功且完整的结果
+
+    success只表示进程已结束，代码调用sys.exit(1)或进程被停止、被信号终止时同样为True，
+    因此要求子进程退出码为0且未被停止；错误输出中可能是异常、超出资源限制等与环境有关的信息，
+    有错误输出的结果也不缓存；输出被截断的结果引用了按执行保存的溢出文件，产物可能被淘汰。
+    """
+    return (
+        result.get("success") is True
+        and result.get("returncode") == 0
+        and not result.get("stopped")
+        and not result.get("error")
+        and not result.get("output_truncated")
+        and not result.get("error_truncated")
+        and not result.get("artifacts")
+    )
+
+
+class ResultCache:
+    """两层结果缓存
+
+    - 内存层：OrderedDict实现的LRU，按序列化后的字节数计入memory_bytes预算
+    - 磁盘层：root下按键哈希分目录的JSON文件，总大小超过disk_bytes时按修改时间淘汰；
+      root为None或disk_bytes为0时只使用内存层
+    - 条目超过ttl秒后过期
+    """
+
+    def __init__(self, root: Optional[Path], memory_bytes: int = 64 * 1024 * 1024,
+                 disk_bytes: int = 512 * 1024 * 1024, ttl: float = 3600):
+        self.root = Path(root) if root is not None and disk_bytes > 0 else None
+        if self.root is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes if self.root is not None else 0
+        self.ttl = ttl
+
+        # 键 -> (写入时间, 序列化后的结果)
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self._disk_used = sum(size for _, size, _ in self._disk_files()) if self.root is not None else 0
+
+        # 统计信息
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """查找结果，未命中或已过期时返回None；返回的字典可以直接修改"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return self._load(payload, stored_at)
+                self._remove(key)
+                self.expired += 1
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, *entry)
+        return self._load(entry[1], entry[0])
+
+    @staticmethod
+    def _load(payload: bytes, stored_at: float) -> Dict:
+        result = json.loads(payload)
+        result["cached_at"] = stored_at
+        return result
+
+    def put(self, key: str, result: Dict) -> bool:
+        """缓存结果（去掉与单次执行相关的字段），结果不可缓存或超过内存预算时返回False"""
+        if not is_cacheable(result):
+            with self._lock:
+                self.skipped += 1
+            return False
+        entry = {name: value for name, value in result.items() if name not in VOLATILE_FIELDS}
+        payload = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        if len(payload) > self.memory_bytes:
+            with self._lock:
+                self.skipped += 1
+            return False
+
+        stored_at = time.time()
+        with self._lock:
+            self._insert(key, stored_at, payload)
+            self.stores += 1
+        if self.root is not None:
+            self._write_disk(key, payload)
+        return True
+
+    def _insert(self, key: str, stored_at: float, payload: bytes):
+        """加入内存层并按预算淘汰，调用方持有锁"""
+        self._remove(key)
+        self._entries[key] = (stored_at, payload)
+        self._memory_used += len(payload)
+        while self._memory_used > self.memory_bytes and self._entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._memory_used -= len(evicted)
+            self.evicted += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._memory_used -= len(entry[1])
+
+    def _read_disk(self, key: str, now: float) -> Optional[Tuple[float, bytes]]:
+        if self.root is None:
+            return None
+        path = self._path(key)
+        try:
+            stored_at = path.stat().st_mtime
+            if now - stored_at > self.ttl:
+                path.unlink()
+                with self._lock:
+                    self.expired += 1
+                return None
+            return stored_at, path.read_bytes()
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, payload: bytes):
+        path = self._path(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            # 先写临时文件再改名，其他worker不会读到写了一半的结果
+            fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".incoming-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(payload)
+                os.replace(temp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                raise
+        except OSError as e:
+            logger.warning(f"写入结果缓存失败: {e}")
+            return
+        with self._lock:
+            self._disk_used += len(payload)
+            over_budget = self._disk_used > self.disk_bytes
+        if over_budget:
+            self._enforce_disk_budget()
+
+    def _disk_files(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for path in self.root.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _enforce_disk_budget(self):
+        """删除过期和最早写入的结果，直到低于磁盘预算（以目录中的实际文件为准）"""
+        now = time.time()
+        entries = sorted(self._disk_files())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for stored_at, size, path in entries:
+            if total <= self.disk_bytes and now - stored_at <= self.ttl:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._disk_used = total
+            self.evicted += removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_used = 0
+        if self.root is not None:
+            for _, _, path in self._disk_files():
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            with self._lock:
+                self._disk_used = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_used,
+                "memory_budget": self.memory_bytes,
+                "disk_path": str(self.root) if self.root is not None else None,
+                "disk_bytes": self._disk_used,
+                "disk_budget": self.disk_bytes,
+                "ttl": self.ttl,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "skipped": self.skipped,
+                "evicted": self.evicted,
+                "expired": self.expired
+            }
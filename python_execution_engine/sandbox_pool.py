@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+沙箱工作目录池
+在内存文件系统上预先创建工作目录，执行结束后由后台线程清空并放回池中，
+目录的创建和删除不再出现在请求路径上
+"""
+
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Set
+
+logger = logging.getLogger(__name__)
+
+# 内存文件系统，存在时作为默认的沙箱根目录
+SHM_DIR = Path("/dev/shm")
+
+
+def default_sandbox_root(base_dir: Path) -> Path:
+    """优先使用/dev/shm，不可写时退回到base_dir下"""
+    if SHM_DIR.is_dir() and os.access(SHM_DIR, os.W_OK):
+        return SHM_DIR / "python_execution"
+    return Path(base_dir) / "sandboxes"
+
+
+def directory_size(path: Path) -> int:
+    """目录下所有文件占用的字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _unmount_tree(path: Path):
+    """卸载path及其下的全部挂载点（按/proc/self/mounts，从最深的开始）"""
+    prefix = str(path)
+    try:
+        with open("/proc/self/mounts") as f:
+            mountpoints = [line.split()[1] for line in f if line.strip()]
+    except OSError:
+        return
+    # /proc/mounts中的空格等字符按八进制转义
+    mountpoints = [point.encode().decode("unicode_escape") for point in mountpoints]
+    targets = [point for point in mountpoints if point == prefix or point.startswith(prefix + "/")]
+    for point in sorted(targets, key=len, reverse=True):
+        subprocess.run(["umount", "-l", point], capture_output=True)
+
+
+class SandboxPool:
+    """可复用的沙箱工作目录池
+
+    - acquire() 返回已清空的目录，池中没有空闲目录时临时创建一个
+    - release() 立即返回，由后台线程清空目录后放回池中
+    - 每个目录的空间配额为quota_mb：有权限时每个目录挂载一个限定大小的tmpfs，
+      写满即失败；否则在执行结束后检查目录大小
+    """
+
+    def __init__(self, root: Path, size: int, quota_mb: int = 64):
+        self.root = Path(root)
+        # 本实例独占的目录，start()时在root下创建；同一进程中的多个池互不冲突
+        self.pool_dir = self.root
+        self.size = max(1, size)
+        self.quota_bytes = quota_mb * 1024 * 1024
+
+        self._idle = queue.Queue()
+        self._dirty = queue.Queue()
+        self._members: Set[Path] = set()
+        self._mounted: Set[Path] = set()
+        self._lock = threading.Lock()
+        self._mount_supported = True
+        self._cleaner = threading.Thread(target=self._clean_loop, name="sandbox-cleaner", daemon=True)
+
+        # 统计信息
+        self.acquired = 0
+        self.overflow = 0
+        self.recycled = 0
+        self.discarded = 0
+        self.quota_exceeded = 0
+
+    def start(self):
+        """创建沙箱目录并启动后台清理线程"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._remove_stale_pools()
+        self.pool_dir = Path(tempfile.mkdtemp(prefix=f"pool-{os.getpid()}-", dir=self.root))
+        for index in range(self.size):
+            path = self.pool_dir / f"sandbox-{index}"
+            try:
+                self._prepare(path)
+            except OSError as e:
+                logger.error(f"创建沙箱目录失败: {path}: {e}")
+                continue
+            with self._lock:
+                self._members.add(path)
+            self._idle.put(path)
+        if len(self._members) < self.size:
+            logger.error(
+                f"沙箱池只创建了{len(self._members)}/{self.size}个目录，其余执行将临时创建目录: {self.pool_dir}"
+            )
+        self._cleaner.start()
+
+    def _remove_stale_pools(self):
+        """删除已退出进程遗留的池目录和旧版的 sandbox-<pid>-<n> 目录（包括其中的tmpfs挂载点）"""
+        for path in [*self.root.glob("pool-*-*"), *self.root.glob("sandbox-*-*")]:
+            try:
+                pid = int(path.name.split("-")[1])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _process_exists(pid):
+                _unmount_tree(path)
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _prepare(self, path: Path):
+        """创建目录，并尝试挂载限定大小的tmpfs"""
+        if path.exists():
+            self._unmount(path)
+            shutil.rmtree(path, ignore_errors=True)
+        path.mkdir(mode=0o700)
+        if self._mount_supported and self.quota_bytes:
+            result = subprocess.run(
+                ["mount", "-t", "tmpfs", "-o", f"size={self.quota_bytes},mode=0700", "tmpfs", str(path)],
+                capture_output=True,
+                text=True
+            )
+            if result.returncode == 0:
+                with self._lock:
+                    self._mounted.add(path)
+            else:
+                # 没有挂载权限时不再尝试，改为执行后检查目录大小
+                self._mount_supported = False
+                logger.info(f"无法为沙箱挂载tmpfs，执行后检查目录大小: {result.stderr.strip()}")
+
+    def _unmount(self, path: Path):
+        with self._lock:
+            mounted = path in self._mounted
+            self._mounted.discard(path)
+        if mounted:
+            subprocess.run(["umount", "-l", str(path)], capture_output=True)
+
+    def acquire(self) -> Path:
+        """取出一个已清空的沙箱目录"""
+        try:
+            path = self._idle.get_nowait()
+        except queue.Empty:
+            # 池已用完时临时创建，用完后直接删除
+            path = Path(tempfile.mkdtemp(dir=self.pool_dir))
+            with self._lock:
+                self.overflow += 1
+        with self._lock:
+            self.acquired += 1
+        return path
+
+    def release(self, path: Path):
+        """归还沙箱目录，清理在后台进行"""
+        self._dirty.put(path)
+
+    def exceeds_quota(self, path: Path) -> bool:
+        """执行结束后检查目录是否超出配额（已挂载tmpfs的目录由文件系统限制）"""
+        with self._lock:
+            if not self.quota_bytes or path in self._mounted:
+                return False
+        if directory_size(path) > self.quota_bytes:
+            with self._lock:
+                self.quota_exceeded += 1
+            return True
+        return False
+
+    def _clean_loop(self):
+        while True:
+            path = self._dirty.get()
+            if path is None:
+                return
+            with self._lock:
+                is_member = path in self._members
+            if not is_member:
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+
+            if self._reset(path):
+                with self._lock:
+                    self.recycled += 1
+                self._idle.put(path)
+                continue
+
+            # 无法清空（如权限被修改）时重建目录
+            with self._lock:
+                self.discarded += 1
+            try:
+                self._prepare(path)
+                self._idle.put(path)
+            except OSError as e:
+                logger.error(f"重建沙箱目录失败: {path}: {e}")
+                with self._lock:
+                    self._members.discard(path)
+
+    @staticmethod
+    def _reset(path: Path) -> bool:
+        """删除目录中的全部内容，成功时返回True"""
+        try:
+            for entry in os.scandir(path):
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+            os.chmod(path, 0o700)
+            return True
+        except OSError as e:
+            logger.warning(f"清空沙箱目录失败: {path}: {e}")
+            return False
+
+    def shutdown(self):
+        """停止清理线程并删除全部沙箱目录"""
+        self._dirty.put(None)
+        with self._lock:
+            members = list(self._members)
+            self._members.clear()
+        for path in members:
+            self._unmount(path)
+            shutil.rmtree(path, ignore_errors=True)
+        if self.pool_dir != self.root:
+            # 卸载池目录下仍存在的全部挂载点（如重建失败的目录）后删除池目录
+            _unmount_tree(self.pool_dir)
+            shutil.rmtree(self.pool_dir, ignore_errors=True)
+
+    def stats(self) -> Dict:
+        """沙箱目录池状态"""
+        with self._lock:
+            return {
+                "root": str(self.root),
+                "pool_dir": str(self.pool_dir),
+                "size": len(self._members),
+                "idle": self._idle.qsize(),
+                "cleaning": self._dirty.qsize(),
+                "tmpfs_mounted": len(self._mounted),
+                "quota_mb": self.quota_bytes // 1024 // 1024,
+                "acquired": self.acquired,
+                "overflow": self.overflow,
+                "recycled": self.recycled,
+                "discarded": self.discarded,
+                "quota_exceeded": self.quota_exceeded
+            }
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+沙箱子进程入口
+在子解释器中加载并运行用户脚本，供预热进程池等执行后端使用；
+--session模式下常驻运行，按顺序在同一个全局命名空间中执行代码单元
+"""
+
+import builtins
+import io
+import json
+import linecache
+import os
+import runpy
+import sys
+import traceback
+
+
+def _print_user_traceback(script_path: str):
+    """打印异常堆栈，去掉执行器自身的调用帧"""
+    exc_type, exc_value, tb = sys.exc_info()
+    # 跳过runpy和本模块的帧，从用户脚本开始显示
+    while tb is not None and tb.tb_frame.f_code.co_filename != script_path:
+        tb = tb.tb_next
+    traceback.print_exception(exc_type, exc_value, tb)
+
+
+# 产物目录（位于脚本所在目录，由引擎创建），运行结束时仍打开的matplotlib图像保存到这里
+ARTIFACTS_DIRNAME = "artifacts"
+
+
+def save_open_figures(artifacts_dir: str, prefix: str = "figure"):
+    """把仍打开的matplotlib图像保存为PNG并关闭，用户代码未使用pyplot或目录不存在时不做任何事"""
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    if pyplot is None or not os.path.isdir(artifacts_dir):
+        return
+    try:
+        for number in pyplot.get_fignums():
+            path = os.path.join(artifacts_dir, f"{prefix}-{number}.png")
+            suffix = 1
+            # 不覆盖用户自己保存的同名文件
+            while os.path.exists(path):
+                suffix += 1
+                path = os.path.join(artifacts_dir, f"{prefix}-{number}-{suffix}.png")
+            pyplot.figure(number).savefig(path, format="png")
+        pyplot.close("all")
+    except Exception as e:
+        print(f"保存图像失败: {e}", file=sys.stderr)
+
+
+def run_script(script_path: str, code=None) -> int:
+    """以__main__身份运行用户脚本，返回退出码
+
+    code为已编译的代码对象时直接执行，不再读取和编译脚本文件。
+    """
+    script_path = os.path.abspath(script_path)
+
+    # 与 `python main.py` 保持一致的argv和模块搜索路径
+    sys.argv = [script_path]
+    sys.path[0] = os.path.dirname(script_path)
+
+    exit_code = 0
+    try:
+        if code is None:
+            runpy.run_path(script_path, run_name='__main__')
+        else:
+            exec(code, {"__name__": "__main__", "__file__": script_path, "__builtins__": builtins})
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        _print_user_traceback(script_path)
+        exit_code = 1
+    finally:
+        save_open_figures(os.path.join(os.path.dirname(script_path), ARTIFACTS_DIRNAME))
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    return exit_code
+
+
+def unbuffer_stdio():
+    """把sys.stdout/sys.stderr换成不缓冲的文件对象，效果与 python -u 相同"""
+    sys.stdout = io.TextIOWrapper(os.fdopen(1, "wb", buffering=0, closefd=False),
+                                  encoding="utf-8", errors="backslashreplace", write_through=True)
+    sys.stderr = io.TextIOWrapper(os.fdopen(2, "wb", buffering=0, closefd=False),
+                                  encoding="utf-8", errors="backslashreplace", write_through=True)
+
+
+def _redirect_stdin_to_devnull():
+    """任务读取完毕后，把标准输入指向/dev/null，避免用户代码读到任务管道"""
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    sys.stdin = open(0, 'r', closefd=False)
+
+
+def worker_main() -> int:
+    """预热worker：阻塞等待一个任务，执行后退出"""
+    line = sys.stdin.readline()
+    if not line:
+        # 引擎已关闭管道，直接退出
+        return 0
+
+    job = json.loads(line)
+    _redirect_stdin_to_devnull()
+    os.chdir(job['cwd'])
+    return run_script(job['script'])
+
+
+def _redirect_output(stdout_path: str, stderr_path: str):
+    """把标准输出和错误（包括子进程和C扩展的输出）重定向到文件"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for fd, path in ((1, stdout_path), (2, stderr_path)):
+        target = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.dup2(target, fd)
+        os.close(target)
+
+
+def run_cell(cell: dict, namespace: dict) -> dict:
+    """在会话命名空间中执行一个代码单元，返回执行状态
+
+    输出写入cell指定的文件；被SIGINT中断时返回interrupted，会话保持可用。
+    """
+    filename = cell['filename']
+    _redirect_output(cell['stdout'], cell['stderr'])
+    reply = {"exit_code": 0, "interrupted": False}
+    try:
+        # 登记源码，异常堆栈中可以显示代码单元的源码行
+        linecache.cache[filename] = (len(cell['code']), None, cell['code'].splitlines(True), filename)
+        code = compile(cell['code'], filename, 'exec')
+        exec(code, namespace)
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            reply["exit_code"] = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            reply["exit_code"] = 1
+    except KeyboardInterrupt:
+        reply["exit_code"] = 1
+        reply["interrupted"] = True
+        _print_user_traceback(filename)
+    except BaseException:
+        reply["exit_code"] = 1
+        _print_user_traceback(filename)
+    finally:
+        # 与笔记本一致，每个代码单元结束后输出并关闭图像
+        save_open_figures(cell['artifacts'], f"cell{cell['execution_count']}-figure")
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # 代码单元之间的输出（如后台线程）丢弃
+        _redirect_output(os.devnull, os.devnull)
+    return reply
+
+
+def session_main() -> int:
+    """会话模式：从标准输入逐行读取代码单元，执行后把状态写回标准输出
+
+    两个管道在启动时复制到新的文件描述符，用户代码的标准输入指向/dev/null，
+    标准输出和错误按代码单元重定向到文件。
+    """
+    commands = os.fdopen(os.dup(0), 'r')
+    replies = os.fdopen(os.dup(1), 'w')
+    _redirect_stdin_to_devnull()
+    _redirect_output(os.devnull, os.devnull)
+    sys.argv = ['']
+    sys.path[0] = os.getcwd()
+
+    namespace = {"__name__": "__main__", "__builtins__": builtins}
+    while True:
+        try:
+            line = commands.readline()
+            if not line:
+                # 引擎关闭了管道
+                return 0
+            reply = run_cell(json.loads(line), namespace)
+            replies.write(json.dumps(reply) + "\n")
+            replies.flush()
+        except KeyboardInterrupt:
+            # 中断信号在代码单元结束后才到达
+            continue
+
+
+def main() -> int:
+    if len(sys.argv) >= 2 and sys.argv[1] == '--worker':
+        return worker_main()
+
+    if len(sys.argv) >= 2 and sys.argv[1] == '--session':
+        return session_main()
+
+    if len(sys.argv) < 2:
+        print("用法: sandbox_runner.py <script> | --worker | --session", file=sys.stderr)
+        return 2
+
+    return run_script(sys.argv[1])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
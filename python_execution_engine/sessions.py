@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+有状态执行会话
+每个会话是一个常驻的sandbox_runner.py --session进程，代码单元在同一个全局命名空间中按顺序执行，
+变量、已导入的模块和已加载的数据在调用之间保留；空闲超时的会话由后台线程回收
+"""
+
+import json
+import logging
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from limits import CgroupV2Manager, MeteredPopen, ResourceLimits, usage_summary
+from outputs import OutputStore, STREAMS
+from registry import process_usage
+from sandbox_runner import ARTIFACTS_DIRNAME
+from worker_pool import RUNNER_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+# 超时后发送SIGINT，等待代码单元响应中断的时间（秒），超过后结束会话
+INTERRUPT_GRACE = 2.0
+
+
+class SessionLimitExceeded(Exception):
+    """会话数已达上限"""
+
+
+class SessionBusy(Exception):
+    """会话正在执行其他代码单元"""
+
+
+class Session:
+    """一个常驻解释器进程及其工作目录"""
+
+    def __init__(self, session_id: str, root: Path, limits: ResourceLimits, cgroups: CgroupV2Manager,
+                 output_store: Optional[OutputStore] = None):
+        self.session_id = session_id
+        self.output_store = output_store
+        self.root = root
+        self.work_dir = root / "work"
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        # 产物目录，代码单元结束时打开的图像保存到这里；记录已收集文件的状态，只收集新增或修改的文件
+        self.artifacts_dir = self.work_dir / ARTIFACTS_DIRNAME
+        self.artifacts_dir.mkdir(exist_ok=True)
+        self.artifact_state: Dict[str, tuple] = {}
+        self.limits = limits
+        self.created_at = time.time()
+        self.last_used = time.time()
+        self.execution_count = 0
+        self.running = False
+        # 同一会话的代码单元串行执行
+        self._lock = threading.Lock()
+        self._buffer = b""
+
+        self.cgroup = cgroups.create(f"session-{session_id}", limits)
+        try:
+            self.process = MeteredPopen(
+                [sys.executable, str(RUNNER_SCRIPT), "--session"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=str(self.work_dir),
+                preexec_fn=limits.preexec_fn(self.cgroup)
+            )
+        except Exception:
+            if self.cgroup is not None:
+                self.cgroup.remove()
+            raise
+        self.process.cgroup = self.cgroup
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def execute(self, code: str, timeout: float, execution_id: Optional[str] = None) -> Dict:
+        """执行一个代码单元，返回输出、错误和退出状态
+
+        超时后发送SIGINT中断代码单元，会话保持可用；进程不响应中断或已退出时会话结束。
+        配置了输出目录时，超过内存上限的输出按execution_id溢出到文件，结果的captures为各流的OutputCapture。
+        """
+        if not self._lock.acquire(blocking=False):
+            raise SessionBusy(f"会话正在执行其他代码: {self.session_id}")
+        try:
+            self.running = True
+            self.execution_count += 1
+            stdout_path = self.root / f"stdout-{self.execution_count}"
+            stderr_path = self.root / f"stderr-{self.execution_count}"
+            cell = {
+                "code": code,
+                "filename": f"<cell-{self.execution_count}>",
+                "stdout": str(stdout_path),
+                "stderr": str(stderr_path),
+                "artifacts": str(self.artifacts_dir),
+                "execution_count": self.execution_count
+            }
+            started = time.monotonic()
+            timed_out = False
+            try:
+                self.process.stdin.write((json.dumps(cell) + "\n").encode("utf-8"))
+                self.process.stdin.flush()
+                reply = self._read_reply(started + timeout)
+                if reply is None and self.alive:
+                    timed_out = True
+                    self.interrupt()
+                    reply = self._read_reply(time.monotonic() + INTERRUPT_GRACE)
+            except (OSError, ValueError):
+                # 会话进程已退出或已被回收
+                reply = None
+
+            result = {
+                "execution_count": self.execution_count,
+                "timed_out": timed_out,
+                "wall_time": round(time.monotonic() - started, 3)
+            }
+            result.update(self._collect_output(stdout_path, stderr_path, execution_id))
+            if reply is None:
+                # 进程已退出（如超出内存限制）或不响应中断
+                self.close()
+                result["exit_code"] = self.process.returncode
+                result["interrupted"] = timed_out
+                result["session_closed"] = True
+            else:
+                result["exit_code"] = reply["exit_code"]
+                result["interrupted"] = reply["interrupted"]
+                result["session_closed"] = False
+            return result
+        finally:
+            self.running = False
+            self.last_used = time.time()
+            self._lock.release()
+
+    def _read_reply(self, deadline: float) -> Optional[Dict]:
+        """读取一行执行状态，超时或进程退出时返回None"""
+        fd = self.process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return None
+            self._buffer += chunk
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return json.loads(line)
+
+    def _collect_output(self, stdout_path: Path, stderr_path: Path, execution_id: Optional[str]) -> Dict:
+        """读取代码单元的输出并删除输出文件"""
+        paths = {"stdout": stdout_path, "stderr": stderr_path}
+        if self.output_store is not None and execution_id:
+            captures = {
+                stream: self.output_store.capture_file(paths[stream], execution_id, stream)
+                for stream in STREAMS
+            }
+            output = {"output": captures["stdout"].text(), "error": captures["stderr"].text(), "captures": captures}
+        else:
+            output = {"output": self._read_output(stdout_path), "error": self._read_output(stderr_path)}
+        for path in paths.values():
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        return output
+
+    @staticmethod
+    def _read_output(path: Path) -> str:
+        try:
+            return path.read_bytes().decode("utf-8", errors="replace")
+        except OSError:
+            return ""
+
+    def interrupt(self) -> bool:
+        """向正在执行的代码单元发送SIGINT（引发KeyboardInterrupt）"""
+        if not self.running or not self.alive:
+            return False
+        try:
+            os.kill(self.process.pid, signal.SIGINT)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def close(self):
+        """结束会话进程并删除工作目录"""
+        if self.alive:
+            self.process.kill()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"会话进程未能及时退出: {self.session_id}")
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+        if self.cgroup is not None:
+            self.cgroup.remove()
+            self.cgroup = None
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def describe(self) -> Dict:
+        info = {
+            "session_id": self.session_id,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+            "idle_time": round(time.time() - self.last_used, 3),
+            "execution_count": self.execution_count,
+            "running": self.running,
+            "alive": self.alive,
+            "memory_limit_mb": self.limits.memory_mb
+        }
+        usage = process_usage(self.process.pid) if self.alive else None
+        if usage:
+            info["resource_usage"] = {"cpu_time": usage["cpu_time"], "rss_mb": usage["rss_mb"]}
+        elif self.process.returncode is not None:
+            info["resource_usage"] = usage_summary(self.process.rusage, time.time() - self.created_at)
+        return info
+
+
+class SessionManager:
+    """会话管理器：创建、查找和回收会话
+
+    - 会话总数不超过max_sessions，已满时先回收空闲超时的会话
+    - 空闲超过idle_ttl秒的会话由后台线程结束
+    - 创建会话时可以指定更低的内存上限，不能超过limits.memory_mb
+    """
+
+    def __init__(self, root: Path, limits: ResourceLimits, cgroup_parent: str = "",
+                 max_sessions: int = 20, idle_ttl: float = 1800, output_store: Optional[OutputStore] = None):
+        self.root = Path(root)
+        self.output_store = output_store
+        self.limits = limits
+        self.cgroups = CgroupV2Manager(cgroup_parent, limits)
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+
+        self._sessions: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reaper = threading.Thread(target=self._reap_loop, name="session-reaper", daemon=True)
+
+        # 统计信息
+        self.created = 0
+        self.expired = 0
+        self.rejected = 0
+
+        # 清理上次运行遗留的会话目录
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._reaper.start()
+
+    def create(self, memory_mb: int = 0) -> Session:
+        """创建会话，memory_mb为0或超过上限时使用上限；会话数已满时抛出SessionLimitExceeded"""
+        self._reap_expired()
+        limits = self.limits
+        if memory_mb and (not limits.memory_mb or memory_mb < limits.memory_mb):
+            limits = ResourceLimits(memory_mb, limits.cpu_seconds, limits.max_processes, limits.max_file_size_mb)
+
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                self.rejected += 1
+                raise SessionLimitExceeded(f"会话数已达上限（{self.max_sessions}）")
+            # 先占位，启动进程期间其他请求也计入上限
+            self._sessions[session_id] = None
+        try:
+            session = Session(session_id, self.root / session_id, limits, self.cgroups, self.output_store)
+        except Exception:
+            with self._lock:
+                self._sessions.pop(session_id, None)
+            shutil.rmtree(self.root / session_id, ignore_errors=True)
+            raise
+        with self._lock:
+            self._sessions[session_id] = session
+            self.created += 1
+        logger.info(f"已创建会话: {session_id}")
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def list(self) -> List[Session]:
+        with self._lock:
+            return [session for session in self._sessions.values() if session is not None]
+
+    def close(self, session_id: str) -> bool:
+        """结束会话，会话不存在时返回False"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.close()
+        logger.info(f"已结束会话: {session_id}")
+        return True
+
+    def discard(self, session: Session):
+        """移除进程已退出的会话"""
+        with self._lock:
+            if self._sessions.get(session.session_id) is session:
+                del self._sessions[session.session_id]
+
+    def _reap_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [
+                session for session in self._sessions.values()
+                if session is not None and not session.running
+                and (now - session.last_used > self.idle_ttl or not session.alive)
+            ]
+            for session in expired:
+                del self._sessions[session.session_id]
+            self.expired += len(expired)
+        for session in expired:
+            logger.info(f"回收空闲会话: {session.session_id}")
+            session.close()
+
+    def _reap_loop(self):
+        interval = max(1.0, min(60.0, self.idle_ttl / 4))
+        while not self._closed.wait(interval):
+            try:
+                self._reap_expired()
+            except Exception as e:
+                logger.error(f"回收会话时出错: {e}")
+
+    def shutdown(self):
+        """结束所有会话"""
+        self._closed.set()
+        with self._lock:
+            sessions = [session for session in self._sessions.values() if session is not None]
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            sessions = [session for session in self._sessions.values() if session is not None]
+            return {
+                "active": len(self._sessions),
+                "running": sum(1 for session in sessions if session.running),
+                "max_sessions": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+                "memory_limit_mb": self.limits.memory_mb,
+                "created": self.created,
+                "expired": self.expired,
+                "rejected": self.rejected
+            }
@@ -136,6 +136,103 @@ os.system("echo 'This should be blocked'")
         print(f"代码执行失败: {e}")
         return False
 
+def test_execute_stream():
+    """测试流式执行接口"""
+    print("\n测试流式执行接口...")
+    code = """
+import time
+for i in range(3):
+    print(f"第{i}行", flush=True)
+    time.sleep(0.2)
+"""
+    
+    try:
+        response = requests.post(
+            f"{BASE_URL}/execute/stream",
+            json={"code": code},
+            stream=True
+        )
+        print(f"状态码: {response.status_code}")
+        
+        events = []
+        event_name = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event_name = line[len("event: "):]
+            elif line.startswith("data: "):
+                payload = json.loads(line[len("data: "):])
+                events.append((event_name, payload))
+                print(f"{event_name}: {payload}")
+        
+        output = "".join(p["data"] for name, p in events if name == "stdout")
+        status = [p for name, p in events if name == "status"]
+        return output == "第0行\n第1行\n第2行\n" and status and status[-1]["success"]
+    except Exception as e:
+        print(f"流式执行失败: {e}")
+        return False
+
+def test_async_job():
+    """测试异步任务接口"""
+    print("\n测试异步任务接口...")
+    execution_id = f"job-{int(time.time() * 1000)}"
+    
+    try:
+        response = requests.post(
+            f"{BASE_URL}/jobs",
+            json={"code": "print('async job')", "execution_id": execution_id}
+        )
+        print(f"提交状态码: {response.status_code}")
+        if response.status_code != 202:
+            return False
+        
+        # 轮询任务结果
+        for _ in range(30):
+            job = requests.get(f"{BASE_URL}/jobs/{execution_id}").json()
+            if job["status"] == "completed":
+                break
+            time.sleep(0.5)
+        print(f"任务状态: {job['status']}")
+        print(f"任务结果: {job['result']}")
+        
+        # 重复提交应返回已有结果
+        duplicate = requests.post(
+            f"{BASE_URL}/jobs",
+            json={"code": "print('async job')", "execution_id": execution_id}
+        )
+        print(f"重复提交状态码: {duplicate.status_code}")
+        
+        return job["status"] == "completed" and duplicate.status_code == 200
+    except Exception as e:
+        print(f"异步任务测试失败: {e}")
+        return False
+
+def test_execute_batch():
+    """测试批量执行接口"""
+    print("\n测试批量执行接口...")
+    items = [f"print({i} * {i})" for i in range(5)]
+    
+    try:
+        response = requests.post(f"{BASE_URL}/execute/batch", json={"items": items})
+        print(f"状态码: {response.status_code}")
+        results = response.json()["results"]
+        outputs = [result["output"].strip() for result in results]
+        print(f"输出: {outputs}")
+        if outputs != [str(i * i) for i in range(5)]:
+            return False
+        
+        # NDJSON流式返回，按完成顺序逐行到达
+        response = requests.post(
+            f"{BASE_URL}/execute/batch",
+            json={"items": items, "stream": True},
+            stream=True
+        )
+        indexes = sorted(json.loads(line)["index"] for line in response.iter_lines() if line)
+        print(f"流式返回序号: {indexes}")
+        return indexes == list(range(5))
+    except Exception as e:
+        print(f"批量执行测试失败: {e}")
+        return False
+
 def test_packages_list():
     """测试包列表接口"""
     print("\n测试包列表接口...")
@@ -165,6 +262,24 @@ def test_config():
         print(f"获取配置失败: {e}")
         return False
 
+def test_metrics():
+    """测试Prometheus指标接口"""
+    print("\n测试指标接口...")
+    try:
+        requests.post(f"{BASE_URL}/execute", json={"code": "print('metrics')"})
+        response = requests.get(f"{BASE_URL}/metrics")
+        print(f"状态码: {response.status_code}")
+        text = response.text
+        for line in text.splitlines():
+            if line.startswith("pyexec_executions_total"):
+                print(line)
+        return (response.status_code == 200 and
+                'pyexec_executions_total{mode="execute",outcome="success"}' in text and
+                'pyexec_phase_duration_seconds_bucket{phase="run",le="+Inf"}' in text)
+    except Exception as e:
+        print(f"获取指标失败: {e}")
+        return False
+
 def main():
     """主测试函数"""
     print("=" * 50)
@@ -177,8 +292,12 @@ def main():
         ("带导入的代码执行", test_execute_with_imports),
         ("错误代码执行", test_execute_error),
         ("危险代码检测", test_dangerous_code),
+        ("流式执行", test_execute_stream),
+        ("异步任务", test_async_job),
+        ("批量执行", test_execute_batch),
         ("包列表接口", test_packages_list),
         ("配置接口", test_config),
+        ("指标接口", test_metrics),
     ]
     
     passed = 0
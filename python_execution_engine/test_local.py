@@ -78,6 +78,88 @@ print("导入测试完成")
     
     return result['success']
 
+def test_code_safety_analyzer():
+    """测试AST安全检查，包括通过属性调用绕过名称检查的写法"""
+    print("\n" + "=" * 50)
+    print("测试代码安全检查")
+    print("=" * 50)
+    
+    engine = PythonExecutionEngine()
+    blocked = [
+        "import builtins; builtins.__import__('os').system('echo PWNED')",
+        "from builtins import exec",
+        "import importlib\nimportlib.import_module('os')",
+        "import math\nmath.exec('1')",
+        "builtins.exec('print(1)')",
+        "import io\nio.open('x.txt', 'w')",
+        "import codecs\ncodecs.open('x.txt', 'w')",
+        "from pathlib import Path\nPath('x.txt').open('w')",
+        "open('x.txt', mode='a')",
+        "import os",
+        "eval('1')",
+        "print(().__class__.__subclasses__())",
+        "def f(:\n    pass",
+    ]
+    allowed = [
+        "print(open('data.txt').read())",
+        "import io\nio.open('data.txt', 'rb')",
+        "from pathlib import Path\nPath('data.txt').open()",
+        "import numpy as np\nprint(np.arange(3))",
+        "text = 'exec eval compile'\nprint(text)",
+    ]
+    failures = [code for code in blocked if engine._check_code_safety(code)[0]]
+    failures += [code for code in allowed if not engine._check_code_safety(code)[0]]
+    for code in failures:
+        print(f"❌ 判断错误: {code!r}")
+    
+    # 通过execute也不会启动子进程
+    result = engine.execute("import builtins; builtins.__import__('os').system('echo PWNED')")
+    report = engine.safety_analyzer.analyze("import numpy as np\nimport json")
+    return (not failures and not result["success"] and "PWNED" not in result["output"]
+            and report.imports == ("json", "numpy"))
+
+def test_side_effect_classifier():
+    """测试请求合并使用的副作用判断：结果可能随执行变化的代码不能被判定为无副作用"""
+    print("\n" + "=" * 50)
+    print("测试副作用判断")
+    print("=" * 50)
+    
+    from code_analysis import CodeSafetyAnalyzer
+    
+    analyzer = CodeSafetyAnalyzer(set(), set(), set())
+    effectful = [
+        "print(object())",
+        "print({'a', 'b', 'c'})",
+        "print({word for word in 'a b c'.split()})",
+        "print(set('abc'))",
+        "class A:\n    pass\nprint(A())",
+        "import torch\nprint(torch.rand(2))",
+        "from torch import randn\nprint(randn(2))",
+        "import scipy.stats\nprint(scipy.stats.norm.rvs())",
+        "from scipy.stats import norm\nprint(norm.rvs(size=3))",
+        "import numpy as np\nnp.random.seed(0)",
+        "from numpy.random import default_rng\nprint(default_rng().integers(10))",
+        "import pandas as pd\nprint(pd.DataFrame({'a': [1, 2]}).sample(1))",
+        "import time\nprint(time.time())",
+        "print(id([]))",
+    ]
+    pure = [
+        "print('hello')",
+        "print(sum(range(10)))",
+        "print({'a': 1, 'b': 2})",
+        "print(sorted(['b', 'a']))",
+        "import numpy as np\nprint(np.arange(6).reshape(2, 3) @ np.ones(3))",
+        "import math\nprint(math.sqrt(2))",
+        "from dataclasses import dataclass\n@dataclass\nclass P:\n    x: int\nprint(P(1))",
+        "class A:\n    def __repr__(self):\n        return 'A'\nprint(A())",
+    ]
+    failures = [code for code in effectful if analyzer.analyze(code).side_effect_free]
+    failures += [code for code in pure if not analyzer.analyze(code).side_effect_free]
+    for code in failures:
+        print(f"❌ 判断错误: {code!r}")
+    print(f"有副作用: {len(effectful)}个, 无副作用: {len(pure)}个, 错误: {len(failures)}个")
+    return not failures
+
 def test_process_management():
     """测试进程管理"""
     print("\n" + "=" * 50)
@@ -121,6 +203,1188 @@ print("完成")
     
     return success
 
+def test_worker_pool_execution():
+    """测试预热进程池执行后端"""
+    print("\n" + "=" * 50)
+    print("测试预热进程池执行后端")
+    print("=" * 50)
+    
+    os.environ["EXECUTION_BACKEND"] = "pool"
+    os.environ["WORKER_POOL_SIZE"] = "2"
+    try:
+        engine = PythonExecutionEngine()
+    finally:
+        os.environ.pop("EXECUTION_BACKEND")
+        os.environ.pop("WORKER_POOL_SIZE")
+    
+    results = []
+    for i in range(3):
+        result = engine.execute(f"print('pool run {i}')")
+        print(f"第{i + 1}次执行: 成功={result['success']}, 耗时={result['execution_time']}秒")
+        results.append(result['success'] and result['output'] == f"pool run {i}\n")
+    
+    print(f"进程池状态: {engine.worker_pool.stats()}")
+    engine.worker_pool.shutdown()
+    
+    return all(results)
+
+def test_zygote_execution():
+    """测试zygote预加载fork执行后端"""
+    print("\n" + "=" * 50)
+    print("测试zygote执行后端")
+    print("=" * 50)
+    
+    os.environ["EXECUTION_BACKEND"] = "zygote"
+    os.environ["ZYGOTE_PRELOAD"] = "json"
+    try:
+        engine = PythonExecutionEngine()
+    finally:
+        os.environ.pop("EXECUTION_BACKEND")
+        os.environ.pop("ZYGOTE_PRELOAD")
+    
+    code = """
+import json
+print(json.dumps({"zygote": True}))
+"""
+    
+    result = engine.execute(code)
+    engine.zygote.shutdown()
+    
+    print(f"执行成功: {result['success']}")
+    print(f"输出: {result['output']}")
+    print(f"fork耗时: {result.get('fork_time')}秒")
+    print(f"预加载节省: {result.get('preload_time_saved')}秒")
+    
+    return result['success'] and result['output'] == '{"zygote": true}\n'
+
+def test_zygote_bad_requests():
+    """测试zygote遇到格式错误的请求和提前断开的连接时关闭连接和文件描述符、终止子进程并继续服务"""
+    print("\n" + "=" * 50)
+    print("测试zygote异常请求")
+    print("=" * 50)
+    
+    import json
+    import select
+    import socket
+    from zygote import ZygoteServer
+    
+    work_dir = Path(tempfile.mkdtemp())
+    server = ZygoteServer(str(work_dir / "zygote.sock"), [])
+    server.start()
+    zygote_pid = server._process.pid
+    
+    def send(payload):
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(10)
+        conn.connect(server.socket_path)
+        socket.send_fds(conn, [payload], [out_w, err_w])
+        os.close(out_w)
+        os.close(err_w)
+        return conn, out_r, err_r
+    
+    def pipes_closed(*fds):
+        # 所有写端都关闭后读到EOF；超时说明zygote或子进程仍持有写端
+        closed = True
+        for fd in fds:
+            readable = select.select([fd], [], [], 10)[0]
+            closed = closed and bool(readable) and os.read(fd, 65536) == b""
+            os.close(fd)
+        return closed
+    
+    try:
+        # 格式错误的请求：连接被关闭，收到的管道写端被关闭
+        conn, out_r, err_r = send(b"not json\n")
+        try:
+            malformed_closed = conn.recv(1) == b""
+        except socket.timeout:
+            malformed_closed = False
+        conn.close()
+        malformed_fds_closed = pipes_closed(out_r, err_r)
+        
+        # 发出请求后立即断开：返回pid失败，子进程被终止而不是运行30秒
+        # 请求不以换行结尾，zygote读到连接关闭才开始处理，保证返回pid时连接已断开
+        script = work_dir / "sleep.py"
+        script.write_text("import time\ntime.sleep(30)\n")
+        payload = json.dumps({"script": str(script), "cwd": str(work_dir)}).encode()
+        conn, out_r, err_r = send(payload)
+        conn.close()
+        started = time.monotonic()
+        child_killed = pipes_closed(out_r, err_r) and time.monotonic() - started < 10
+        
+        alive = server._process.poll() is None and server._process.pid == zygote_pid
+        ok_script = work_dir / "ok.py"
+        ok_script.write_text("print('ok')\n")
+        process = server.spawn(ok_script, work_dir)
+        output = process.stdout.read()
+        process.wait(timeout=10)
+    finally:
+        server.shutdown()
+    
+    print(f"格式错误: 连接关闭 {malformed_closed}, 描述符关闭 {malformed_fds_closed}; "
+          f"断开后子进程终止: {child_killed}; zygote存活: {alive}; 之后的执行输出: {output!r}")
+    return malformed_closed and malformed_fds_closed and child_killed and alive and output == b"ok\n"
+
+def test_stream_unbuffered():
+    """测试未设置PYTHONUNBUFFERED时流式执行仍能实时收到输出"""
+    print("\n" + "=" * 50)
+    print("测试流式输出不缓冲")
+    print("=" * 50)
+    
+    code = "import time\nfor i in range(3):\n    print(i)\n    time.sleep(0.4)"
+    saved = os.environ.pop("PYTHONUNBUFFERED", None)
+    results = []
+    try:
+        for backend in ("subprocess", "pool", "zygote"):
+            os.environ["EXECUTION_BACKEND"] = backend
+            os.environ["ZYGOTE_PRELOAD"] = "json"
+            try:
+                engine = PythonExecutionEngine()
+            finally:
+                os.environ.pop("EXECUTION_BACKEND")
+                os.environ.pop("ZYGOTE_PRELOAD")
+            
+            started = time.monotonic()
+            arrivals = []
+            for event, payload in engine.execute_stream(code):
+                if event == "stdout":
+                    arrivals.append((round(time.monotonic() - started, 2), payload["data"]))
+            if engine.worker_pool is not None:
+                engine.worker_pool.shutdown()
+            if engine.zygote is not None:
+                engine.zygote.shutdown()
+            print(f"{backend}: {arrivals}")
+            # 第一行输出应在脚本结束（约1.2秒）之前到达
+            results.append("".join(data for _, data in arrivals) == "0\n1\n2\n" and arrivals[0][0] < 0.8)
+    finally:
+        if saved is not None:
+            os.environ["PYTHONUNBUFFERED"] = saved
+    return all(results)
+
+def test_venv_cache_eviction_race():
+    """测试虚拟环境构建完成后不会在交给调用方之前被并发的淘汰删除"""
+    print("\n" + "=" * 50)
+    print("测试虚拟环境缓存并发淘汰")
+    print("=" * 50)
+    
+    import concurrent.futures
+    from packages import VenvCache
+    
+    def fake_installer(packages, python_executable):
+        # 不联网：只在环境中写入占位文件
+        Path(python_executable).parent.parent.joinpath("installed.txt").write_text(",".join(packages))
+        return True, "已安装"
+    
+    class SlowPublishVenvCache(VenvCache):
+        # 拉长构建完成到调用方占用之间的间隔，使并发淘汰必然落在这段时间内
+        def _build(self, key, packages):
+            result = super()._build(key, packages)
+            time.sleep(0.1)
+            return result
+    
+    # 磁盘预算为0：每次获取和释放后都会尝试淘汰所有空闲环境
+    cache = SlowPublishVenvCache(Path(tempfile.mkdtemp()), fake_installer, max_disk_mb=0)
+    
+    def use(index):
+        success, message, python = cache.acquire([f"pkg{index}"])
+        alive = success and Path(python).exists()
+        time.sleep(0.02)
+        if success:
+            cache.release(python)
+        return alive
+    
+    def use_safely(index):
+        try:
+            return use(index)
+        except KeyError:
+            return False
+    
+    with concurrent.futures.ThreadPoolExecutor(6) as executor:
+        results = list(executor.map(use_safely, range(12)))
+    stats = cache.stats()
+    print(f"结果: {results}, 状态: {stats}, 构建锁: {len(cache._build_locks)}")
+    return all(results) and stats["builds"] == 12 and not cache._build_locks and stats["environments"] == 0
+
+def test_venv_cache_evict_same_key():
+    """测试淘汰中的删除不会波及同一依赖集合刚重新构建的环境"""
+    print("\n" + "=" * 50)
+    print("测试虚拟环境淘汰与同键重建")
+    print("=" * 50)
+    
+    import threading
+    import packages
+    from packages import VenvCache
+    
+    def fake_installer(packages_, python_executable):
+        Path(python_executable).parent.parent.joinpath("installed.txt").write_text(",".join(packages_))
+        return True, "已安装"
+    
+    cache = VenvCache(Path(tempfile.mkdtemp()), fake_installer, max_disk_mb=0)
+    evicting = threading.Event()
+    original_rmtree = packages.shutil.rmtree
+    releasing = []
+    
+    def slow_rmtree(path, *args, **kwargs):
+        # 只拖慢淘汰线程里的删除，使同键重建必然落在删除进行期间
+        if threading.current_thread() in releasing:
+            evicting.set()
+            time.sleep(0.3)
+        return original_rmtree(path, *args, **kwargs)
+    
+    def first_use():
+        success, _, python = cache.acquire(["samepkg"])
+        if success:
+            releasing.append(threading.current_thread())
+            cache.release(python)
+    
+    packages.shutil.rmtree = slow_rmtree
+    try:
+        worker = threading.Thread(target=first_use)
+        worker.start()
+        evicting.wait(5)
+        success, _, python = cache.acquire(["samepkg"])
+        worker.join()
+        alive = success and Path(python).exists()
+        if success:
+            cache.release(python)
+    finally:
+        packages.shutil.rmtree = original_rmtree
+    
+    leftovers = [entry.name for entry in cache.root.iterdir()]
+    stats = cache.stats()
+    print(f"重建环境存活: {alive}, 状态: {stats}, 残留目录: {leftovers}")
+    return alive and stats["builds"] == 2 and stats["environments"] == 0 and not leftovers
+
+def test_metrics_endpoint():
+    """测试/metrics：执行计数和各阶段耗时直方图"""
+    print("\n" + "=" * 50)
+    print("测试指标接口")
+    print("=" * 50)
+    
+    import app as app_module
+    
+    client = app_module.app.test_client()
+    
+    def scrape():
+        response = client.get("/metrics")
+        samples = {}
+        for line in response.get_data(as_text=True).splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return response, samples
+    
+    _, before = scrape()
+    client.post("/execute", json={"code": "print('metrics')", "coalesce": False})
+    client.post("/execute", json={"code": "eval('1')"})
+    response, after = scrape()
+    
+    def delta(name):
+        return after.get(name, 0) - before.get(name, 0)
+    
+    executions = {outcome: delta(f'pyexec_executions_total{{mode="execute",outcome="{outcome}"}}')
+                  for outcome in ("success", "unsafe")}
+    phases = {phase: delta(f'pyexec_phase_duration_seconds_count{{phase="{phase}"}}')
+              for phase in ("safety", "imports", "install", "spawn", "run", "cleanup")}
+    print(f"Content-Type: {response.content_type}, 执行: {executions}, 阶段: {phases}")
+    
+    # 直方图各桶累计，+Inf桶等于样本数
+    buckets = [value for name, value in after.items()
+               if name.startswith('pyexec_phase_duration_seconds_bucket{phase="run"')]
+    inf_bucket = after['pyexec_phase_duration_seconds_bucket{phase="run",le="+Inf"}']
+    return (response.status_code == 200 and response.content_type == "text/plain; version=0.0.4; charset=utf-8"
+            and executions == {"success": 1, "unsafe": 1}
+            and phases == {"safety": 2, "imports": 1, "install": 1, "spawn": 1, "run": 1, "cleanup": 1}
+            and buckets == sorted(buckets) and inf_bucket == after['pyexec_phase_duration_seconds_count{phase="run"}'])
+
+def test_admission_rejection():
+    """测试准入控制：队列已满返回429、排队超时返回503，都带有Retry-After"""
+    print("\n" + "=" * 50)
+    print("测试准入控制拒绝")
+    print("=" * 50)
+    
+    import app as app_module
+    from admission import ConcurrencyGovernor
+    
+    engine = app_module.engine
+    client = app_module.app.test_client()
+    payload = {"code": "print('admitted')", "coalesce": False}
+    original = engine.admission
+    
+    def post(governor, client_id="other"):
+        # 另一个客户端占用唯一的执行名额
+        engine.admission = governor
+        ticket = governor.acquire("holder")
+        try:
+            return client.post("/execute", json=payload, headers={"X-Client-Id": client_id})
+        finally:
+            governor.release(ticket)
+    
+    try:
+        full = post(ConcurrencyGovernor(1, max_queue=0))
+        timed_out = post(ConcurrencyGovernor(1, max_queue=5, queue_timeout=0.3))
+        per_client = post(ConcurrencyGovernor(4, max_queue=0, per_client_limit=1), client_id="holder")
+        admitted = post(ConcurrencyGovernor(4, max_queue=0, per_client_limit=1))
+    finally:
+        engine.admission = original
+    
+    for name, response in (("队列已满", full), ("排队超时", timed_out), ("客户端上限", per_client), ("其他客户端", admitted)):
+        print(f"{name}: {response.status_code}, Retry-After={response.headers.get('Retry-After')}, {response.get_json()}")
+    
+    def rejected(response, status):
+        body = response.get_json()
+        retry_after = response.headers.get("Retry-After", "")
+        return (response.status_code == status and retry_after.isdigit() and int(retry_after) >= 1
+                and body["retry_after"] == int(retry_after) and not body["success"])
+    
+    return (rejected(full, 429) and rejected(timed_out, 503) and rejected(per_client, 429)
+            and admitted.status_code == 200 and admitted.get_json()["output"] == "admitted\n")
+
+def test_job_submission():
+    """测试异步任务：priority校验，以及执行时使用提交者的客户端标识"""
+    print("\n" + "=" * 50)
+    print("测试异步任务提交")
+    print("=" * 50)
+    
+    import app as app_module
+    
+    client = app_module.app.test_client()
+    invalid = [client.post("/jobs", json={"code": "print(1)", "priority": priority}).status_code
+               for priority in ("high", None, 1.5, True, [1])]
+    print(f"无效priority: {invalid}")
+    
+    engine = app_module.engine
+    seen = []
+    original = engine.admission.acquire
+    
+    def recording_acquire(client_id=None):
+        seen.append(client_id)
+        return original(client_id)
+    
+    engine.admission.acquire = recording_acquire
+    try:
+        response = client.post("/jobs", json={"code": "print('job')", "priority": 3},
+                               headers={"X-Client-Id": "job-client"})
+        execution_id = response.get_json()["execution_id"]
+        deadline = time.time() + 30
+        job = response.get_json()
+        while job["status"] in ("queued", "running") and time.time() < deadline:
+            time.sleep(0.1)
+            job = client.get(f"/jobs/{execution_id}").get_json()
+    finally:
+        del engine.admission.acquire
+    
+    print(f"任务: {response.status_code}, {job.get('status')}, 客户端: {seen}")
+    return (invalid == [400] * 5 and response.status_code == 202 and job["status"] == "completed"
+            and job["result"]["output"] == "job\n" and seen == ["job-client"] and "client_id" not in job)
+
+def test_job_cancel_before_spawn():
+    """测试取消仍在等待执行名额的运行中任务：不启动子进程、不保存结果、结束后才记录结束时间"""
+    print("\n" + "=" * 50)
+    print("测试取消等待名额的异步任务")
+    print("=" * 50)
+    
+    import threading
+    import app as app_module
+    
+    client = app_module.app.test_client()
+    engine = app_module.engine
+    admitted = threading.Event()
+    waiting = threading.Event()
+    spawned = []
+    original_acquire = engine.admission.acquire
+    original_start = engine._start_process
+    
+    def blocking_acquire(client_id=None):
+        waiting.set()
+        admitted.wait(10)
+        return original_acquire(client_id)
+    
+    def recording_start(*args, **kwargs):
+        spawned.append(args)
+        return original_start(*args, **kwargs)
+    
+    engine.admission.acquire = blocking_acquire
+    engine._start_process = recording_start
+    try:
+        response = client.post("/jobs", json={"code": "print('cancelled job')"})
+        execution_id = response.get_json()["execution_id"]
+        waiting.wait(10)
+        cancel = client.delete(f"/jobs/{execution_id}")
+        cancelled = client.get(f"/jobs/{execution_id}").get_json()
+        admitted.set()
+        deadline = time.time() + 30
+        job = cancelled
+        while job["finished_at"] is None and time.time() < deadline:
+            time.sleep(0.1)
+            job = client.get(f"/jobs/{execution_id}").get_json()
+    finally:
+        admitted.set()
+        del engine.admission.acquire
+        del engine._start_process
+    
+    print(f"取消: {cancel.status_code}, 取消时: {cancelled['status']}/{cancelled['finished_at']}, "
+          f"结束后: {job['status']}/{job['result']}, 启动子进程: {len(spawned)}")
+    return (cancel.status_code == 200 and cancelled["status"] == "cancelled" and cancelled["finished_at"] is None
+            and job["status"] == "cancelled" and job["finished_at"] is not None and job["result"] is None
+            and not spawned)
+
+def test_session_memory_validation():
+    """测试创建会话时memory_mb必须是非负整数"""
+    print("\n" + "=" * 50)
+    print("测试会话memory_mb校验")
+    print("=" * 50)
+    
+    import app as app_module
+    
+    client = app_module.app.test_client()
+    before = len(client.get("/sessions").get_json()["sessions"])
+    invalid = [client.post("/sessions", json={"memory_mb": memory_mb}).status_code
+               for memory_mb in ("256", "abc", -1, 1.5, True, None, [256])]
+    after = len(client.get("/sessions").get_json()["sessions"])
+    print(f"无效memory_mb: {invalid}, 会话数: {before} -> {after}")
+    return invalid == [400] * 7 and after == before
+
+def test_installed_package_index():
+    """测试已安装包索引：标准库、发行包名称规范化、版本和刷新"""
+    print("\n" + "=" * 50)
+    print("测试已安装包索引")
+    print("=" * 50)
+    
+    import importlib.metadata
+    from packages import InstalledPackageIndex
+    
+    index = InstalledPackageIndex()
+    missing = index.missing(["json", "math", "Flask", "no_such_package_xyz"])
+    print(f"缺少: {missing}, flask版本: {index.version('FLASK')}")
+    if missing != ["no_such_package_xyz"] or not index.is_stdlib("json") or index.is_stdlib("flask"):
+        return False
+    if index.version("FLASK") != importlib.metadata.version("flask") or index.version("no_such_package_xyz"):
+        return False
+    
+    # 不联网：在sys.path中放入一个发行包的元数据，模拟安装新包
+    site_dir = Path(tempfile.mkdtemp())
+    dist_info = site_dir / "fake_pkg_abc-1.2.3.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text("Metadata-Version: 2.1\nName: Fake_Pkg.ABC\nVersion: 1.2.3\n")
+    sys.path.insert(0, str(site_dir))
+    try:
+        before = index.is_satisfied("fake-pkg-abc")
+        index.refresh()
+        after = index.is_satisfied("fake-pkg-abc") and index.is_satisfied("FAKE_PKG_ABC")
+        version = index.version("fake.pkg.abc")
+    finally:
+        sys.path.remove(str(site_dir))
+    print(f"刷新前: {before}, 刷新后: {after}, 版本: {version}")
+    return not before and after and version == "1.2.3"
+
+def test_distribution_mapping():
+    """测试导入名到发行包名的映射和需要安装的依赖"""
+    print("\n" + "=" * 50)
+    print("测试导入名映射")
+    print("=" * 50)
+    
+    from packages import DistributionResolver
+    
+    resolver = DistributionResolver({"mylib": "my-distribution"})
+    mapping = {module: resolver.resolve(module)
+               for module in ("sklearn", "PIL", "bs4", "cv2", "flask", "mylib", "unknown_module")}
+    print(f"映射: {mapping}")
+    expected = {
+        "sklearn": "scikit-learn",
+        "PIL": "pillow",
+        "bs4": "beautifulsoup4",
+        "cv2": "opencv-python",
+        # 已安装的包从importlib.metadata中查到发行包名
+        "flask": "Flask",
+        "mylib": "my-distribution",
+        "unknown_module": "unknown_module",
+    }
+    if mapping != expected:
+        return False
+    
+    # 跳过标准库和已安装的模块；不在允许列表中的包不安装
+    engine = PythonExecutionEngine()
+    engine.package_index.is_satisfied = lambda name: name in ("json", "flask")
+    requirements = engine._resolve_requirements(["json", "flask", "sklearn", "bs4", "sklearn", "evil_module"])
+    print(f"需要安装: {requirements}")
+    return requirements == ["scikit-learn", "beautifulsoup4"]
+
+def test_install_coalescing():
+    """测试并发安装请求合并为一次pip调用"""
+    print("\n" + "=" * 50)
+    print("测试安装请求合并")
+    print("=" * 50)
+    
+    import threading
+    from packages import InstallCoordinator
+    
+    calls = []
+    
+    def fake_installer(packages):
+        # 不联网：只记录每次pip调用安装的包
+        calls.append(list(packages))
+        time.sleep(0.5)
+        return True, "已安装"
+    
+    coordinator = InstallCoordinator(fake_installer, batch_window=0.2)
+    results = []
+    
+    def install(packages):
+        results.append(coordinator.install(packages))
+    
+    # 同一窗口内的请求合并；安装进行中到达的相同请求等待同一结果
+    threads = [threading.Thread(target=install, args=(packages,))
+               for packages in (["numpy"], ["numpy"], ["pandas"], ["numpy", "pandas"])]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.3)
+    late = threading.Thread(target=install, args=(["numpy"],))
+    late.start()
+    for thread in threads + [late]:
+        thread.join()
+    
+    stats = coordinator.stats()
+    print(f"pip调用: {calls}, 状态: {stats}")
+    return (all(success for success, _ in results) and len(results) == 5
+            and calls == [["numpy", "pandas"]] and stats["pip_runs"] == 1
+            and stats["coalesced_requests"] == 4 and not stats["installing"])
+
+def test_install_partial_failure():
+    """测试合并安装中有无法安装的包时，同批次其他请求仍然成功"""
+    print("\n" + "=" * 50)
+    print("测试合并安装部分失败")
+    print("=" * 50)
+    
+    import threading
+    from packages import InstallCoordinator
+    
+    calls = []
+    
+    def fake_installer(packages):
+        # 不联网：含有不存在的包时整批失败，与pip install -r的行为一致
+        calls.append(list(packages))
+        time.sleep(0.05)
+        if "no-such-package" in packages:
+            return False, "找不到包: no-such-package"
+        return True, "已安装"
+    
+    coordinator = InstallCoordinator(fake_installer, batch_window=0.2)
+    requests = {"good": ["numpy"], "bad": ["no-such-package"], "mixed": ["pandas", "no-such-package"]}
+    results = {}
+    
+    def install(name):
+        results[name] = coordinator.install(requests[name])
+    
+    threads = [threading.Thread(target=install, args=(name,)) for name in requests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    print(f"pip调用: {calls}")
+    print(f"结果: {results}, 状态: {coordinator.stats()}")
+    return (results["good"][0] and not results["bad"][0] and not results["mixed"][0]
+            and "no-such-package" in results["bad"][1]
+            and len(calls[0]) == 3 and coordinator.stats()["retried_batches"] == 1)
+
+def test_batch_cancel_releases_venv():
+    """测试批量执行被提前关闭时，未开始的执行不会让共享的虚拟环境一直被占用"""
+    print("\n" + "=" * 50)
+    print("测试批量执行取消后释放环境")
+    print("=" * 50)
+    
+    engine = PythonExecutionEngine()
+    released = []
+    
+    class FakeVenvCache:
+        def release(self, python_executable):
+            released.append(python_executable)
+    
+    # 不联网：所有代码共用同一个"缓存环境"，并且一次只运行一段，其余在线程池中排队
+    engine.venv_cache = FakeVenvCache()
+    engine._prepare_dependencies = lambda imports, work_dir: (True, "已准备", sys.executable)
+    engine.admission.max_in_flight = 1
+    
+    items = [{"code": f"import time\ntime.sleep(0.3)\nprint({index})"} for index in range(4)]
+    batch = engine.execute_batch(items)
+    index, result = next(batch)
+    batch.close()
+    
+    deadline = time.time() + 10
+    while not released and time.time() < deadline:
+        time.sleep(0.05)
+    print(f"第一个结果: {index} {result['output']!r}, 释放: {released}")
+    return result["success"] and released == [sys.executable]
+
+def test_resource_limits():
+    """测试CPU时间限制和资源使用统计"""
+    print("\n" + "=" * 50)
+    print("测试资源限制")
+    print("=" * 50)
+    
+    os.environ["MAX_CPU_TIME"] = "1"
+    try:
+        engine = PythonExecutionEngine()
+    finally:
+        os.environ.pop("MAX_CPU_TIME")
+    
+    result = engine.execute("print(sum(range(1000)))")
+    usage = result.get("resource_usage", {})
+    print(f"资源使用: {usage}")
+    if not all(key in usage for key in ("peak_memory_mb", "user_time", "sys_time", "wall_time")):
+        return False
+    
+    result = engine.execute("while True:\n    pass")
+    print(f"死循环: 错误={result['error']}, 资源使用={result.get('resource_usage')}")
+    return "超出CPU时间限制" in result['error'] and result['execution_time'] < 10
+
+def test_sandbox_pool():
+    """测试沙箱目录复用和后台清理"""
+    print("\n" + "=" * 50)
+    print("测试沙箱目录池")
+    print("=" * 50)
+    
+    import app as app_module
+    
+    engine = PythonExecutionEngine()
+    code = "import pathlib\nprint(sorted(p.name for p in pathlib.Path('.').iterdir()))\npathlib.Path('data.txt').write_text('x')"
+    
+    outputs = []
+    for i in range(3):
+        result = engine.execute(code)
+        print(f"第{i + 1}次执行: 输出={result['output'].strip()}")
+        outputs.append(result['output'])
+        time.sleep(0.1)
+    
+    stats = engine.sandbox_pool.stats()
+    print(f"沙箱池状态: {stats}")
+    # 上一次执行写入的文件不应出现在下一次执行的目录中（artifacts为每次执行新建的产物目录）；
+    # 与模块级engine的池共存时不应退化为临时目录
+    return (all(output == "['artifacts', 'main.py']\n" for output in outputs) and stats["recycled"] >= 2
+            and stats["size"] == engine.sandbox_pool.size and stats["overflow"] == 0
+            and stats["pool_dir"] != app_module.engine.sandbox_pool.stats()["pool_dir"])
+
+def test_judge_mode():
+    """测试判题模式"""
+    print("\n" + "=" * 50)
+    print("测试判题模式")
+    print("=" * 50)
+    
+    engine = PythonExecutionEngine()
+    code = "a, b = map(int, input().split())\nprint(a + b if a >= 0 else a - b)"
+    cases = [
+        {"input": "1 2\n", "expected_output": "3\n"},
+        {"input": "10 20\n", "expected_output": "30"},
+        {"input": "-1 2\n", "expected_output": "1\n"},
+        {"input": "", "expected_output": ""},
+    ]
+    result = engine.judge(code, cases, time_limit=1)
+    verdicts = [case["verdict"] for case in result["cases"]]
+    print(f"总体结果: {result['verdict']}, 通过: {result['passed']}/{result['total']}, 各用例: {verdicts}")
+    
+    return verdicts == ["AC", "AC", "WA", "RE"] and result["verdict"] == "WA"
+
+def test_execution_timings():
+    """测试阶段耗时明细和trace导出"""
+    print("\n" + "=" * 50)
+    print("测试阶段耗时和trace")
+    print("=" * 50)
+    
+    engine = PythonExecutionEngine()
+    result = engine.execute("import time\ntime.sleep(0.2)", trace=True)
+    timings = result["timings"]
+    print(f"阶段耗时: {timings}")
+    
+    events = result["trace"]["traceEvents"]
+    names = [event["name"] for event in events]
+    print(f"trace事件: {names}")
+    
+    phases = ["safety", "queue", "imports", "install", "spawn", "run", "cleanup"]
+    return (all(phase in timings for phase in phases)
+            and timings["run"] >= 0.2
+            and timings["total"] >= sum(timings[phase] for phase in phases) - 0.001
+            and names[0] == "execute"
+            and all(event["ph"] == "X" for event in events)
+            and "trace" not in engine.execute("print(1)"))
+
+def test_traffic_recorder():
+    """测试流量记录和匿名化"""
+    print("\n" + "=" * 50)
+    print("测试流量记录")
+    print("=" * 50)
+    
+    from traffic import TrafficRecorder, anonymize_code, read_traffic
+    
+    code = "import json  # token\nprint(json.dumps({'password': 'hunter2'}))"
+    anonymized = anonymize_code(code)
+    print(f"匿名化后的代码: {anonymized!r}")
+    
+    log_file = Path(tempfile.mkdtemp()) / "traffic.jsonl"
+    recorder = TrafficRecorder(str(log_file), anonymize=True)
+    recorder.record(code, "10.0.0.1", time.time(), 0.05, 200, {"success": True, "imports_used": ["json"]})
+    recorder.record("print(1)", "10.0.0.1", time.time(), 0.01, 429)
+    recorder.close()
+    entries = list(read_traffic(str(log_file)))
+    print(f"记录: {entries}")
+    
+    return ("hunter2" not in anonymized and "token" not in anonymized
+            and "import json" in anonymized and compile(anonymized, "<anonymized>", "exec") is not None
+            and len(entries) == 2 and entries[0]["code"] == anonymized
+            and entries[0]["client"] != "10.0.0.1" and entries[1]["status"] == 429)
+
+def test_asgi_execute():
+    """测试asyncio执行模式"""
+    print("\n" + "=" * 50)
+    print("测试asyncio执行模式")
+    print("=" * 50)
+    
+    import asyncio
+    import json
+    import threading
+    import asgi
+    
+    async def call(method, path, payload=None):
+        messages = [{"type": "http.request", "body": json.dumps(payload).encode() if payload else b""}]
+        sent = []
+        
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+        
+        async def send(message):
+            sent.append(message)
+        
+        scope = {"type": "http", "method": method, "path": path, "headers": [], "query_string": b"",
+                 "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 5000)}
+        await asgi.app(scope, receive, send)
+        status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+        body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+        return status, json.loads(body)
+    
+    async def main():
+        threads_before = threading.active_count()
+        results = await asyncio.gather(*[
+            call("POST", "/execute", {"code": f"import time\ntime.sleep(0.2)\nprint({i})"}) for i in range(5)
+        ])
+        threads_during = threading.active_count()
+        config = await call("GET", "/config")
+        return results, config, threads_during - threads_before
+    
+    results, config, extra_threads = asyncio.run(main())
+    outputs = [body["output"] for _, body in results]
+    print(f"输出: {outputs}, 新增线程: {extra_threads}, /config状态码: {config[0]}")
+    return (all(status == 200 for status, _ in results)
+            and outputs == [f"{i}\n" for i in range(5)]
+            and config[0] == 200 and "max_execution_time" in config[1])
+
+def test_asgi_blocking_offloaded():
+    """测试asyncio模式下沙箱获取、配额检查、结果缓存、产物收集、虚拟环境释放和登记表读写不在事件循环线程中进行"""
+    print("\n" + "=" * 50)
+    print("测试asyncio模式阻塞操作")
+    print("=" * 50)
+    
+    import asyncio
+    import threading
+    import asgi
+    from packages import VenvCache
+    
+    engine = asgi.engine
+    calls = []
+    
+    def fake_installer(packages, python_executable):
+        return True, "已安装"
+    
+    # 使用依赖缓存虚拟环境模式，使执行结束后释放虚拟环境
+    original_venv_cache = engine.venv_cache
+    engine.venv_cache = VenvCache(Path(tempfile.mkdtemp()), fake_installer, max_disk_mb=0)
+    engine._resolve_requirements = lambda packages: ["fakepkg"]
+    
+    def recorded(target, name):
+        original = getattr(target, name)
+        
+        def wrapper(*args, **kwargs):
+            calls.append((name, threading.current_thread() is threading.main_thread()))
+            return original(*args, **kwargs)
+        
+        setattr(target, name, wrapper)
+    
+    patched = [(engine.sandbox_pool, "acquire"), (engine.sandbox_pool, "exceeds_quota"),
+               (engine.artifact_store, "collect"), (engine.result_cache, "get"), (engine.result_cache, "put"),
+               (engine.venv_cache, "release"), (engine.registry, "register"), (engine.registry, "finish")]
+    for target, name in patched:
+        recorded(target, name)
+    
+    code = f"print('offload {uuid.uuid4()}')"
+    
+    async def main():
+        first = await asgi.app.execute(code, cache="allow")
+        second = await asgi.app.execute(code, cache="allow")
+        unsafe = await asgi.app.execute("eval('1')")
+        return first, second, unsafe
+    
+    try:
+        first, second, unsafe = asyncio.run(main())
+    finally:
+        for target, name in patched:
+            delattr(target, name)
+        del engine._resolve_requirements
+        engine.venv_cache = original_venv_cache
+    
+    names = sorted({name for name, _ in calls})
+    on_loop = [name for name, main_thread in calls if main_thread]
+    print(f"调用: {names}, 在事件循环线程中: {on_loop}, 缓存: {first['cache']} -> {second['cache']}")
+    return (not on_loop and names == ["acquire", "collect", "exceeds_quota", "finish", "get", "put", "register", "release"]
+            and first["cache"] == "miss" and second["cache"] == "hit" and second["output"] == first["output"]
+            and "timings" in second and not unsafe["success"] and "安全检查失败" in unsafe["error"])
+
+def test_asgi_cancel_releases_venv():
+    """测试asyncio模式下依赖准备期间客户端断开时归还取得的虚拟环境"""
+    print("\n" + "=" * 50)
+    print("测试asyncio模式断开时归还虚拟环境")
+    print("=" * 50)
+    
+    import asyncio
+    import asgi
+    from packages import VenvCache
+    
+    engine = asgi.engine
+    
+    def slow_installer(packages, python_executable):
+        time.sleep(0.5)
+        return True, "已安装"
+    
+    original_venv_cache = engine.venv_cache
+    cache = VenvCache(Path(tempfile.mkdtemp()), slow_installer)
+    engine.venv_cache = cache
+    engine._resolve_requirements = lambda packages: ["fakepkg"]
+    
+    async def main():
+        task = asyncio.ensure_future(asgi.app.execute(f"print('cancel {uuid.uuid4()}')"))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        # 等待线程中的构建完成并归还
+        await asyncio.sleep(1)
+    
+    try:
+        asyncio.run(main())
+    finally:
+        del engine._resolve_requirements
+        engine.venv_cache = original_venv_cache
+    
+    in_use = {key: entry["in_use"] for key, entry in cache._entries.items()}
+    print(f"虚拟环境占用: {in_use}")
+    return len(in_use) == 1 and not any(in_use.values())
+
+def test_execution_registry():
+    """测试跨worker执行登记表"""
+    print("\n" + "=" * 50)
+    print("测试执行登记表")
+    print("=" * 50)
+    
+    from registry import ExecutionRegistry, STOPPED
+    
+    path = str(Path(tempfile.mkdtemp()) / "executions.db")
+    # 两个实例模拟两个worker共用同一个登记表文件
+    owner = ExecutionRegistry(path)
+    other = ExecutionRegistry(path)
+    
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    execution_id = str(uuid.uuid4())
+    owner.register(execution_id, process.pid)
+    running = other.running()
+    print(f"运行中的执行: {running}")
+    
+    stopped = other.terminate(execution_id, timeout=5)
+    returncode = process.wait(timeout=5)
+    owner.finish(execution_id, {"wall_time": 0.1})
+    record = other.get(execution_id)
+    print(f"停止结果: {stopped}, 返回码: {returncode}, 登记: {record}")
+    
+    return ([item["execution_id"] for item in running] == [execution_id]
+            and running[0]["pid"] == process.pid
+            and stopped and returncode != 0
+            and record["status"] == STOPPED and record["resource_usage"] == {"wall_time": 0.1}
+            and other.running() == [] and not other.terminate(execution_id))
+
+def test_sessions():
+    """测试有状态会话"""
+    print("\n" + "=" * 50)
+    print("测试有状态会话")
+    print("=" * 50)
+    
+    from limits import ResourceLimits
+    from sessions import SessionManager, SessionLimitExceeded
+    
+    manager = SessionManager(Path(tempfile.mkdtemp()) / "sessions", ResourceLimits(memory_mb=512),
+                             max_sessions=1, idle_ttl=1)
+    session = manager.create()
+    first = session.execute("data = [i * i for i in range(1000)]", timeout=10)
+    second = session.execute("print(sum(data))", timeout=10)
+    interrupted = session.execute("import time\nwhile True:\n    time.sleep(0.1)", timeout=1)
+    third = session.execute("print(len(data))", timeout=10)
+    print(f"输出: {second['output']!r}, {third['output']!r}, 中断: {interrupted['interrupted']}")
+    
+    try:
+        manager.create()
+        limited = False
+    except SessionLimitExceeded:
+        limited = True
+    
+    # 空闲超时后由后台线程回收
+    deadline = time.time() + 10
+    while manager.get(session.session_id) is not None and time.time() < deadline:
+        time.sleep(0.2)
+    expired = manager.get(session.session_id) is None and not session.alive
+    print(f"会话数上限生效: {limited}, 空闲会话已回收: {expired}")
+    manager.shutdown()
+    
+    return (first["exit_code"] == 0 and second["output"] == f"{sum(i * i for i in range(1000))}\n"
+            and interrupted["interrupted"] and not interrupted["session_closed"]
+            and third["output"] == "1000\n" and limited and expired)
+
+def test_output_spill():
+    """测试输出超过内存上限时溢出到文件"""
+    print("\n" + "=" * 50)
+    print("测试输出溢出")
+    print("=" * 50)
+    
+    from outputs import OutputStore
+    
+    engine = PythonExecutionEngine()
+    engine.output_store = OutputStore(Path(tempfile.mkdtemp()), memory_limit=4096, preview_bytes=64)
+    result = engine.execute("for i in range(10000):\n    print(i)", execution_id=str(uuid.uuid4()))
+    expected = "".join(f"{i}\n" for i in range(10000)).encode()
+    print(f"预览: {result['output'][:20]!r}...{result.get('output_tail', '')[-20:]!r}, 大小: {result.get('output_size')}")
+    
+    opened = engine.output_store.open_range(result["execution_id"], "stdout", 100, 50)
+    start, count, size, chunks = opened
+    ranged = b"".join(chunks)
+    full = b"".join(engine.output_store.open_range(result["execution_id"], "stdout")[3])
+    small = engine.execute("print('small')")
+    
+    return (result["success"] and result["output_truncated"]
+            and len(result["output"]) <= 64 and expected.startswith(result["output"].encode())
+            and expected.endswith(result["output_tail"].encode())
+            and result["output_size"] == len(expected) and size == len(expected)
+            and (start, count) == (100, 50) and ranged == expected[100:150] and full == expected
+            and small["output"] == "small\n" and "output_ref" not in small)
+
+def test_artifacts():
+    """测试执行产物收集和按内容去重"""
+    print("\n" + "=" * 50)
+    print("测试执行产物")
+    print("=" * 50)
+    
+    from artifacts import ArtifactStore
+    
+    engine = PythonExecutionEngine()
+    engine.artifact_store = ArtifactStore(Path(tempfile.mkdtemp()))
+    code = """
+import matplotlib.pyplot as plt
+import numpy as np
+plt.plot([1, 2, 3], [3, 1, 2])
+np.savetxt("artifacts/data.csv", [[1, 3]], fmt="%d", delimiter=",", header="x,y", comments="")
+"""
+    first = engine.execute(code)
+    second = engine.execute(code)
+    artifacts = {item["name"]: item for item in first.get("artifacts", [])}
+    print(f"产物: {sorted(artifacts)}, 统计: {engine.artifact_store.stats()}")
+    
+    csv = artifacts.get("data.csv")
+    if csv is None or "figure-1.png" not in artifacts:
+        return False
+    with engine.artifact_store.open(csv["sha256"]) as f:
+        content = f.read()
+    return (first["success"] and second["success"]
+            and [item["sha256"] for item in second["artifacts"]] == [item["sha256"] for item in first["artifacts"]]
+            and engine.artifact_store.stats()["deduplicated"] == 2
+            and artifacts["figure-1.png"]["content_type"] == "image/png"
+            and csv["url"] == f"/artifacts/{csv['sha256']}/data.csv"
+            and content == b"x,y\n1,3\n"
+            and "artifacts" not in engine.execute("print(1)"))
+
+def test_result_cache():
+    """测试结果缓存的命中、跳过和磁盘层"""
+    print("\n" + "=" * 50)
+    print("测试结果缓存")
+    print("=" * 50)
+    
+    from result_cache import ResultCache
+    
+    engine = PythonExecutionEngine()
+    root = Path(tempfile.mkdtemp())
+    engine.result_cache = ResultCache(root, memory_bytes=1024 * 1024, disk_bytes=1024 * 1024)
+    code = "import math\nprint(math.factorial(20))"
+    miss = engine.execute(code, cache="allow")
+    hit = engine.execute(code, cache="allow")
+    bypass = engine.execute(code)
+    failed = [engine.execute("print(1/0)", cache="allow")["cache"] for _ in range(2)]
+    print(f"缓存状态: {miss['cache']}, {hit['cache']}, {bypass['cache']}, 失败结果: {failed}")
+    print(f"命中耗时: {hit['execution_time']}秒")
+    
+    # 其他worker通过磁盘层命中
+    other = PythonExecutionEngine()
+    other.result_cache = ResultCache(root, memory_bytes=1024 * 1024, disk_bytes=1024 * 1024)
+    shared = other.execute(code, cache="allow")
+    
+    return (miss["cache"] == "miss" and hit["cache"] == "hit" and bypass["cache"] == "bypass"
+            and hit["output"] == miss["output"] == "2432902008176640000\n"
+            and hit["execution_id"] != miss["execution_id"] and "cached_at" in hit
+            and "run" not in hit["timings"]
+            and failed == ["miss", "miss"]
+            and shared["cache"] == "hit" and other.result_cache.stats()["disk_hits"] == 1)
+
+def test_result_cache_skips_failed_exits():
+    """测试被停止和以非零退出码结束的执行不会被缓存"""
+    print("\n" + "=" * 50)
+    print("测试结果缓存跳过异常退出")
+    print("=" * 50)
+    
+    import threading
+    from result_cache import ResultCache
+    
+    engine = PythonExecutionEngine()
+    engine.result_cache = ResultCache(None, memory_bytes=1024 * 1024, disk_bytes=0)
+    
+    # 没有错误输出的非零退出
+    code = f"# {uuid.uuid4()}\nprint('exiting')\nraise SystemExit(3)"
+    exits = [engine.execute(code, cache="allow") for _ in range(2)]
+    print(f"非零退出: {[(r['returncode'], r['cache']) for r in exits]}")
+    
+    # 被/stop停止的执行
+    code = f"# {uuid.uuid4()}\nimport time\ntime.sleep(2)\nprint('done')"
+    execution_id = str(uuid.uuid4())
+    results = {}
+    thread = threading.Thread(target=lambda: results.update(
+        stopped=engine.execute(code, execution_id, cache="allow")))
+    thread.start()
+    deadline = time.time() + 10
+    while execution_id not in engine.running_processes and time.time() < deadline:
+        time.sleep(0.05)
+    engine.stop_execution(execution_id)
+    thread.join()
+    stopped = results["stopped"]
+    again = engine.execute(code, cache="allow")
+    print(f"停止: success={stopped['success']}, stopped={stopped.get('stopped')}, error={stopped['error']!r}, "
+          f"再次执行: {again['cache']} {again['output']!r}")
+    
+    return (all(r["returncode"] == 3 and r["cache"] == "miss" for r in exits)
+            and not stopped["success"] and stopped.get("stopped") and stopped["cache"] == "miss"
+            and again["cache"] == "miss" and again["output"] == "done\n" and again["returncode"] == 0
+            and engine.result_cache.stats()["entries"] == 1 and not engine._stopped_executions)
+
+def test_request_coalescing():
+    """测试进行中的相同请求共享一次执行"""
+    print("\n" + "=" * 50)
+    print("测试请求合并")
+    print("=" * 50)
+    
+    import asyncio
+    import concurrent.futures
+    import asgi
+    from coalescing import InFlightCoalescer
+    
+    engine = PythonExecutionEngine()
+    engine.coalescer = InFlightCoalescer()
+    code = "total = 0\nfor i in range(2000000):\n    total += i\nprint(total)"
+    with concurrent.futures.ThreadPoolExecutor(20) as executor:
+        results = list(executor.map(lambda _: engine.execute(code), range(20)))
+        randoms = list(executor.map(lambda _: engine.execute("import random\nprint(random.random())"), range(5)))
+    stats = engine.coalescer.stats()
+    print(f"合并统计: {stats}, 随机数结果数: {len({r['output'] for r in randoms})}")
+    
+    # leader失败时等待者重新执行
+    coalescer = InFlightCoalescer()
+    flight, leader = coalescer.join("key", "first")
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        waiter = executor.submit(lambda: coalescer.join("key", "second"))
+        follower_flight, follower_leader = waiter.result()
+        shared = executor.submit(follower_flight.wait, "second")
+        coalescer.finish(flight, None)
+        retry = shared.result(timeout=5)
+    
+    # asyncio模式下等待者不占用线程
+    async def run_async():
+        return await asyncio.gather(*[asgi.app.execute(code) for _ in range(5)])
+    
+    asgi.engine.coalescer = InFlightCoalescer()
+    try:
+        async_results = asyncio.run(run_async())
+    finally:
+        asgi.engine.coalescer = None
+    print(f"asyncio合并数: {sum('coalesced_with' in r for r in async_results)}")
+    
+    return (all(r["output"] == "1999999000000\n" for r in results)
+            and len({r["execution_id"] for r in results}) == 20
+            and stats["leaders"] + stats["coalesced"] == 20 and stats["coalesced"] > 0
+            and all(r["coalesced_with"] in {x["execution_id"] for x in results} for r in results if "coalesced_with" in r)
+            and len({r["output"] for r in randoms}) == 5
+            and leader and not follower_leader and retry == (None, False) and coalescer.stats()["retried"] == 1
+            and all(r["output"] == "1999999000000\n" for r in async_results)
+            and sum("coalesced_with" in r for r in async_results) == 4)
+
+def test_coalescing_stop():
+    """测试请求合并与/stop：leader被停止时等待者重新执行，等待者可以单独停止，不同客户端不合并"""
+    print("\n" + "=" * 50)
+    print("测试请求合并与停止")
+    print("=" * 50)
+    
+    import concurrent.futures
+    from coalescing import InFlightCoalescer
+    
+    engine = PythonExecutionEngine()
+    engine.coalescer = InFlightCoalescer()
+    code = f"# {uuid.uuid4()}\ntotal = 0\nfor i in range(3):\n    total += i\nprint(total)"
+    slow = code.replace("range(3)", "range(30000000)")
+    
+    def wait_until(condition):
+        deadline = time.time() + 10
+        while not condition() and time.time() < deadline:
+            time.sleep(0.02)
+    
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        # leader被停止：等待者重新执行并得到完整结果
+        leader = executor.submit(engine.execute, slow, "leader-A", "client")
+        wait_until(lambda: "leader-A" in engine.running_processes)
+        follower = executor.submit(engine.execute, slow, "follower-B", "client")
+        wait_until(lambda: engine.coalescer.stats()["waiting"] == 1)
+        engine.stop_execution("leader-A")
+        leader_result = leader.result()
+        wait_until(lambda: "follower-B" in engine.running_processes)
+        # 重新执行后follower-B成为leader，停止它时终止其子进程
+        follower_rerun = "follower-B" in engine.running_processes
+        engine.stop_execution("follower-B")
+        follower_result = follower.result()
+        
+        # 单独停止一个等待者，leader继续执行
+        leader = executor.submit(engine.execute, code.replace("range(3)", "range(3000000)"), "leader-C", "client")
+        wait_until(lambda: "leader-C" in engine.running_processes)
+        follower = executor.submit(engine.execute, code.replace("range(3)", "range(3000000)"), "follower-D", "client")
+        wait_until(lambda: engine.coalescer.stats()["waiting"] == 1)
+        stopped_waiter = engine.stop_execution("follower-D")
+        waiter_result = follower.result(timeout=5)
+        leader_result_c = leader.result()
+    
+    # 不同客户端的请求不合并
+    keys = {engine._coalesce_key(code, "bypass", None, client) for client in ("a", "b", None)}
+    
+    print(f"leader-A: {leader_result.get('stopped')}, follower-B重新执行: {follower_rerun}, "
+          f"follower-B: coalesced_with={follower_result.get('coalesced_with')}, stopped={follower_result.get('stopped')}")
+    print(f"停止等待者: {stopped_waiter}, {waiter_result.get('stopped')}, leader-C: {leader_result_c['success']}")
+    print(f"合并状态: {engine.coalescer.stats()}, 不同客户端的键: {len(keys)}")
+    return (leader_result.get("stopped") and follower_rerun and "coalesced_with" not in follower_result
+            and follower_result.get("stopped")
+            and stopped_waiter and waiter_result.get("stopped") and not waiter_result["success"]
+            and leader_result_c["success"] and leader_result_c["returncode"] == 0
+            and engine.coalescer.stats()["waiting"] == 0 and len(keys) == 3)
+
 def test_directory_permissions():
     """测试目录权限"""
     print("\n" + "=" * 50)
@@ -157,7 +1421,41 @@ def main():
         ("目录权限", test_directory_permissions),
         ("基本执行", test_basic_execution),
         ("导入检测", test_import_detection),
+        ("代码安全检查", test_code_safety_analyzer),
         ("进程管理", test_process_management),
+        ("预热进程池", test_worker_pool_execution),
+        ("zygote执行", test_zygote_execution),
+        ("zygote异常请求", test_zygote_bad_requests),
+        ("流式输出不缓冲", test_stream_unbuffered),
+        ("指标接口", test_metrics_endpoint),
+        ("准入控制拒绝", test_admission_rejection),
+        ("异步任务提交", test_job_submission),
+        ("取消等待名额的异步任务", test_job_cancel_before_spawn),
+        ("会话memory_mb校验", test_session_memory_validation),
+        ("已安装包索引", test_installed_package_index),
+        ("导入名映射", test_distribution_mapping),
+        ("安装请求合并", test_install_coalescing),
+        ("合并安装部分失败", test_install_partial_failure),
+        ("虚拟环境缓存并发淘汰", test_venv_cache_eviction_race),
+        ("虚拟环境淘汰与同键重建", test_venv_cache_evict_same_key),
+        ("批量执行取消后释放环境", test_batch_cancel_releases_venv),
+        ("资源限制", test_resource_limits),
+        ("沙箱目录池", test_sandbox_pool),
+        ("判题模式", test_judge_mode),
+        ("阶段耗时", test_execution_timings),
+        ("流量记录", test_traffic_recorder),
+        ("asyncio执行模式", test_asgi_execute),
+        ("asyncio模式阻塞操作", test_asgi_blocking_offloaded),
+        ("asyncio模式断开时归还虚拟环境", test_asgi_cancel_releases_venv),
+        ("执行登记表", test_execution_registry),
+        ("有状态会话", test_sessions),
+        ("输出溢出", test_output_spill),
+        ("执行产物", test_artifacts),
+        ("结果缓存", test_result_cache),
+        ("结果缓存跳过异常退出", test_result_cache_skips_failed_exits),
+        ("请求合并", test_request_coalescing),
+        ("副作用判断", test_side_effect_classifier),
+        ("请求合并与停止", test_coalescing_stop),
     ]
     
     results = []
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+/execute请求流量记录
+把请求的代码和时间信息追加到JSONL日志，供replay.py按原始到达间隔回放；
+可选匿名化：字符串字面量替换为等长占位符、删除注释、客户端标识取哈希
+"""
+
+import hashlib
+import io
+import json
+import logging
+import queue
+import random
+import threading
+import tokenize
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 日志格式版本，replay.py据此解析
+FORMAT_VERSION = 1
+
+
+def anonymize_code(code: str) -> str:
+    """保留代码结构、导入和大致长度，去掉字符串内容和注释
+
+    无法分词的代码（如语法错误）整体替换为等长占位符。
+    """
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return "#" + "x" * max(0, len(code) - 1)
+
+    # Python 3.12起f-string拆分为多个token，其中的文本部分为FSTRING_MIDDLE
+    fstring_middle = getattr(tokenize, "FSTRING_MIDDLE", None)
+    result = []
+    for token in tokens:
+        if token.type == tokenize.STRING:
+            result.append(token._replace(string=_mask_string(token.string)))
+        elif token.type == fstring_middle:
+            result.append(token._replace(string=_mask_text(token.string)))
+        elif token.type == tokenize.COMMENT:
+            result.append(token._replace(string="#" + "x" * (len(token.string) - 1)))
+        else:
+            result.append(token)
+    try:
+        return tokenize.untokenize(result)
+    except ValueError:
+        return "#" + "x" * max(0, len(code) - 1)
+
+
+def _mask_string(literal: str) -> str:
+    """把字符串字面量的内容替换为x，保留前缀、引号和长度"""
+    prefix_end = 0
+    while literal[prefix_end] not in "'\"":
+        prefix_end += 1
+    prefix, body = literal[:prefix_end], literal[prefix_end:]
+    quote = body[:3] if body[:3] in ('"""', "'''") else body[0]
+    inner = body[len(quote):-len(quote)]
+    # f-string中的表达式也会被替换，回放时只保留长度
+    return prefix.replace("f", "").replace("F", "") + quote + _mask_text(inner) + quote
+
+
+def _mask_text(text: str) -> str:
+    return "".join("\n" if ch == "\n" else "x" for ch in text)
+
+
+def hash_client(client_id: Optional[str]) -> Optional[str]:
+    if not client_id:
+        return None
+    return hashlib.sha256(client_id.encode("utf-8")).hexdigest()[:12]
+
+
+class TrafficRecorder:
+    """/execute请求记录器
+
+    record() 只把记录放入队列，由后台线程写入文件，不增加请求延迟；
+    队列满时丢弃记录并计数。sample_rate小于1时按比例抽样。
+    """
+
+    def __init__(self, path: str, anonymize: bool = False, sample_rate: float = 1.0,
+                 max_pending: int = 10000):
+        self.path = path
+        self.anonymize = anonymize
+        self.sample_rate = sample_rate
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="traffic-recorder", daemon=True)
+        self._writer.start()
+
+        # 统计信息
+        self.recorded = 0
+        self.dropped = 0
+
+    def record(self, code: str, client_id: Optional[str], arrived_at: float, duration: float,
+               status: int, result: Optional[Dict] = None):
+        """记录一次请求，arrived_at为到达时的time.time()"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        entry = {
+            "v": FORMAT_VERSION,
+            "ts": round(arrived_at, 6),
+            "code": anonymize_code(code) if self.anonymize else code,
+            "anonymized": self.anonymize,
+            "client": hash_client(client_id) if self.anonymize else client_id,
+            "status": status,
+            "duration": round(duration, 4)
+        }
+        if result is not None:
+            entry["success"] = result.get("success")
+            entry["imports"] = result.get("imports_used")
+            if "timings" in result:
+                entry["timings"] = result["timings"]
+        try:
+            self._pending.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _write_loop(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                entry = self._pending.get()
+                if entry is None:
+                    return
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                # 队列暂时为空时落盘
+                if self._pending.empty():
+                    f.flush()
+                with self._lock:
+                    self.recorded += 1
+
+    def close(self, timeout: float = 5):
+        """写完队列中的记录后停止后台线程"""
+        self._pending.put(None)
+        self._writer.join(timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "anonymize": self.anonymize,
+                "sample_rate": self.sample_rate,
+                "recorded": self.recorded,
+                "dropped": self.dropped,
+                "pending": self._pending.qsize()
+            }
+
+
+def read_traffic(path: str) -> Iterator[Dict]:
+    """按记录顺序读取流量日志，跳过无法解析的行"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"跳过无法解析的流量记录: 第{line_number}行")
+                continue
+            if entry.get("v") != FORMAT_VERSION or "code" not in entry or "ts" not in entry:
+                logger.warning(f"跳过格式不支持的流量记录: 第{line_number}行")
+                continue
+            yield entry
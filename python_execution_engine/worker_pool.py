@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+预热解释器进程池
+提前启动若干个等待任务的Python解释器，把进程启动开销移出请求路径
+"""
+
+import json
+import logging
+import queue
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from limits import MeteredPopen
+
+logger = logging.getLogger(__name__)
+
+RUNNER_SCRIPT = Path(__file__).resolve().parent / "sandbox_runner.py"
+
+
+class WarmWorkerPool:
+    """预启动的worker进程池
+
+    每个worker只执行一个任务，执行完毕后进程退出，
+    由后台线程补充新的worker，保证池中始终有空闲的解释器可用。
+    """
+
+    def __init__(self, size: int, cwd: str, popen_kwargs: Optional[Callable[[], Dict]] = None):
+        self.size = max(1, size)
+        self.cwd = str(cwd)
+        # 返回额外Popen参数的回调（如资源限制），每次启动worker时调用
+        self.popen_kwargs = popen_kwargs or (lambda: {})
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._closed = False
+        self._refill_event = threading.Event()
+        self._refiller = threading.Thread(
+            target=self._refill_loop,
+            name="warm-worker-refill",
+            daemon=True
+        )
+
+        # 统计信息
+        self.spawned = 0
+        self.cold_starts = 0
+
+    def start(self):
+        """启动后台补充线程并预热进程池"""
+        self._refiller.start()
+        self._refill_event.set()
+
+    def _spawn_worker(self) -> subprocess.Popen:
+        """启动一个等待任务的worker进程（退出时记录资源使用）"""
+        # -u：输出到管道时不缓冲，流式执行才能实时收到输出
+        cmd = [sys.executable, "-u", str(RUNNER_SCRIPT), "--worker"]
+        process = MeteredPopen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=self.cwd,
+            **self.popen_kwargs()
+        )
+        with self._lock:
+            self.spawned += 1
+        return process
+
+    def _refill_loop(self):
+        """后台补充空闲worker"""
+        while True:
+            self._refill_event.wait()
+            self._refill_event.clear()
+
+            while True:
+                with self._lock:
+                    if self._closed:
+                        return
+                    if self._idle.qsize() + self._pending >= self.size:
+                        break
+                    self._pending += 1
+                try:
+                    worker = self._spawn_worker()
+                    self._idle.put(worker)
+                except Exception as e:
+                    logger.error(f"启动预热worker失败: {e}")
+                    break
+                finally:
+                    with self._lock:
+                        self._pending -= 1
+
+    def acquire(self) -> subprocess.Popen:
+        """取出一个空闲worker，池为空时同步启动一个（冷启动）"""
+        worker = None
+        while True:
+            try:
+                candidate = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            # 丢弃已经意外退出的worker
+            if candidate.poll() is None:
+                worker = candidate
+                break
+
+        self._refill_event.set()
+
+        if worker is None:
+            with self._lock:
+                self.cold_starts += 1
+            worker = self._spawn_worker()
+        return worker
+
+    @staticmethod
+    def dispatch(worker: subprocess.Popen, script_file: Path, work_dir: Path):
+        """把任务发送给worker，之后可以像普通子进程一样communicate"""
+        job = {"script": str(script_file), "cwd": str(work_dir)}
+        worker.stdin.write(json.dumps(job) + "\n")
+        worker.stdin.flush()
+
+    def shutdown(self):
+        """关闭进程池，终止所有空闲worker"""
+        with self._lock:
+            self._closed = True
+        self._refill_event.set()
+
+        idle_workers: List[subprocess.Popen] = []
+        while True:
+            try:
+                idle_workers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+        for worker in idle_workers:
+            try:
+                worker.kill()
+                worker.wait(timeout=5)
+            except Exception as e:
+                logger.warning(f"终止预热worker失败: {e}")
+
+    def stats(self) -> Dict:
+        """进程池状态"""
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "spawned": self.spawned,
+                "cold_starts": self.cold_starts
+            }
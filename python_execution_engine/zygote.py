@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Fork-server（zygote）执行后端
+常驻父进程预先导入numpy/pandas/matplotlib等重量级模块，
+每次执行时fork出写时复制的子进程运行用户脚本，省去冷启动导入时间
+"""
+
+import atexit
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from process_io import iter_output, close_pipes
+from limits import ResourceLimits, rusage_to_dict
+
+logger = logging.getLogger(__name__)
+
+ZYGOTE_SCRIPT = Path(__file__).resolve()
+
+
+class _LineReader:
+    """按行读取套接字消息，超时后保留已收到的数据"""
+
+    def __init__(self, conn: socket.socket):
+        self.conn = conn
+        self._buffer = b""
+
+    def readline(self, timeout: Optional[float] = None) -> bytes:
+        """读取一行消息（不含换行符），连接关闭时返回空字节串"""
+        self.conn.settimeout(timeout)
+        try:
+            while b"\n" not in self._buffer:
+                chunk = self.conn.recv(4096)
+                if not chunk:
+                    return b""
+                self._buffer += chunk
+        finally:
+            self.conn.settimeout(None)
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line
+
+
+# ---------------------------------------------------------------------------
+# zygote进程（服务端）
+# ---------------------------------------------------------------------------
+
+def _preload_modules(modules: List[str]) -> Dict[str, float]:
+    """预先导入模块，返回每个模块的导入耗时（秒）"""
+    import importlib
+
+    import_times = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            if name == "matplotlib":
+                # 与app.py保持一致，使用非交互式后端
+                import matplotlib
+                matplotlib.use("Agg")
+                import matplotlib.pyplot  # noqa: F401
+            else:
+                importlib.import_module(name)
+        except Exception as e:
+            print(f"zygote预加载模块失败: {name}: {e}", file=sys.stderr)
+            continue
+        import_times[name] = time.perf_counter() - start
+    return import_times
+
+
+def _run_child(sockets: List[socket.socket], job: Dict, fds: List[int],
+               limits: Optional[ResourceLimits] = None) -> int:
+    """fork出的子进程：重定向输出并运行用户脚本"""
+    import sandbox_runner
+
+    # 关闭继承自zygote的监听套接字和其他执行的连接
+    for sock in sockets:
+        sock.close()
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    # 独立进程组，停止执行时可以连同其子进程一起终止
+    os.setsid()
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(fds[0], 1)
+    os.dup2(fds[1], 2)
+    for fd in fds:
+        os.close(fd)
+    # 与 python -u 一致：zygote的标准输出是管道，按块缓冲，流式执行需要立即写出
+    sandbox_runner.unbuffer_stdio()
+
+    # fork出的子进程共享父进程的随机数状态，需要重新播种
+    import random
+    random.seed()
+    numpy = sys.modules.get("numpy")
+    if numpy is not None:
+        numpy.random.seed()
+
+    if limits is not None:
+        # fork出的子进程CPU时间从0开始计算，地址空间包含预加载的模块
+        limits.apply()
+
+    os.chdir(job["cwd"])
+    exit_code = sandbox_runner.run_script(job["script"])
+
+    atexit._run_exitfuncs()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return exit_code
+
+
+def _close_request(conn: Optional[socket.socket], fds: List[int]):
+    """关闭未能处理或已交给子进程的请求连接和文件描述符"""
+    for fd in fds:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+    if conn is not None:
+        conn.close()
+
+
+def serve(socket_path: str, preload: List[str], limits: Optional[ResourceLimits] = None):
+    """zygote主循环：接受执行请求并fork子进程"""
+    import sandbox_runner  # noqa: F401  预先导入，子进程无需再加载
+
+    import_times = _preload_modules(preload)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+
+    # 通知引擎已就绪，随后标准输出不再使用
+    sys.stdout.write(json.dumps({"ready": True, "import_times": import_times}) + "\n")
+    sys.stdout.flush()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+    # 通过自管道接收SIGCHLD，在主循环中回收子进程
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_r, False)
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ, "accept")
+    selector.register(wakeup_r, selectors.EVENT_READ, "sigchld")
+
+    children: Dict[int, socket.socket] = {}
+
+    while True:
+        for key, _ in selector.select():
+            if key.data == "accept":
+                conn = None
+                fds: List[int] = []
+                try:
+                    conn, _ = listener.accept()
+                    msg, fds, _, _ = socket.recv_fds(conn, 65536, 2)
+                    while not msg.endswith(b"\n"):
+                        chunk = conn.recv(65536)
+                        if not chunk:
+                            break
+                        msg += chunk
+                    job = json.loads(msg)
+                    if len(fds) != 2:
+                        raise ValueError(f"需要标准输出和标准错误两个文件描述符，收到{len(fds)}个")
+                except Exception as e:
+                    print(f"zygote接收任务失败: {e}", file=sys.stderr)
+                    _close_request(conn, fds)
+                    continue
+
+                try:
+                    pid = os.fork()
+                except OSError as e:
+                    # 进程数达到上限等，拒绝本次请求，引擎侧读到连接关闭后报错
+                    print(f"zygote fork失败: {e}", file=sys.stderr)
+                    _close_request(conn, fds)
+                    continue
+                if pid == 0:
+                    exit_code = 1
+                    try:
+                        sockets = [listener, conn] + list(children.values())
+                        exit_code = _run_child(sockets, job, fds, limits)
+                    finally:
+                        os._exit(exit_code)
+
+                _close_request(None, fds)
+                try:
+                    conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+                except OSError as e:
+                    # 引擎已断开，无人读取输出和退出状态，终止子进程（由SIGCHLD处理回收）
+                    print(f"zygote返回子进程信息失败: {e}", file=sys.stderr)
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                    conn.close()
+                    continue
+                children[pid] = conn
+
+            elif key.data == "sigchld":
+                try:
+                    while os.read(wakeup_r, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+
+                while True:
+                    try:
+                        pid, status, rusage = os.wait4(-1, os.WNOHANG)
+                    except ChildProcessError:
+                        break
+                    if pid == 0:
+                        break
+
+                    conn = children.pop(pid, None)
+                    if conn is None:
+                        continue
+                    result = {
+                        "pid": pid,
+                        "returncode": os.waitstatus_to_exitcode(status),
+                        "rusage": rusage_to_dict(rusage)
+                    }
+                    try:
+                        conn.sendall(json.dumps(result).encode() + b"\n")
+                    except OSError:
+                        pass
+                    finally:
+                        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# 引擎侧客户端
+# ---------------------------------------------------------------------------
+
+class ZygoteProcess:
+    """zygote子进程句柄，提供与subprocess.Popen一致的常用接口"""
+
+    def __init__(self, pid: int, reader: _LineReader, stdout_fd: int, stderr_fd: int, fork_time: float):
+        self.pid = pid
+        self.returncode = None
+        self.rusage = None
+        self.fork_time = fork_time
+        self._reader = reader
+        # 与Popen一致，stdout/stderr为可读取的管道文件对象
+        self.stdout = os.fdopen(stdout_fd, "rb", buffering=0)
+        self.stderr = os.fdopen(stderr_fd, "rb", buffering=0)
+        # 停止执行时可能在其他线程中调用wait
+        self._wait_lock = threading.Lock()
+
+    def _read_exit_status(self, timeout: Optional[float]):
+        """从zygote读取子进程退出状态"""
+        try:
+            line = self._reader.readline(timeout)
+        except socket.timeout:
+            raise subprocess.TimeoutExpired(str(self.pid), timeout)
+
+        if line:
+            status = json.loads(line)
+            self.returncode = status["returncode"]
+            self.rusage = status.get("rusage")
+        else:
+            # zygote异常退出，无法获知退出码
+            self.returncode = -signal.SIGKILL
+        self._reader.conn.close()
+
+    def communicate(self, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """读取全部输出并等待子进程退出"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        buffers = {"stdout": [], "stderr": []}
+        try:
+            for stream, data in iter_output(self, timeout):
+                buffers[stream].append(data)
+        finally:
+            close_pipes(self)
+
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        self.wait(timeout=remaining)
+        stdout = b"".join(buffers["stdout"]).decode("utf-8", errors="replace")
+        stderr = b"".join(buffers["stderr"]).decode("utf-8", errors="replace")
+        return stdout, stderr
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        with self._wait_lock:
+            if self.returncode is None:
+                self._read_exit_status(timeout)
+        return self.returncode
+
+    def send_signal(self, sig: int):
+        if self.returncode is not None:
+            return
+        try:
+            os.killpg(self.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class ZygoteServer:
+    """管理zygote进程的生命周期并通过它fork执行进程"""
+
+    def __init__(self, socket_path: str, preload: List[str], limits: Optional[ResourceLimits] = None):
+        self.socket_path = socket_path
+        self.preload = preload
+        self.limits = limits
+        self.import_times: Dict[str, float] = {}
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动zygote并等待预加载完成"""
+        with self._lock:
+            self._start_locked()
+
+    def _start_locked(self):
+        cmd = [
+            sys.executable, str(ZYGOTE_SCRIPT),
+            "--serve", self.socket_path,
+            "--preload", ",".join(self.preload)
+        ]
+        if self.limits is not None:
+            cmd += ["--limits", json.dumps(self.limits.to_dict())]
+        self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        handshake = self._process.stdout.readline()
+        self._process.stdout.close()
+        if not handshake:
+            raise RuntimeError("zygote启动失败")
+
+        self.import_times = json.loads(handshake)["import_times"]
+        logger.info(f"zygote已就绪，预加载模块耗时: {self.import_times}")
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                logger.warning("zygote进程不存在，重新启动")
+                self._start_locked()
+
+    def spawn(self, script_file: Path, work_dir: Path) -> ZygoteProcess:
+        """请求zygote fork子进程运行脚本"""
+        self._ensure_running()
+
+        start = time.perf_counter()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        reader = _LineReader(conn)
+        try:
+            conn.connect(self.socket_path)
+            job = {"script": str(script_file), "cwd": str(work_dir)}
+            socket.send_fds(conn, [json.dumps(job).encode() + b"\n"], [stdout_w, stderr_w])
+            reply = reader.readline()
+            if not reply:
+                raise RuntimeError("zygote未返回子进程信息")
+            pid = json.loads(reply)["pid"]
+        except Exception:
+            conn.close()
+            os.close(stdout_r)
+            os.close(stderr_r)
+            raise
+        finally:
+            os.close(stdout_w)
+            os.close(stderr_w)
+
+        return ZygoteProcess(pid, reader, stdout_r, stderr_r, time.perf_counter() - start)
+
+    def estimate_saved_time(self, imports: List[str]) -> float:
+        """估算预加载为本次执行节省的导入时间"""
+        return sum(self.import_times.get(name, 0.0) for name in imports)
+
+    def shutdown(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.terminate()
+                try:
+                    self._process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+            self._process = None
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == "--serve":
+        preload_arg = ""
+        if "--preload" in args:
+            preload_arg = args[args.index("--preload") + 1]
+        limits = None
+        if "--limits" in args:
+            limits = ResourceLimits(**json.loads(args[args.index("--limits") + 1]))
+        serve(args[1], [name for name in preload_arg.split(",") if name], limits)
+    else:
+        print("用法: zygote.py --serve <socket> [--preload mod1,mod2] [--limits JSON]", file=sys.stderr)
+        sys.exit(2)